@@ -20,6 +20,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from .models import Project, Transaction, Portfolio
 from django.core.exceptions import ValidationError
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 # ЗАМЕНИТЬ ВЕСЬ класс PercentageField в admin.py:
 
@@ -296,6 +299,7 @@ class ProjectAdmin(admin.ModelAdmin):
             path("recalculate/", self.admin_site.admin_view(self.recalculate_all), name="recalculate_all"),
             path('<int:project_id>/validate/', self.admin_site.admin_view(self.validate_project), name='validate_project'),
             path('backup/', self.admin_site.admin_view(self.create_backup), name='create_backup'),
+            path('performance/', self.admin_site.admin_view(self.request_performance), name='request_performance'),
             path('ajax/toggle-edit/<int:transaction_id>/', 
                 self.admin_site.admin_view(self.ajax_toggle_edit), 
                 name='ajax_toggle_transaction_edit'),
@@ -305,47 +309,49 @@ class ProjectAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
+    # Правила, которые показываются на кнопке "Validate Project"
+    VALIDATE_PROJECT_CHECKS = ['type_amount', 'duplicate_date', 'conflicting_nav', 'missing_nav']
+
     def validate_project(self, request, project_id):
+        from .validation import validate_transactions
+
         project = self.get_object(request, project_id)
-        transactions = project.transactions.order_by("date")
-        errors = []
-        seen_dates = set()
-        nav_found = False
-
-        for tx in transactions:
-            if not tx.date:
-                errors.append(f"❌ Transaction ID {tx.id} is missing a date.")
-            # 🔧 УЛУЧШЕННАЯ ВАЛИДАЦИЯ с учетом типа NAV
-            if tx.transaction_type == 'Investment':
-                if not tx.investment:
-                    errors.append(f"❌ Transaction ID {tx.id} is Investment type but has no investment amount.")
-            elif tx.transaction_type == 'Return':
-                if not tx.return_amount:
-                    errors.append(f"❌ Transaction ID {tx.id} is Return type but has no return amount.")
-            elif tx.transaction_type == 'NAV':
-                if not tx.nav:
-                    errors.append(f"❌ Transaction ID {tx.id} is NAV type but has no NAV value.")
-            else:
-                # Для старых транзакций применяем старую логику
-                if not tx.investment and not tx.return_amount:
-                    errors.append(f"❌ Transaction ID {tx.id} has neither investment nor return filled.")
-            if tx.date in seen_dates:
-                errors.append(f"❌ Duplicate transaction date {tx.date} in project {project.name}.")
-            seen_dates.add(tx.date)
-            if tx.nav:
-                nav_found = True
-
-        if not nav_found:
-            errors.append(f"⚠️ No NAV recorded for project {project.name}.")
-
-        if errors:
-            for error in errors:
-                messages.error(request, error)
+        report = validate_transactions(project_ids=[project.pk], checks=self.VALIDATE_PROJECT_CHECKS)
+
+        if report:
+            for issue in report.issues:
+                icon = "⚠️" if issue.severity == 'WARNING' else "❌"
+                messages.error(request, f"{icon} {issue.message}")
         else:
             messages.success(request, "✅ Validation passed with no errors.")
 
         return redirect(f"/admin/investments/project/{project_id}/change/")
 
+    def request_performance(self, request):
+        """Статистика времени ответа и SQL по view (investments.instrumentation)"""
+        from .instrumentation import registry, query_budget_for
+        from .structured_logging import recent_captures
+
+        if request.method == 'POST' and 'reset' in request.POST:
+            registry.reset()
+            messages.success(request, "✅ Performance statistics reset.")
+            return redirect(reverse("admin:request_performance"))
+
+        views = [
+            dict(summary, view=name, budget=query_budget_for(name))
+            for name, summary in registry.view_summaries()
+        ]
+        return render(request, "admin/request_performance.html", {
+            'title': 'Request Performance',
+            'views': views,
+            'slowest': registry.slowest_requests(),
+            'captures': [
+                {'id': c.id, 'label': c.label, 'dropped': c.dropped, 'lines': list(c.format_lines())}
+                for c in reversed(recent_captures)
+            ],
+            'opts': self.model._meta,
+        })
+
     def recalculate_all(self, request):
         from .models import recalculate_all_metrics
         recalculate_all_metrics()
@@ -666,9 +672,7 @@ class ProjectAdmin(admin.ModelAdmin):
                 'YTD': ytd_mirr / 100 if ytd_mirr is not None else None,
             }
         except Exception as e:
-            print(f"[Portfolio mIRR Error] {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("portfolio_summary.mirr_error", error=str(e))
             summary['PORTFOLIO_AVG_IRR'] = {'ALL': None, 'ACTIVE': None, 'YTD': None}
 
         return summary
@@ -684,16 +688,14 @@ class ProjectAdmin(admin.ModelAdmin):
                 # Получаем сырые данные БЕЗ форматирования
                 raw_summary = self.get_portfolio_summary(queryset)
 
-                print("=" * 50)
-                print("PORTFOLIO_AVG_IRR в raw_summary:", 'PORTFOLIO_AVG_IRR' in raw_summary)
-                print("Все ключи в raw_summary:", list(raw_summary.keys()))
+                logger.debug("changelist.summary", keys=list(raw_summary.keys()))
                 
                 # Передаем СЫРЫЕ данные в шаблон
                 response.context_data['portfolio_summary'] = raw_summary
                 response.context_data['table_class'] = 'table-unified'
                 
             except Exception as e:
-                print(f"❌ ERROR in changelist_view: {e}")
+                logger.exception("changelist.summary_error", error=str(e))
                 response.context_data['portfolio_summary'] = {}
         else:
             response.context_data = getattr(response, 'context_data', {})
@@ -980,6 +982,6 @@ try:
         AlertSettingsAdmin, AlertRuleAdmin, 
         AlertLogAdmin, AlertStatisticsAdmin
     )
-    print("✅ Alert admin loaded successfully")
+    logger.debug("admin.alerts_loaded")
 except ImportError as e:
-    print(f"⚠️ Alert admin not loaded: {e}")    
\ No newline at end of file
+    logger.warning("admin.alerts_not_loaded", error=str(e))    
\ No newline at end of file
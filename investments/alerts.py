@@ -6,16 +6,23 @@
 
 from datetime import datetime, timedelta, date
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
 from typing import Optional, List, Dict, Any
 import logging
 
 from .models import Project, Transaction
 from .alerts_models import (
     ProjectAlert, AlertType, AlertSettings, 
-    AlertLog, AlertRule, AlertStatistics
+    AlertLog, AlertRule, AlertStatistics, NotificationOutbox,
+    alerts_version, bump_alerts_version
 )
+from .alerts_context import ProjectEvaluationContext
+from .alerts_portfolio import PortfolioSnapshot, concentration, required_irr
+from .alerts_storm import StormGuard, fingerprint, open_group_roots
+from .instrumentation import record_cache_access
+from .nav_analytics import analyze as analyze_nav, rolling_sharpe
+from .notifications import NotificationRouter, build_email_entries, get_router
 
 logger = logging.getLogger(__name__)
 
@@ -43,81 +50,65 @@ class AlertManager:
         threshold_value: float = None,
         details: Dict = None,
         auto_notify: bool = True
-    ) -> ProjectAlert:
-        """Создать новый алерт"""
-        
-        # Получаем тип алерта
-        try:
-            alert_type = AlertType.objects.get(code=alert_type_code)
-        except AlertType.DoesNotExist:
-            # Создаем базовый тип если не существует
-            alert_type = AlertType.objects.create(
-                code=alert_type_code,
-                name=alert_type_code.replace('_', ' ').title(),
-                description=f"Auto-created alert type: {alert_type_code}",
-                default_severity=severity
-            )
-        
-        # Проверяем на дубликаты (не создаем одинаковые алерты в течение часа)
-        recent_duplicate = ProjectAlert.objects.filter(
-            project=project,
-            alert_type=alert_type,
-            title=title,
-            status__in=['NEW', 'ACKNOWLEDGED'],
-            created_at__gte=timezone.now() - timedelta(hours=1)
-        ).first()
-        
-        if recent_duplicate:
-            # Увеличиваем счетчик повторений
-            recent_duplicate.recurrence_count += 1
-            recent_duplicate.last_occurrence = timezone.now()
-            recent_duplicate.save()
-            logger.info(f"Alert duplicate found, incrementing recurrence: {title}")
-            return recent_duplicate
-        
-        # Рассчитываем отклонение если есть метрика и порог
-        deviation = None
-        if metric_value is not None and threshold_value is not None and threshold_value != 0:
-            deviation = ((metric_value - threshold_value) / abs(threshold_value)) * 100
-        
-        # Создаем алерт
-        alert = ProjectAlert.objects.create(
+    ) -> Optional[ProjectAlert]:
+        """Создать новый алерт (или учесть повторение, см. AlertWriter.add)"""
+        writer = AlertWriter(self, auto_notify=auto_notify, project_ids=[project.id])
+        alert = writer.add(
             project=project,
-            alert_type=alert_type,
-            severity=severity or alert_type.default_severity,
+            alert_type_code=alert_type_code,
             title=title,
             message=message,
+            severity=severity,
             metric_value=metric_value,
             threshold_value=threshold_value,
-            deviation=deviation,
-            details=details or {},
-            created_by='System'
+            details=details,
         )
-        
-        # Логируем создание
-        AlertLog.objects.create(
-            alert=alert,
-            action='CREATED',
-            details=f"Alert created: {title}"
-        )
-        
-        # Отправляем уведомления если нужно
-        if auto_notify:
-            self.send_notifications(alert)
-        
-        logger.info(f"Alert created: {title} for project {project.name}")
+        writer.flush()
         return alert
     
-    def check_irr_gap(self, project: Project) -> Optional[ProjectAlert]:
-        """Проверка отклонения IRR от целевого"""
-        if not project.target_irr:
+    # --- Проверки проекта ---
+    #
+    # Каждая проверка разделена на две части:
+    #   evaluate_*  - чистая оценка по ProjectEvaluationContext, возвращает
+    #                 найденные срабатывания (kwargs для create_alert);
+    #   check_*     - оценка + создание алертов (apply_findings).
+    # Ключ 'skip_if' в срабатывании - фильтр ProjectAlert для дедупликации.
+    
+    def evaluation_context(self, project: Project, ctx: ProjectEvaluationContext = None) -> ProjectEvaluationContext:
+        """Контекст оценки проекта (загружается, если не передан)"""
+        return ctx if ctx is not None else ProjectEvaluationContext.load(project)
+    
+    def apply_findings(self, project: Project, findings: List[Dict], writer: 'AlertWriter' = None) -> List[ProjectAlert]:
+        """Создать алерты по результатам evaluate_* (через writer - пакетно)"""
+        alerts = []
+        for finding in findings:
+            finding = dict(finding)
+            skip_if = finding.pop('skip_if', None)
+            if skip_if and ProjectAlert.objects.filter(project=project, **skip_if).exists():
+                continue
+            if writer is not None:
+                alert = writer.add(project=project, **finding)
+            else:
+                alert = self.create_alert(project=project, **finding)
+            # None - повторение подавлено, новой записи нет
+            if alert is not None:
+                alerts.append(alert)
+        return alerts
+    
+    def _apply_one(self, project, finding):
+        alerts = self.apply_findings(project, [finding] if finding else [])
+        return alerts[0] if alerts else None
+    
+    def evaluate_irr_gap(self, ctx: ProjectEvaluationContext) -> Optional[Dict]:
+        """Отклонение IRR от целевого"""
+        if not ctx.target_irr:
             return None
         
-        current_irr = project.get_xirr()
+        current_irr = ctx.irr
         if current_irr is None:
             return None
         
-        gap = current_irr - project.target_irr
+        gap = current_irr - ctx.target_irr
         gap_percent = gap * 100
         
         # Определяем severity на основе размера отклонения
@@ -130,42 +121,44 @@ class AlertManager:
         else:
             return None  # Не создаем алерт для малых отклонений
         
-        return self.create_alert(
-            project=project,
+        return dict(
             alert_type_code='IRR_GAP',
             title=f"IRR значительно ниже целевого",
-            message=f"Текущий IRR {current_irr*100:.2f}% отстает от целевого {project.target_irr*100:.2f}% на {abs(gap_percent):.2f}%",
+            message=f"Текущий IRR {current_irr*100:.2f}% отстает от целевого {ctx.target_irr*100:.2f}% на {abs(gap_percent):.2f}%",
             severity=severity,
             metric_value=current_irr,
-            threshold_value=project.target_irr,
+            threshold_value=ctx.target_irr,
             details={
                 'current_irr': current_irr,
-                'target_irr': project.target_irr,
+                'target_irr': ctx.target_irr,
                 'gap': gap,
                 'gap_percent': gap_percent
             }
         )
     
-    def check_nav_drop(self, project: Project, lookback_days: int = 7) -> Optional[ProjectAlert]:
-        """Проверка резкого падения NAV"""
-        if project.status != 'active':
+    def check_irr_gap(self, project: Project, ctx: ProjectEvaluationContext = None) -> Optional[ProjectAlert]:
+        """Проверка отклонения IRR от целевого"""
+        return self._apply_one(project, self.evaluate_irr_gap(self.evaluation_context(project, ctx)))
+    
+    def evaluate_nav_drop(self, ctx: ProjectEvaluationContext, lookback_days: int = 7) -> Optional[Dict]:
+        """Резкое падение NAV за lookback_days"""
+        if ctx.status != 'active':
             return None
         
-        current_nav = project.get_nav()
+        current_nav = ctx.nav
         if not current_nav:
             return None
         
-        # Получаем историческое значение NAV
-        past_date = date.today() - timedelta(days=lookback_days)
-        past_transaction = project.transactions.filter(
-            date__lte=past_date,
-            nav__isnull=False
-        ).order_by('-date').first()
-        
-        if not past_transaction or not past_transaction.nav_usd:
+        analytics = ctx.nav_analytics
+        if analytics is None:
             return None
+        if lookback_days not in analytics.changes:
+            analytics = analyze_nav(ctx.nav_series, ctx.today, windows=(lookback_days,))
         
-        past_nav = past_transaction.nav_usd
+        # Историческое значение NAV
+        past_nav = analytics.past_values[lookback_days]
+        if not past_nav:
+            return None
         change_percent = ((current_nav - past_nav) / past_nav) * 100
         
         # Проверяем на значительное падение
@@ -178,8 +171,7 @@ class AlertManager:
         else:
             return None
         
-        return self.create_alert(
-            project=project,
+        return dict(
             alert_type_code='NAV_DROP',
             title=f"NAV упал на {abs(change_percent):.1f}% за {lookback_days} дней",
             message=f"NAV снизился с ${past_nav:,.2f} до ${current_nav:,.2f}",
@@ -190,17 +182,23 @@ class AlertManager:
                 'current_nav': current_nav,
                 'past_nav': past_nav,
                 'change_percent': change_percent,
-                'period_days': lookback_days
+                'period_days': lookback_days,
+                'changes': {str(days): change for days, change in ctx.nav_analytics.changes.items()},
             }
         )
     
-    def check_npv_negative(self, project: Project) -> Optional[ProjectAlert]:
-        """Проверка отрицательного NPV"""
-        npv = project.get_xnpv()
+    def check_nav_drop(self, project: Project, lookback_days: int = 7,
+                       ctx: ProjectEvaluationContext = None) -> Optional[ProjectAlert]:
+        """Проверка резкого падения NAV"""
+        return self._apply_one(project, self.evaluate_nav_drop(self.evaluation_context(project, ctx), lookback_days))
+    
+    def evaluate_npv_negative(self, ctx: ProjectEvaluationContext) -> Optional[Dict]:
+        """Отрицательный NPV"""
+        npv = ctx.npv
         if npv is None or npv >= 0:
             return None
         
-        invested = project.get_total_invested()
+        invested = ctx.total_invested
         npv_percent = (abs(npv) / invested * 100) if invested else 0
         
         # Определяем severity
@@ -211,8 +209,7 @@ class AlertManager:
         else:
             severity = 'MEDIUM'
         
-        return self.create_alert(
-            project=project,
+        return dict(
             alert_type_code='NPV_NEGATIVE',
             title="Отрицательный NPV проекта",
             message=f"NPV составляет ${npv:,.2f} ({npv_percent:.1f}% от инвестиций)",
@@ -223,111 +220,97 @@ class AlertManager:
                 'npv': npv,
                 'invested': invested,
                 'npv_percent': npv_percent,
-                'target_irr': project.target_irr
+                'target_irr': ctx.target_irr
             }
         )
     
-    def check_data_quality(self, project: Project) -> List[ProjectAlert]:
-        """Проверка качества данных"""
-        alerts = []
+    def check_npv_negative(self, project: Project, ctx: ProjectEvaluationContext = None) -> Optional[ProjectAlert]:
+        """Проверка отрицательного NPV"""
+        return self._apply_one(project, self.evaluate_npv_negative(self.evaluation_context(project, ctx)))
+    
+    def evaluate_data_quality(self, ctx: ProjectEvaluationContext) -> List[Dict]:
+        """Качество данных: DPI/TVPI, давность NAV, аномальный IRR"""
+        findings = []
         
         # Проверка 1: DPI > TVPI (невозможная ситуация)
-        dpi = project.get_dpi()
-        tvpi = project.get_tvpi()
+        dpi = ctx.dpi
+        tvpi = ctx.tvpi
         
         if dpi and tvpi and dpi > tvpi:
-            alert = self.create_alert(
-                project=project,
+            findings.append(dict(
                 alert_type_code='DATA_QUALITY',
                 title="Ошибка данных: DPI > TVPI",
                 message=f"DPI ({dpi:.2f}) больше TVPI ({tvpi:.2f}), что невозможно",
                 severity='HIGH',
                 details={'dpi': dpi, 'tvpi': tvpi}
-            )
-            alerts.append(alert)
+            ))
         
         # Проверка 2: Нет обновлений NAV для активного проекта
-        if project.status == 'active':
-            last_nav_update = project.transactions.filter(
-                nav__isnull=False
-            ).order_by('-date').first()
+        if ctx.status == 'active':
+            last_nav_update = ctx.last_nav_transaction
             
             if last_nav_update:
-                days_since_update = (date.today() - last_nav_update.date).days
+                days_since_update = (ctx.today - last_nav_update.date).days
                 if days_since_update > 30:
-                    alert = self.create_alert(
-                        project=project,
+                    findings.append(dict(
                         alert_type_code='DATA_QUALITY',
                         title=f"NAV не обновлялся {days_since_update} дней",
                         message="Требуется обновление текущей стоимости активов",
                         severity='MEDIUM' if days_since_update < 60 else 'HIGH',
                         details={'days_since_update': days_since_update}
-                    )
-                    alerts.append(alert)
+                    ))
             else:
                 # Нет NAV вообще для активного проекта
-                alert = self.create_alert(
-                    project=project,
+                findings.append(dict(
                     alert_type_code='DATA_QUALITY',
                     title="Отсутствует NAV для активного проекта",
                     message="Необходимо добавить текущую оценку стоимости",
                     severity='HIGH'
-                )
-                alerts.append(alert)
+                ))
         
         # Проверка 3: Аномальные значения IRR
-        irr = project.get_xirr()
+        irr = ctx.irr
         if irr is not None:
             if irr > 1:  # IRR > 100%
-                alert = self.create_alert(
-                    project=project,
+                findings.append(dict(
                     alert_type_code='DATA_QUALITY',
                     title=f"Подозрительно высокий IRR: {irr*100:.1f}%",
                     message="Проверьте корректность данных о транзакциях",
                     severity='MEDIUM',
                     metric_value=irr
-                )
-                alerts.append(alert)
+                ))
             elif irr < -0.5:  # IRR < -50%
-                alert = self.create_alert(
-                    project=project,
+                findings.append(dict(
                     alert_type_code='DATA_QUALITY',
                     title=f"Критически низкий IRR: {irr*100:.1f}%",
                     message="Возможна ошибка в данных или критическая потеря",
                     severity='HIGH',
                     metric_value=irr
-                )
-                alerts.append(alert)
+                ))
         
-        return alerts
-# ПРОДОЛЖЕНИЕ ФАЙЛА alerts.py - добавьте после check_data_quality
+        return findings
     
-    def check_drawdown(self, project: Project) -> Optional[ProjectAlert]:
-        """Проверка просадки от пика"""
-        if project.status != 'active':
+    def check_data_quality(self, project: Project, ctx: ProjectEvaluationContext = None) -> List[ProjectAlert]:
+        """Проверка качества данных"""
+        return self.apply_findings(project, self.evaluate_data_quality(self.evaluation_context(project, ctx)))
+    
+    def evaluate_drawdown(self, ctx: ProjectEvaluationContext) -> Optional[Dict]:
+        """Просадка от пика по ряду NAV/equity"""
+        if ctx.status != 'active':
             return None
         
-        # Получаем все значения equity/NAV
-        transactions = project.transactions.order_by('date')
-        values = []
-        
-        for tx in transactions:
-            if tx.nav_usd:
-                values.append((tx.date, tx.nav_usd))
-            elif tx.equity_usd:
-                values.append((tx.date, tx.equity_usd))
-        
-        if len(values) < 2:
+        if len(ctx.value_series) < 2:
             return None
+        analytics = ctx.value_analytics
         
-        # Находим максимум и текущее значение
-        max_value = max(v[1] for v in values)
-        current_value = values[-1][1]
+        # Пик и текущее значение
+        max_value = analytics.peak
+        current_value = analytics.current
         
         if max_value == 0:
             return None
         
-        drawdown_percent = ((max_value - current_value) / max_value) * 100
+        drawdown_percent = analytics.current_drawdown
         
         # Определяем severity
         if drawdown_percent > 20:
@@ -339,44 +322,35 @@ class AlertManager:
         else:
             return None
         
-        return self.create_alert(
-            project=project,
+        return dict(
             alert_type_code='DRAWDOWN',
             title=f"Просадка {drawdown_percent:.1f}% от максимума",
-            message=f"Стоимость упала с ${max_value:,.2f} до ${current_value:,.2f}",
+            message=f"Стоимость упала с ${max_value:,.2f} до ${current_value:,.2f} ({analytics.drawdown_days} дн. ниже пика)",
             severity=severity,
             metric_value=current_value,
             threshold_value=max_value,
             details={
                 'max_value': max_value,
                 'current_value': current_value,
-                'drawdown_percent': drawdown_percent
+                'drawdown_percent': drawdown_percent,
+                'drawdown_days': analytics.drawdown_days,
+                'max_drawdown': analytics.max_drawdown,
+                'max_drawdown_days': analytics.max_drawdown_days,
+                'recovery_days': analytics.recovery_days,
             }
         )
     
-    def check_distribution_received(self, project: Project) -> Optional[ProjectAlert]:
-        """Проверка новых распределений"""
-        # Проверяем последние транзакции возврата
-        recent_return = project.transactions.filter(
-            transaction_type='Return',
-            date__gte=date.today() - timedelta(days=7)
-        ).order_by('-date').first()
-        
+    def check_drawdown(self, project: Project, ctx: ProjectEvaluationContext = None) -> Optional[ProjectAlert]:
+        """Проверка просадки от пика"""
+        return self._apply_one(project, self.evaluate_drawdown(self.evaluation_context(project, ctx)))
+    
+    def evaluate_distribution_received(self, ctx: ProjectEvaluationContext) -> Optional[Dict]:
+        """Новое распределение за последние 7 дней"""
+        recent_return = ctx.last_transaction_of_type('Return', since=ctx.today - timedelta(days=7))
         if not recent_return:
             return None
         
-        # Проверяем, не создавали ли мы уже алерт для этой транзакции
-        existing_alert = ProjectAlert.objects.filter(
-            project=project,
-            alert_type__code='DISTRIBUTION',
-            created_at__date=recent_return.date
-        ).exists()
-        
-        if existing_alert:
-            return None
-        
-        return self.create_alert(
-            project=project,
+        return dict(
             alert_type_code='DISTRIBUTION',
             title=f"Получено распределение ${recent_return.return_usd:,.2f}",
             message=f"Новое распределение от {recent_return.date}",
@@ -386,267 +360,714 @@ class AlertManager:
                 'amount': recent_return.return_usd,
                 'date': str(recent_return.date),
                 'transaction_id': recent_return.id
-            }
+            },
+            # Не создаем повторный алерт для этой транзакции
+            skip_if={
+                'alert_type__code': 'DISTRIBUTION',
+                'created_at__date': recent_return.date,
+            },
         )
     
-    def check_performance_milestone(self, project: Project) -> Optional[ProjectAlert]:
-        """Проверка достижения важных метрик"""
-        alerts = []
+    def check_distribution_received(self, project: Project, ctx: ProjectEvaluationContext = None) -> Optional[ProjectAlert]:
+        """Проверка новых распределений"""
+        return self._apply_one(project, self.evaluate_distribution_received(self.evaluation_context(project, ctx)))
+    
+    def evaluate_performance_milestone(self, ctx: ProjectEvaluationContext) -> List[Dict]:
+        """Достижение целевого IRR и MOIC > 2x"""
+        findings = []
+        month_ago = timezone.now() - timedelta(days=30)
         
         # Проверка достижения целевого IRR
-        if project.target_irr:
-            current_irr = project.get_xirr()
-            if current_irr and current_irr >= project.target_irr:
-                # Проверяем, не создавали ли уже такой алерт недавно
-                recent_alert = ProjectAlert.objects.filter(
-                    project=project,
-                    alert_type__code='PERFORMANCE',
-                    title__contains="достиг целевого IRR",
-                    created_at__gte=timezone.now() - timedelta(days=30)
-                ).exists()
-                
-                if not recent_alert:
-                    alert = self.create_alert(
-                        project=project,
-                        alert_type_code='PERFORMANCE',
-                        title=f"Проект достиг целевого IRR!",
-                        message=f"IRR {current_irr*100:.2f}% превысил целевой {project.target_irr*100:.2f}%",
-                        severity='INFO',
-                        metric_value=current_irr,
-                        threshold_value=project.target_irr,
-                        details={
-                            'current_irr': current_irr,
-                            'target_irr': project.target_irr,
-                            'achievement': 'target_reached'
-                        }
-                    )
-                    alerts.append(alert)
-        
-        # Проверка MOIC > 2x
-        moic = project.get_moic()
-        if moic and moic >= 2.0:
-            recent_alert = ProjectAlert.objects.filter(
-                project=project,
-                alert_type__code='PERFORMANCE',
-                title__contains="MOIC превысил 2x",
-                created_at__gte=timezone.now() - timedelta(days=30)
-            ).exists()
-            
-            if not recent_alert:
-                alert = self.create_alert(
-                    project=project,
+        if ctx.target_irr:
+            current_irr = ctx.irr
+            if current_irr and current_irr >= ctx.target_irr:
+                findings.append(dict(
                     alert_type_code='PERFORMANCE',
-                    title=f"MOIC превысил 2x!",
-                    message=f"Множитель на инвестированный капитал достиг {moic:.2f}x",
+                    title=f"Проект достиг целевого IRR!",
+                    message=f"IRR {current_irr*100:.2f}% превысил целевой {ctx.target_irr*100:.2f}%",
                     severity='INFO',
-                    metric_value=moic,
-                    threshold_value=2.0,
-                    details={'moic': moic, 'achievement': 'moic_2x'}
-                )
-                alerts.append(alert)
+                    metric_value=current_irr,
+                    threshold_value=ctx.target_irr,
+                    details={
+                        'current_irr': current_irr,
+                        'target_irr': ctx.target_irr,
+                        'achievement': 'target_reached'
+                    },
+                    skip_if={
+                        'alert_type__code': 'PERFORMANCE',
+                        'title__contains': "достиг целевого IRR",
+                        'created_at__gte': month_ago,
+                    },
+                ))
         
+        # Проверка MOIC > 2x
+        moic = ctx.moic
+        if moic and moic >= 2.0:
+            findings.append(dict(
+                alert_type_code='PERFORMANCE',
+                title=f"MOIC превысил 2x!",
+                message=f"Множитель на инвестированный капитал достиг {moic:.2f}x",
+                severity='INFO',
+                metric_value=moic,
+                threshold_value=2.0,
+                details={'moic': moic, 'achievement': 'moic_2x'},
+                skip_if={
+                    'alert_type__code': 'PERFORMANCE',
+                    'title__contains': "MOIC превысил 2x",
+                    'created_at__gte': month_ago,
+                },
+            ))
+        
+        return findings
+    
+    def check_performance_milestone(self, project: Project, ctx: ProjectEvaluationContext = None) -> Optional[ProjectAlert]:
+        """Проверка достижения важных метрик"""
+        alerts = self.apply_findings(project, self.evaluate_performance_milestone(self.evaluation_context(project, ctx)))
         return alerts[0] if alerts else None
     
+    # Код проверки (тип алерта) -> evaluate-метод, в порядке выполнения
+    PROJECT_CHECKS = {
+        'IRR_GAP': 'evaluate_irr_gap',
+        'NAV_DROP': 'evaluate_nav_drop',
+        'NPV_NEGATIVE': 'evaluate_npv_negative',
+        'DATA_QUALITY': 'evaluate_data_quality',
+        'DRAWDOWN': 'evaluate_drawdown',
+        'DISTRIBUTION': 'evaluate_distribution_received',
+        'PERFORMANCE': 'evaluate_performance_milestone',
+    }
+    
+    def evaluate_project(self, ctx: ProjectEvaluationContext, check_types: List[str] = None):
+        """
+        Выполнить проверки проекта без обращения к БД.
+        
+        Возвращает (срабатывания, {код проверки: текст ошибки}).
+        """
+        findings = []
+        errors = {}
+        for check_type in check_types or self.PROJECT_CHECKS:
+            method = self.PROJECT_CHECKS.get(check_type)
+            if method is None:
+                continue
+            try:
+                result = getattr(self, method)(ctx)
+            except Exception as e:
+                errors[check_type] = str(e)
+                continue
+            if result is None:
+                continue
+            findings.extend(result if isinstance(result, list) else [result])
+        return findings, errors
+    
+    # --- Портфельные проверки: по всему набору проектов сразу ---
+
+    def evaluate_no_update(self, portfolio: PortfolioSnapshot) -> Dict[int, List[Dict]]:
+        """Проекты без транзакций дольше NO_UPDATE_DAYS"""
+        thresholds = sorted(portfolio.config['NO_UPDATE_DAYS'].items(), key=lambda item: item[1], reverse=True)
+        findings = {}
+        for project_id, row in portfolio.rows.items():
+            if row['status'] != 'active':
+                continue
+            last_update = row['last_transaction'] or row['start_date']
+            if last_update is None:
+                continue
+            days = (portfolio.today - last_update).days
+            severity = next((severity for severity, limit in thresholds if days > limit), None)
+            if severity is None:
+                continue
+            findings[project_id] = [dict(
+                alert_type_code='NO_UPDATE',
+                title=f"Нет обновлений {days} дней",
+                message=(
+                    f"Последняя транзакция {last_update:%d.%m.%Y}" if row['last_transaction']
+                    else f"Транзакций нет с начала проекта {last_update:%d.%m.%Y}"
+                ),
+                severity=severity,
+                metric_value=days,
+                threshold_value=portfolio.config['NO_UPDATE_DAYS'][severity],
+                details={'days_since_update': days, 'last_update': last_update.isoformat()},
+                skip_if={
+                    'alert_type__code': 'NO_UPDATE',
+                    'status__in': ProjectAlert.OPEN_STATUSES,
+                },
+            )]
+        return findings
+
+    def evaluate_portfolio_risk(self, portfolio: PortfolioSnapshot) -> Dict[int, List[Dict]]:
+        """Концентрация NAV портфеля: HHI и доля крупнейшей позиции"""
+        config = portfolio.config
+        rows = [row for row in portfolio.rows.values() if row['status'] == 'active']
+        hhi, shares = concentration([row['nav_usd'] for row in rows])
+        positions = int((shares > 0).sum())
+        if hhi is None or positions < config['MIN_POSITIONS']:
+            return {}
+
+        largest = int(shares.argmax())
+        largest_share = float(shares[largest])
+        breaches = []
+        if hhi > config['MAX_HHI']:
+            breaches.append(f"HHI {hhi:.3f} > {config['MAX_HHI']:.3f}")
+        if largest_share > config['MAX_POSITION_SHARE']:
+            breaches.append(f"доля {largest_share*100:.1f}% > {config['MAX_POSITION_SHARE']*100:.0f}%")
+        if not breaches:
+            return {}
+
+        row = rows[largest]
+        # Алерт вешается на крупнейшую позицию
+        return {row['id']: [dict(
+            alert_type_code='PORTFOLIO_RISK',
+            title=f"Высокая концентрация портфеля: {row['name']} {largest_share*100:.1f}% NAV",
+            message=f"Концентрация NAV по {positions} позициям: {', '.join(breaches)}",
+            severity='HIGH' if len(breaches) == 2 else 'MEDIUM',
+            metric_value=hhi,
+            threshold_value=config['MAX_HHI'],
+            details={
+                'hhi': hhi,
+                'largest_share': largest_share,
+                'positions': positions,
+                'total_nav': float(sum(max(r['nav_usd'], 0) for r in rows)),
+                'top_shares': {
+                    rows[index]['name']: float(shares[index])
+                    for index in shares.argsort()[::-1][:5] if shares[index] > 0
+                },
+            },
+            skip_if={
+                'alert_type__code': 'PORTFOLIO_RISK',
+                'status__in': ProjectAlert.OPEN_STATUSES,
+            },
+        )]}
+
+    def evaluate_sharpe_decline(self, portfolio: PortfolioSnapshot) -> Dict[int, List[Dict]]:
+        """Падение скользящего Sharpe по отметкам NAV против предыдущего окна"""
+        window = portfolio.config['SHARPE_WINDOW']
+        min_drop = portfolio.config['SHARPE_MIN_DROP']
+        month_ago = timezone.now() - timedelta(days=30)
+        findings = {}
+        for project_id, ctx in portfolio.contexts.items():
+            if ctx.status != 'active':
+                continue
+            flows = [(tx.date, tx.investment_usd - tx.return_usd) for tx in ctx.transactions
+                     if tx.investment_usd or tx.return_usd]
+            rolling = rolling_sharpe(ctx.nav_series, flows, window)
+            if rolling is None or len(rolling.sharpe) < 2:
+                continue
+
+            current = rolling.sharpe[-1]
+            previous = rolling.sharpe[max(len(rolling.sharpe) - 1 - window, 0)]
+            if current is None or previous is None or previous - current < min_drop:
+                continue
+
+            findings[project_id] = [dict(
+                alert_type_code='SHARPE_DECLINE',
+                title=f"Sharpe снизился с {previous:.2f} до {current:.2f}",
+                message=(
+                    f"Скользящий Sharpe по {window} периодам между отметками NAV упал на {previous - current:.2f}; "
+                    f"волатильность {rolling.volatility[-1]*100:.1f}% годовых"
+                ),
+                severity='HIGH' if current < 0 <= previous else 'MEDIUM',
+                metric_value=current,
+                threshold_value=previous,
+                details={
+                    'current_sharpe': current,
+                    'previous_sharpe': previous,
+                    'volatility': rolling.volatility[-1],
+                    'window': window,
+                    'periods_per_year': rolling.periods_per_year,
+                    'as_of': rolling.dates[-1].isoformat(),
+                },
+                skip_if={
+                    'alert_type__code': 'SHARPE_DECLINE',
+                    'created_at__gte': month_ago,
+                },
+            )]
+        return findings
+
+    def evaluate_target_miss(self, portfolio: PortfolioSnapshot) -> Dict[int, List[Dict]]:
+        """Прогноз недостижения целевого IRR к концу горизонта"""
+        config = portfolio.config
+        rows = [
+            row for row in portfolio.rows.values()
+            if row['status'] == 'active' and row['target_irr'] and row['irr'] is not None
+            and (row['start_date'] or row['first_transaction'])
+        ]
+        if not rows:
+            return {}
+
+        starts = [row['start_date'] or row['first_transaction'] for row in rows]
+        elapsed = [(portfolio.today - start).days / 365.25 for start in starts]
+        horizon = [
+            (row['end_date'] - start).days / 365.25 if row['end_date'] else config['TARGET_HORIZON_YEARS']
+            for row, start in zip(rows, starts)
+        ]
+        required = required_irr([row['irr'] for row in rows], [row['target_irr'] for row in rows], elapsed, horizon)
+
+        margins = sorted(config['TARGET_MISS_MARGIN'].items(), key=lambda item: item[1], reverse=True)
+        month_ago = timezone.now() - timedelta(days=30)
+        findings = {}
+        for row, start, years, total, needed in zip(rows, starts, elapsed, horizon, required.tolist()):
+            irr, target = row['irr'], row['target_irr']
+            if irr >= target:
+                continue
+            expired = needed != needed  # NaN - горизонт пройден
+            if expired:
+                severity = 'HIGH'
+                message = (
+                    f"Горизонт {total:.1f} лет пройден, IRR {irr*100:.2f}% ниже целевого {target*100:.2f}%"
+                )
+            else:
+                severity = next((severity for severity, margin in margins if needed - target > margin), None)
+                if severity is None:
+                    continue
+                # Больше 100% годовых - цель фактически недостижима
+                needed_text = f"{needed*100:.2f}%" if needed <= 1 else "более 100% годовых"
+                message = (
+                    f"При текущем IRR {irr*100:.2f}% для выхода на {target*100:.2f}% за {total:.1f} лет "
+                    f"нужен IRR {needed_text} на оставшиеся {total - years:.1f} лет"
+                )
+            findings[row['id']] = [dict(
+                alert_type_code='TARGET_MISS',
+                title="Целевой IRR не будет достигнут к концу горизонта",
+                message=message,
+                severity=severity,
+                metric_value=None if expired else needed,
+                threshold_value=target,
+                details={
+                    'current_irr': irr,
+                    'target_irr': target,
+                    'required_irr': None if expired else needed,
+                    'elapsed_years': years,
+                    'horizon_years': total,
+                    'horizon_end': row['end_date'].isoformat() if row['end_date'] else None,
+                },
+                skip_if={
+                    'alert_type__code': 'TARGET_MISS',
+                    'created_at__gte': month_ago,
+                },
+            )]
+        return findings
+
+    # Код проверки -> evaluate-метод по PortfolioSnapshot
+    PORTFOLIO_CHECKS = {
+        'NO_UPDATE': 'evaluate_no_update',
+        'PORTFOLIO_RISK': 'evaluate_portfolio_risk',
+        'SHARPE_DECLINE': 'evaluate_sharpe_decline',
+        'TARGET_MISS': 'evaluate_target_miss',
+    }
+
+    def evaluate_portfolio(self, projects, check_types: List[str] = None, contexts=None):
+        """
+        Портфельные проверки набора проектов одним проходом.
+
+        Возвращает ({project_id: срабатывания}, {код проверки: текст ошибки}).
+        """
+        portfolio = PortfolioSnapshot(projects, contexts)
+        findings = {}
+        errors = {}
+        for check_type in check_types or self.PORTFOLIO_CHECKS:
+            method = self.PORTFOLIO_CHECKS.get(check_type)
+            if method is None:
+                continue
+            try:
+                result = getattr(self, method)(portfolio)
+            except Exception as e:
+                errors[check_type] = str(e)
+                continue
+            for project_id, project_findings in result.items():
+                findings.setdefault(project_id, []).extend(project_findings)
+        return findings, errors
+
+    def check_portfolio(self, projects=None, check_types: List[str] = None, contexts=None) -> List[ProjectAlert]:
+        """Портфельные проверки активных проектов с созданием алертов"""
+        projects = list(projects if projects is not None else Project.objects.filter(status='active'))
+        findings, errors = self.evaluate_portfolio(projects, check_types, contexts)
+        for check_type, error in errors.items():
+            logger.warning(f"Error in {check_type} portfolio check: {error}")
+
+        writer = AlertWriter(self, project_ids=list(findings))
+        alerts = []
+        for project in projects:
+            if project.id in findings:
+                alerts.extend(self.apply_findings(project, findings[project.id], writer=writer))
+        writer.flush()
+        return alerts
+
     def check_all_projects(self) -> List[ProjectAlert]:
         """Проверить все проекты и создать алерты"""
         alerts = []
-        projects = Project.objects.filter(status='active')
+        projects = list(Project.objects.filter(status='active'))
+        contexts = ProjectEvaluationContext.load_many(projects)
         
         for project in projects:
+            ctx = contexts[project.id]
+            
             # IRR Gap проверка
-            alert = self.check_irr_gap(project)
+            alert = self.check_irr_gap(project, ctx=ctx)
             if alert:
                 alerts.append(alert)
             
             # NAV Drop проверка
-            alert = self.check_nav_drop(project)
+            alert = self.check_nav_drop(project, ctx=ctx)
             if alert:
                 alerts.append(alert)
             
             # NPV проверка
-            alert = self.check_npv_negative(project)
+            alert = self.check_npv_negative(project, ctx=ctx)
             if alert:
                 alerts.append(alert)
             
             # Data Quality проверки
-            quality_alerts = self.check_data_quality(project)
+            quality_alerts = self.check_data_quality(project, ctx=ctx)
             alerts.extend(quality_alerts)
             
             # Drawdown проверка
-            alert = self.check_drawdown(project)
+            alert = self.check_drawdown(project, ctx=ctx)
             if alert:
                 alerts.append(alert)
             
             # Distribution проверка
-            alert = self.check_distribution_received(project)
+            alert = self.check_distribution_received(project, ctx=ctx)
             if alert:
                 alerts.append(alert)
             
             # Performance milestones
-            alert = self.check_performance_milestone(project)
+            alert = self.check_performance_milestone(project, ctx=ctx)
             if alert:
                 alerts.append(alert)
         
+        # Портфельные проверки - по всем проектам сразу
+        alerts.extend(self.check_portfolio(projects, contexts=contexts))
+        
         logger.info(f"Alert check completed: {len(alerts)} new alerts created")
         return alerts
     
     def send_notifications(self, alert: ProjectAlert):
-        """Отправить уведомления об алерте"""
-        # Получаем пользователей для уведомления
-        from django.contrib.auth.models import User
+        """Поставить уведомления об алерте в очередь (отправляет deliver_notifications)"""
+        self.queue_notifications([alert])
+    
+    def queue_notifications(self, alerts: List[ProjectAlert], router: NotificationRouter = None) -> List[NotificationOutbox]:
+        """Поставить уведомления о наборе алертов в NotificationOutbox одним INSERT"""
+        if not alerts:
+            return []
         
-        # Администраторы всегда получают критические алерты
-        if alert.severity == 'CRITICAL':
-            admins = User.objects.filter(is_staff=True, is_active=True)
-            for admin in admins:
-                self.send_email_notification(admin, alert)
+        router = router or get_router()
+        now = timezone.now()
+        
+        entries = []
+        for alert in alerts:
+            entries.extend(build_email_entries(alert, router.recipients(alert), router.settings_by_user, now))
         
-        # Проверяем настройки пользователей
-        for settings in AlertSettings.objects.filter(email_enabled=True):
-            if settings.should_send_notification(alert):
-                self.send_email_notification(settings.user, alert)
+        return NotificationOutbox.objects.bulk_create(entries)
     
     def send_email_notification(self, user, alert: ProjectAlert):
-        """Отправить email уведомление"""
-        try:
-            subject = f"[{alert.get_severity_display()}] {alert.title}"
-            
-            message = f"""
-            {alert.get_severity_icon()} HEDGE FUND TRACKER ALERT
-            
-            Project: {alert.project.name}
-            Type: {alert.alert_type.name}
-            Severity: {alert.get_severity_display()}
-            
-            {alert.message}
-            
-            {f"Metric Value: {alert.metric_value}" if alert.metric_value else ""}
-            {f"Threshold: {alert.threshold_value}" if alert.threshold_value else ""}
-            {f"Deviation: {alert.deviation:.1f}%" if alert.deviation else ""}
-            
-            View details: {settings.SITE_URL}/admin/investments/projectalert/{alert.id}/
-            
-            ---
-            This is an automated message from Hedge Fund Tracker
-            """
-            
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
-            
-            # Обновляем статус отправки
-            alert.email_sent = True
-            alert.email_sent_at = timezone.now()
-            alert.save()
-            
-            # Логируем
-            AlertLog.objects.create(
-                alert=alert,
-                action='EMAIL_SENT',
-                user=user,
-                details=f"Email sent to {user.email}"
-            )
-            
-        except Exception as e:
-            logger.error(f"Failed to send email for alert {alert.id}: {str(e)}")
+        """Поставить email уведомление пользователю в очередь"""
+        settings_by_user = {
+            row.user_id: row for row in AlertSettings.objects.filter(user=user, email_enabled=True)
+        }
+        return NotificationOutbox.objects.bulk_create(build_email_entries(alert, [user], settings_by_user))
     
-    def get_dashboard_stats(self) -> Dict[str, Any]:
-        """Получить статистику для дашборда"""
+    OPEN_STATUSES = ProjectAlert.OPEN_STATUSES
+    
+    # Окна "сегодня" и "24 часа" сдвигаются и без записей - кэш не дольше минуты
+    DASHBOARD_CACHE_TTL = 60
+    
+    def _cached_stats(self, name, build):
+        """Статистика из кэша, ключ включает версию таблицы алертов и дату"""
+        from django.core.cache import cache
+        
+        key = f"alerts_stats:{name}:{alerts_version()}:{timezone.now().date().isoformat()}"
+        stats = cache.get(key)
+        record_cache_access(hit=stats is not None)
+        if stats is None:
+            stats = build()
+            cache.set(key, stats, self.DASHBOARD_CACHE_TTL)
+        return stats
+    
+    def get_alert_counts(self) -> Dict[str, Any]:
+        """Счетчики алертов одним запросом с условной агрегацией"""
+        return self._cached_stats('counts', self._build_alert_counts)
+    
+    def _build_alert_counts(self) -> Dict[str, Any]:
+        from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
+        
         now = timezone.now()
         today = now.date()
         week_ago = today - timedelta(days=7)
         
-        # Общая статистика
-        total_open = ProjectAlert.objects.filter(
-            status__in=['NEW', 'ACKNOWLEDGED', 'IN_PROGRESS']
-        ).count()
-        
-        # По severity
-        severity_stats = {}
+        is_open = Q(status__in=self.OPEN_STATUSES)
+        this_week = Q(created_at__date__gte=week_ago)
+        resolved_week = this_week & Q(status='RESOLVED')
+        
+        aggregates = {
+            'total_open': Count('id', filter=is_open),
+            'alerts_today': Count('id', filter=Q(created_at__date=today)),
+            'alerts_week': Count('id', filter=this_week),
+            'resolved_week': Count('id', filter=resolved_week),
+            'avg_resolution': Avg(
+                ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField()),
+                filter=resolved_week & Q(resolved_at__isnull=False),
+            ),
+        }
         for severity, _ in ProjectAlert.SEVERITY_CHOICES:
-            count = ProjectAlert.objects.filter(
-                status__in=['NEW', 'ACKNOWLEDGED', 'IN_PROGRESS'],
-                severity=severity
-            ).count()
-            severity_stats[severity.lower()] = count
+            aggregates[f'open_{severity.lower()}'] = Count('id', filter=is_open & Q(severity=severity))
         
-        # Недавние алерты
-        recent_alerts = ProjectAlert.objects.filter(
-            created_at__gte=now - timedelta(hours=24)
-        ).select_related('project', 'alert_type')
+        # Шторм считается одним алертом: дочерние (GROUPED) не учитываются
+        row = ProjectAlert.objects.filter(parent_alert__isnull=True).aggregate(**aggregates)
         
-        # Тренды
-        week_alerts = ProjectAlert.objects.filter(
-            created_at__date__gte=week_ago
-        )
+        severity_stats = {
+            severity.lower(): row[f'open_{severity.lower()}']
+            for severity, _ in ProjectAlert.SEVERITY_CHOICES
+        }
+        avg_resolution = row['avg_resolution']
+        return {
+            'total_open': row['total_open'],
+            'severity_stats': severity_stats,
+            'alerts_today': row['alerts_today'],
+            'alerts_week': row['alerts_week'],
+            'resolved_week': row['resolved_week'],
+            'avg_resolution_hours': avg_resolution.total_seconds() / 3600 if avg_resolution else None,
+            'critical_open': severity_stats.get('critical', 0),
+            'high_open': severity_stats.get('high', 0),
+        }
+    
+    def get_dashboard_stats(self) -> Dict[str, Any]:
+        """Получить статистику для дашборда"""
+        return self._cached_stats('dashboard', self._build_dashboard_stats)
+    
+    def _build_dashboard_stats(self) -> Dict[str, Any]:
+        from django.db.models import Count
+        
+        now = timezone.now()
+        today = now.date()
         
-        resolved_week = week_alerts.filter(status='RESOLVED')
+        stats = dict(self.get_alert_counts())
         
-        # Среднее время решения
-        avg_resolution = None
-        if resolved_week.exists():
-            times = [a.resolution_time_hours for a in resolved_week if a.resolution_time_hours]
-            if times:
-                avg_resolution = sum(times) / len(times)
+        # Недавние алерты
+        stats['recent_alerts'] = list(ProjectAlert.objects.filter(
+            created_at__gte=now - timedelta(hours=24), parent_alert__isnull=True
+        ).select_related('project', 'alert_type')[:10])
         
         # Топ проекты по алертам
-        from django.db.models import Count
-        top_projects = ProjectAlert.objects.filter(
-            status__in=['NEW', 'ACKNOWLEDGED', 'IN_PROGRESS']
+        stats['top_projects'] = list(ProjectAlert.objects.filter(
+            status__in=self.OPEN_STATUSES
         ).values('project__name').annotate(
             alert_count=Count('id')
-        ).order_by('-alert_count')[:5]
+        ).order_by('-alert_count')[:5])
         
         # Распределение по типам
-        type_distribution = ProjectAlert.objects.filter(
-            created_at__date=today
+        stats['type_distribution'] = list(ProjectAlert.objects.filter(
+            created_at__date=today, parent_alert__isnull=True
         ).values('alert_type__name').annotate(
             count=Count('id')
-        ).order_by('-count')
+        ).order_by('-count'))
         
-        return {
-            'total_open': total_open,
-            'severity_stats': severity_stats,
-            'recent_alerts': recent_alerts[:10],
-            'alerts_today': ProjectAlert.objects.filter(created_at__date=today).count(),
-            'alerts_week': week_alerts.count(),
-            'resolved_week': resolved_week.count(),
-            'avg_resolution_hours': avg_resolution,
-            'top_projects': list(top_projects),
-            'type_distribution': list(type_distribution),
-            'critical_open': severity_stats.get('critical', 0),
-            'high_open': severity_stats.get('high', 0),
-        }
+        return stats
+
+
+class AlertWriter:
+    """
+    Пакетная запись алертов за один проход.
+    
+    Типы алертов, открытые корневые алерты и token buckets загружаются один
+    раз, группировка по отпечатку (alerts_storm) идет в памяти. Новые
+    алерты и их AlertLog записываются через bulk_create, повторения - одним
+    bulk_update при flush(). AlertManager.create_alert пишет через него же.
+    """
+    
+    def __init__(self, manager: AlertManager = None, auto_notify: bool = True, project_ids=None):
+        self.manager = manager or AlertManager()
+        self.auto_notify = auto_notify
+        self.alert_types = {alert_type.code: alert_type for alert_type in AlertType.objects.all()}
+        self.open_alerts = open_group_roots(project_ids)
+        self.storm_guard = StormGuard(project_ids)
+        
+        self.pending = []
+        self.recurrences = {}
+    
+    def get_alert_type(self, code: str, severity: str = 'MEDIUM') -> AlertType:
+        """Тип алерта из кэша (создается, если не существует)"""
+        alert_type = self.alert_types.get(code)
+        if alert_type is None:
+            alert_type, _ = AlertType.objects.get_or_create(
+                code=code,
+                defaults={
+                    'name': code.replace('_', ' ').title(),
+                    'description': f"Auto-created alert type: {code}",
+                    'default_severity': severity,
+                }
+            )
+            self.alert_types[code] = alert_type
+        return alert_type
+    
+    def add(
+        self,
+        project: Project,
+        alert_type_code: str,
+        title: str,
+        message: str,
+        severity: str = 'MEDIUM',
+        metric_value: float = None,
+        threshold_value: float = None,
+        details: Dict = None,
+    ) -> Optional[ProjectAlert]:
+        """
+        Поставить алерт в очередь записи.
+        
+        Если открыт корневой алерт с тем же отпечатком - учитывается
+        повторение: дочерний алерт при наличии токена, иначе только счетчики
+        корня (возвращается None - новой записи не будет).
+        """
+        alert_type = self.get_alert_type(alert_type_code, severity)
+        severity = severity or alert_type.default_severity
+        key = fingerprint(project.id, alert_type.id, severity)
+        now = timezone.now()
+        
+        parent = self.open_alerts.get(key)
+        if parent is not None:
+            # Увеличиваем счетчик повторений
+            parent.recurrence_count += 1
+            parent.is_recurring = True
+            parent.last_occurrence = now
+            if parent.pk:
+                # bulk_update не обновляет auto_now поля сам
+                parent.updated_at = now
+                self.recurrences[parent.pk] = parent
+            if not self.storm_guard.allow(project.id, alert_type.id, now):
+                return None
+            logger.info(f"Alert grouped under #{parent.pk or 'new'}: {title}")
+        
+        # Рассчитываем отклонение если есть метрика и порог
+        deviation = None
+        if metric_value is not None and threshold_value is not None and threshold_value != 0:
+            deviation = ((metric_value - threshold_value) / abs(threshold_value)) * 100
+        
+        alert = ProjectAlert(
+            project=project,
+            alert_type=alert_type,
+            severity=severity,
+            title=title,
+            message=message,
+            metric_value=metric_value,
+            threshold_value=threshold_value,
+            deviation=deviation,
+            details=details or {},
+            created_by='System',
+            parent_alert=parent,
+            # Повторение не требует отдельной работы и не считается открытым
+            status='GROUPED' if parent is not None else 'NEW',
+        )
+        self.pending.append(alert)
+        if parent is None:
+            self.open_alerts[key] = alert
+        return alert
+    
+    def flush(self) -> List[ProjectAlert]:
+        """Записать накопленные алерты, логи и повторения; вернуть новые алерты"""
+        created = self.pending
+        recurrences = list(self.recurrences.values())
+        self.pending = []
+        self.recurrences = {}
+        
+        if not created and not recurrences and not self.storm_guard.changed:
+            return []
+        
+        # Корни раньше дочерних: дочерним нужен id родителя из того же прохода
+        roots = [alert for alert in created if alert.parent_alert is None]
+        children = [alert for alert in created if alert.parent_alert is not None]
+        with transaction.atomic():
+            if created:
+                ProjectAlert.objects.bulk_create(roots)
+                ProjectAlert.objects.bulk_create(children)
+                AlertLog.objects.bulk_create([
+                    AlertLog(alert=alert, action='CREATED', details=f"Alert created: {alert.title}")
+                    for alert in created
+                ])
+            if recurrences:
+                ProjectAlert.objects.bulk_update(
+                    recurrences, ['recurrence_count', 'is_recurring', 'last_occurrence', 'updated_at']
+                )
+            self.storm_guard.save()
+            # bulk-операции не шлют сигналы - ведем статистику и сбрасываем кэш сами
+            AlertStatistics.record_created(created)
+        bump_alerts_version()
+        
+        for alert in created:
+            logger.info(f"Alert created: {alert.title} for project {alert.project.name}")
+        if self.auto_notify:
+            # Уведомляем только о корнях групп
+            self.manager.queue_notifications(roots)
+        
+        return created
 
 
 class AlertAnalyzer:
     """Анализатор для выявления паттернов и трендов в алертах"""
     
+    SEVERITY_PENALTIES = {'CRITICAL': 20, 'HIGH': 10, 'MEDIUM': 5, 'LOW': 2}
+    
     def analyze_project_health(self, project: Project) -> Dict[str, Any]:
         """Анализ здоровья проекта на основе алертов"""
+        return self.analyze_portfolio_health([project])[project.id]
+    
+    def analyze_portfolio_health(self, projects) -> Dict[int, Dict[str, Any]]:
+        """
+        Здоровье проектов по алертам за 30 дней: {project_id: анализ}.
+        
+        Два запроса с группировкой по проекту независимо от числа проектов.
+        Учитываются только корневые алерты: шторм штрафуется один раз.
+        """
+        from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
         
-        # Получаем алерты за последние 30 дней
-        cutoff_date = timezone.now() - timedelta(days=30)
+        project_ids = [project.id for project in projects]
+        now = timezone.now()
+        week_ago = now - timedelta(days=7)
         recent_alerts = ProjectAlert.objects.filter(
-            project=project,
-            created_at__gte=cutoff_date
+            project_id__in=project_ids,
+            created_at__gte=now - timedelta(days=30),
+            parent_alert__isnull=True,
         )
         
-        # Подсчет по severity
-        severity_counts = {}
+        aggregates = {
+            'total': Count('id'),
+            'this_week': Count('id', filter=Q(created_at__gte=week_ago)),
+            'last_week': Count('id', filter=Q(created_at__lt=week_ago, created_at__gte=week_ago - timedelta(days=7))),
+            'unresolved_critical': Count('id', filter=Q(severity='CRITICAL', status__in=['NEW', 'ACKNOWLEDGED'])),
+            'avg_resolution': Avg(
+                ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField()),
+                filter=Q(resolved_at__isnull=False),
+            ),
+        }
         for severity, _ in ProjectAlert.SEVERITY_CHOICES:
-            severity_counts[severity] = recent_alerts.filter(severity=severity).count()
+            aggregates[severity] = Count('id', filter=Q(severity=severity))
+        rows = {
+            row['project']: row
+            for row in recent_alerts.values('project').annotate(**aggregates).order_by()
+        }
+        
+        # Самый частый тип: строки отсортированы по убыванию count внутри проекта
+        most_common = {}
+        type_rows = recent_alerts.values('project', 'alert_type__name').annotate(
+            count=Count('id')
+        ).order_by('project', '-count', 'alert_type__name')
+        for row in type_rows:
+            most_common.setdefault(row['project'], row['alert_type__name'])
+        
+        return {
+            project_id: self._build_health(rows.get(project_id), most_common.get(project_id))
+            for project_id in project_ids
+        }
+    
+    def _build_health(self, row, most_common_type) -> Dict[str, Any]:
+        """Собрать анализ проекта из строки группировки (None - алертов нет)"""
+        row = row or {}
+        severity_counts = {
+            severity: row.get(severity, 0)
+            for severity, _ in ProjectAlert.SEVERITY_CHOICES
+        }
         
         # Расчет health score (0-100)
-        health_score = 100
-        health_score -= severity_counts.get('CRITICAL', 0) * 20
-        health_score -= severity_counts.get('HIGH', 0) * 10
-        health_score -= severity_counts.get('MEDIUM', 0) * 5
-        health_score -= severity_counts.get('LOW', 0) * 2
+        health_score = 100 - sum(
+            severity_counts[severity] * penalty
+            for severity, penalty in self.SEVERITY_PENALTIES.items()
+        )
         health_score = max(0, min(100, health_score))
         
         # Определение статуса
@@ -660,62 +1081,37 @@ class AlertAnalyzer:
             health_status = 'CRITICAL'
         
         # Тренды
-        week_ago = timezone.now() - timedelta(days=7)
-        alerts_this_week = recent_alerts.filter(created_at__gte=week_ago).count()
-        alerts_last_week = recent_alerts.filter(
-            created_at__lt=week_ago,
-            created_at__gte=week_ago - timedelta(days=7)
-        ).count()
-        
+        alerts_this_week = row.get('this_week', 0)
+        alerts_last_week = row.get('last_week', 0)
         if alerts_last_week > 0:
             trend = ((alerts_this_week - alerts_last_week) / alerts_last_week) * 100
         else:
             trend = 0 if alerts_this_week == 0 else 100
         
+        avg_resolution = row.get('avg_resolution')
         return {
             'health_score': health_score,
             'health_status': health_status,
-            'total_alerts_30d': recent_alerts.count(),
+            'total_alerts_30d': row.get('total', 0),
             'severity_breakdown': severity_counts,
             'trend_percent': trend,
             'alerts_this_week': alerts_this_week,
             'alerts_last_week': alerts_last_week,
-            'unresolved_critical': recent_alerts.filter(
-                severity='CRITICAL',
-                status__in=['NEW', 'ACKNOWLEDGED']
-            ).count(),
-            'avg_resolution_time': self._calculate_avg_resolution_time(recent_alerts),
-            'most_common_type': self._get_most_common_alert_type(recent_alerts),
+            'unresolved_critical': row.get('unresolved_critical', 0),
+            'avg_resolution_time': avg_resolution.total_seconds() / 3600 if avg_resolution else None,
+            'most_common_type': most_common_type,
         }
     
-    def _calculate_avg_resolution_time(self, alerts):
-        """Рассчитать среднее время решения"""
-        resolved = alerts.filter(resolved_at__isnull=False)
-        if not resolved.exists():
-            return None
-        
-        times = [a.resolution_time_hours for a in resolved if a.resolution_time_hours]
-        return sum(times) / len(times) if times else None
-    
-    def _get_most_common_alert_type(self, alerts):
-        """Найти самый частый тип алерта"""
-        from django.db.models import Count
-        
-        top_type = alerts.values('alert_type__name').annotate(
-            count=Count('id')
-        ).order_by('-count').first()
-        
-        return top_type['alert_type__name'] if top_type else None
-    
     def generate_portfolio_report(self) -> Dict[str, Any]:
         """Генерация отчета по всему портфолио"""
-        projects = Project.objects.filter(status='active')
+        projects = list(Project.objects.filter(status='active').only('id', 'name'))
+        health_by_project = self.analyze_portfolio_health(projects)
         
         portfolio_health = []
         total_score = 0
         
         for project in projects:
-            health = self.analyze_project_health(project)
+            health = health_by_project[project.id]
             portfolio_health.append({
                 'project': project.name,
                 'health_score': health['health_score'],
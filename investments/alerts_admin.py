@@ -9,7 +9,7 @@ from django.urls import path, reverse
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Count, Q, Avg
+from django.db.models import Q, Avg, DurationField, ExpressionWrapper, F
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from datetime import datetime, timedelta
@@ -17,9 +17,11 @@ import json
 
 from .alerts_models import (
     AlertType, ProjectAlert, AlertSettings,
-    AlertLog, AlertRule, AlertStatistics
+    AlertArchive, AlertLog, AlertRule, AlertStatistics, AlertThrottle, NotificationOutbox,
+    bump_alerts_version
 )
 from .alerts import AlertManager, AlertAnalyzer
+from .notifications import requeue_dead
 
 
 @admin.register(AlertType)
@@ -192,7 +194,8 @@ class ProjectAlertAdmin(admin.ModelAdmin):
             'IN_PROGRESS': '#17a2b8',
             'RESOLVED': '#28a745',
             'DISMISSED': '#6c757d',
-            'ESCALATED': '#dc3545'
+            'ESCALATED': '#dc3545',
+            'GROUPED': '#adb5bd',
         }
         return format_html(
             '<span style="background-color: {}; color: white; padding: 3px 8px; '
@@ -229,7 +232,7 @@ class ProjectAlertAdmin(admin.ModelAdmin):
                 obj.id
             ))
         
-        if obj.status in ['NEW', 'ACKNOWLEDGED', 'IN_PROGRESS']:
+        if obj.status in ProjectAlert.OPEN_STATUSES:
             buttons.append(format_html(
                 '<a class="button" href="#" onclick="resolveAlert({}); return false;" '
                 'style="padding: 3px 8px; margin: 2px; background: #28a745;">✓ Resolve</a>',
@@ -246,7 +249,7 @@ class ProjectAlertAdmin(admin.ModelAdmin):
     
     def resolve_alerts(self, request, queryset):
         count = 0
-        for alert in queryset.filter(status__in=['NEW', 'ACKNOWLEDGED', 'IN_PROGRESS']):
+        for alert in queryset.filter(status__in=ProjectAlert.OPEN_STATUSES):
             alert.resolve(request.user)
             count += 1
         messages.success(request, f'{count} alerts resolved')
@@ -261,7 +264,12 @@ class ProjectAlertAdmin(admin.ModelAdmin):
     escalate_alerts.short_description = "Escalate selected alerts"
     
     def dismiss_alerts(self, request, queryset):
+        days = sorted(queryset.dates('created_at', 'day'))
         count = queryset.update(status='DISMISSED')
+        # update() не шлет сигналы - пересчитываем затронутые дни
+        if days:
+            AlertStatistics.rebuild(days[0], days[-1])
+        bump_alerts_version()
         messages.success(request, f'{count} alerts dismissed')
     dismiss_alerts.short_description = "Dismiss selected alerts"
     
@@ -272,8 +280,8 @@ class ProjectAlertAdmin(admin.ModelAdmin):
             if not alert.email_sent:
                 manager.send_notifications(alert)
                 count += 1
-        messages.success(request, f'Email notifications sent for {count} alerts')
-    send_email_notifications.short_description = "Send email notifications"
+        messages.success(request, f'Email notifications queued for {count} alerts')
+    send_email_notifications.short_description = "Queue email notifications"
     
     # Custom Views
     def alerts_dashboard(self, request):
@@ -307,55 +315,35 @@ class ProjectAlertAdmin(admin.ModelAdmin):
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=30)
         
-        # Collect daily statistics
-        daily_stats = []
-        current_date = start_date
-        while current_date <= end_date:
-            alerts_count = ProjectAlert.objects.filter(
-                created_at__date=current_date
-            ).count()
-            
-            resolved_count = ProjectAlert.objects.filter(
-                resolved_at__date=current_date
-            ).count()
-            
-            daily_stats.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'created': alerts_count,
-                'resolved': resolved_count
-            })
-            current_date += timedelta(days=1)
-        
-        # Top projects by alerts
-        top_projects = ProjectAlert.objects.values(
-            'project__name'
-        ).annotate(
-            alert_count=Count('id')
-        ).order_by('-alert_count')[:10]
+        # Дневные агрегаты: 31 строка AlertStatistics, недостающие дни досчитываются
+        rollups = {stats.date: stats for stats in AlertStatistics.objects.filter(date__range=(start_date, end_date))}
+        if len(rollups) < (end_date - start_date).days + 1:
+            rollups = {stats.date: stats for stats in AlertStatistics.rebuild(start_date, end_date)}
+        daily_stats = [
+            {
+                'date': day.strftime('%Y-%m-%d'),
+                'created': stats.created_count,
+                'resolved': stats.resolutions_count,
+            }
+            for day, stats in sorted(rollups.items())
+        ]
         
-        # Alert type distribution
-        type_distribution = ProjectAlert.objects.values(
-            'alert_type__name'
-        ).annotate(
-            count=Count('id')
-        ).order_by('-count')
+        # Топ проектов и типов за то же окно - считается при чтении
+        top = AlertStatistics.top(start_date, end_date, limit=None)
+        top_projects = [
+            {'project__name': row['project__name'], 'alert_count': row['count']}
+            for row in top['top_projects'][:10]
+        ]
+        type_distribution = top['top_types']
         
         # Average resolution time by severity
-        resolution_times = {}
-        for severity, _ in ProjectAlert.SEVERITY_CHOICES:
-            alerts = ProjectAlert.objects.filter(
-                severity=severity,
-                resolved_at__isnull=False
-            )
-            times = []
-            for alert in alerts[:100]:  # Sample
-                if alert.resolution_time_hours:
-                    times.append(alert.resolution_time_hours)
-            
-            if times:
-                resolution_times[severity] = sum(times) / len(times)
-            else:
-                resolution_times[severity] = 0
+        resolution_times = {severity: 0 for severity, _ in ProjectAlert.SEVERITY_CHOICES}
+        resolution_rows = ProjectAlert.objects.filter(resolved_at__isnull=False).values('severity').annotate(
+            avg_duration=Avg(ExpressionWrapper(F('resolved_at') - F('created_at'), output_field=DurationField()))
+        )
+        for row in resolution_rows:
+            if row['avg_duration']:
+                resolution_times[row['severity']] = row['avg_duration'].total_seconds() / 3600
         
         context = {
             'title': 'Alerts Analytics',
@@ -373,7 +361,8 @@ class ProjectAlertAdmin(admin.ModelAdmin):
     def alerts_api_stats(self, request):
         """API endpoint for real-time stats"""
         manager = AlertManager()
-        stats = manager.get_dashboard_stats()
+        # Только счетчики: один запрос, пока алерты не менялись - из кэша
+        stats = manager.get_alert_counts()
         
         return JsonResponse({
             'success': True,
@@ -565,6 +554,55 @@ class AlertLogAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = [
+        'recipient', 'subject', 'status', 'attempts',
+        'next_attempt_at', 'sent_at', 'created_at'
+    ]
+    list_filter = ['status', 'channel', ('created_at', admin.DateFieldListFilter)]
+    search_fields = ['recipient', 'subject', 'last_error']
+    readonly_fields = [
+        'alert', 'user', 'channel', 'recipient', 'subject', 'body',
+        'status', 'attempts', 'next_attempt_at', 'claim_token',
+        'last_error', 'created_at', 'sent_at'
+    ]
+    actions = ['requeue_dead_letters']
+    
+    def requeue_dead_letters(self, request, queryset):
+        count = requeue_dead(queryset)
+        messages.success(request, f'{count} dead letters requeued')
+    requeue_dead_letters.short_description = "Requeue dead letters"
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(AlertThrottle)
+class AlertThrottleAdmin(admin.ModelAdmin):
+    list_display = [
+        'project', 'alert_type', 'tokens',
+        'suppressed_count', 'last_suppressed_at', 'refilled_at'
+    ]
+    list_filter = ['alert_type']
+    search_fields = ['project__name']
+    readonly_fields = ['project', 'alert_type', 'suppressed_count', 'last_suppressed_at', 'refilled_at']
+
+
+@admin.register(AlertArchive)
+class AlertArchiveAdmin(admin.ModelAdmin):
+    list_display = ['month', 'alert_count', 'log_count', 'first_alert_id', 'last_alert_id', 'created_at']
+    date_hierarchy = 'month'
+    exclude = ['data', 'daily_counts']
+    readonly_fields = [
+        'month', 'span_start', 'span_end', 'alert_count', 'log_count',
+        'first_alert_id', 'last_alert_id', 'created_at'
+    ]
+    
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(AlertStatistics)
 class AlertStatisticsAdmin(admin.ModelAdmin):
     list_display = [
@@ -579,10 +617,20 @@ class AlertStatisticsAdmin(admin.ModelAdmin):
         'medium_count', 'low_count', 'info_count',
         'new_count', 'acknowledged_count',
         'resolved_count', 'dismissed_count',
+        'created_count', 'acknowledgements_count', 'response_hours_sum',
+        'resolutions_count', 'resolution_hours_sum',
         'avg_response_time', 'avg_resolution_time',
         'top_projects', 'top_types'
     ]
     
+    def top_projects(self, obj):
+        return AlertStatistics.top(obj.date, obj.date, limit=5)['top_projects']
+    top_projects.short_description = 'Top projects'
+    
+    def top_types(self, obj):
+        return AlertStatistics.top(obj.date, obj.date, limit=5)['top_types']
+    top_types.short_description = 'Top types'
+    
     def total_alerts(self, obj):
         return (
             obj.critical_count + obj.high_count +
@@ -603,7 +651,8 @@ class AlertStatisticsAdmin(admin.ModelAdmin):
     
     def recalculate_statistics(self, request, queryset):
         """Recalculate statistics for selected dates"""
-        for stat in queryset:
-            AlertStatistics.calculate_for_date(stat.date)
+        days = sorted(queryset.values_list('date', flat=True))
+        if days:
+            AlertStatistics.rebuild(days[0], days[-1])
         messages.success(request, 'Statistics recalculated')
     recalculate_statistics.short_description = "Recalculate statistics"
@@ -0,0 +1,217 @@
+# investments/alerts_context.py
+"""
+Контекст оценки проекта для проверок AlertManager.
+
+Транзакции проекта загружаются одним запросом, а производные величины
+(кэшфлоу, NAV, IRR, NPV, DPI/TVPI/MOIC, ряд стоимости) считаются один раз
+при первом обращении и переиспользуются всеми проверками.
+
+Контекст содержит только простые данные (без ссылок на модели), поэтому
+его можно передавать между процессами.
+"""
+
+from datetime import date
+from functools import cached_property
+from typing import NamedTuple, Optional
+
+from .models import Transaction
+from .utils import calculate_xnpv, safe_sum, solve_xirr
+
+TX_FIELDS = ('id', 'project_id', 'date', 'transaction_type', 'investment',
+             'return_amount', 'equity', 'nav', 'x_rate')
+
+
+class TxRow(NamedTuple):
+    """Транзакция в USD (те же правила, что у свойств Transaction.*_usd)"""
+    id: int
+    date: date
+    transaction_type: str
+    investment_usd: float
+    return_usd: float
+    equity: Optional[float]
+    equity_usd: float
+    nav: Optional[float]
+    nav_usd: float
+
+    @classmethod
+    def from_values(cls, values):
+        (tx_id, _project_id, tx_date, tx_type, investment,
+         return_amount, equity, nav, x_rate) = values
+        rate = x_rate or 1
+        return cls(
+            tx_id, tx_date, tx_type,
+            (investment or 0) * rate,
+            (return_amount or 0) * rate,
+            equity,
+            (equity or 0) * rate,
+            nav,
+            (nav or 0) * rate,
+        )
+
+
+class ProjectEvaluationContext:
+    """Данные и метрики одного проекта, общие для всех проверок"""
+
+    def __init__(self, project, rows):
+        self.project_id = project.id
+        self.name = project.name
+        self.status = project.status
+        self.target_irr = project.target_irr
+        self.stored_moic = project.moic
+        self.today = date.today()
+        # (date, id) - детерминированный порядок для транзакций одной даты
+        self.transactions = sorted(rows, key=lambda tx: (tx.date, tx.id))
+
+    @classmethod
+    def load(cls, project):
+        """Загрузить транзакции проекта одним запросом"""
+        rows = Transaction.objects.filter(project_id=project.id).values_list(*TX_FIELDS)
+        return cls(project, [TxRow.from_values(values) for values in rows])
+
+    @classmethod
+    def load_many(cls, projects):
+        """Контексты для набора проектов: один запрос на все транзакции"""
+        projects = list(projects)
+        rows_by_project = {project.id: [] for project in projects}
+        queryset = Transaction.objects.filter(
+            project_id__in=list(rows_by_project)
+        ).values_list(*TX_FIELDS)
+        for values in queryset.iterator(chunk_size=2000):
+            rows_by_project[values[1]].append(TxRow.from_values(values))
+        return {project.id: cls(project, rows_by_project[project.id]) for project in projects}
+
+    # --- Транзакции ---
+
+    @cached_property
+    def nav_transactions(self):
+        """Транзакции с заполненным NAV"""
+        return [tx for tx in self.transactions if tx.nav is not None]
+
+    @property
+    def last_nav_transaction(self):
+        return self.nav_transactions[-1] if self.nav_transactions else None
+
+    def nav_transaction_on_or_before(self, as_of):
+        """Последняя транзакция с NAV на дату as_of или раньше"""
+        found = None
+        for tx in self.nav_transactions:
+            if tx.date > as_of:
+                break
+            found = tx
+        return found
+
+    def last_transaction_of_type(self, transaction_type, since=None):
+        for tx in reversed(self.transactions):
+            if since is not None and tx.date < since:
+                break
+            if tx.transaction_type == transaction_type:
+                return tx
+        return None
+
+    @cached_property
+    def value_series(self):
+        """Ряд стоимости [(date, value)]: NAV, а если его нет - equity"""
+        values = []
+        for tx in self.transactions:
+            if tx.nav_usd:
+                values.append((tx.date, tx.nav_usd))
+            elif tx.equity_usd:
+                values.append((tx.date, tx.equity_usd))
+        return values
+
+    @cached_property
+    def nav_series(self):
+        """Ряд NAV [(date, nav_usd)]"""
+        return [(tx.date, tx.nav_usd) for tx in self.nav_transactions]
+
+    @cached_property
+    def nav_analytics(self):
+        """Аналитика ряда NAV - изменения за окна (nav_analytics)"""
+        from .nav_analytics import analyze
+        return analyze(self.nav_series, self.today)
+
+    @cached_property
+    def value_analytics(self):
+        """Аналитика ряда NAV/equity - просадки (nav_analytics)"""
+        from .nav_analytics import analyze
+        return analyze(self.value_series, self.today)
+
+    # --- Метрики (как Project.get_*) ---
+
+    @cached_property
+    def total_invested(self):
+        return safe_sum(tx.investment_usd for tx in self.transactions)
+
+    @cached_property
+    def total_returned(self):
+        return safe_sum(tx.return_usd for tx in self.transactions)
+
+    @cached_property
+    def nav(self):
+        """Текущий NAV (Project.get_nav)"""
+        if self.status == 'closed':
+            return 0
+        if self.last_nav_transaction:
+            return round(self.last_nav_transaction.nav_usd, 2)
+        equity_transactions = [tx for tx in self.transactions if tx.equity is not None]
+        if equity_transactions:
+            return round(equity_transactions[-1].equity_usd, 2)
+        return 0
+
+    @cached_property
+    def cash_flows(self):
+        """Кэшфлоу с NAV для активных проектов (Project.get_cash_flows(include_nav=True))"""
+        cash_flows = []
+        for tx in self.transactions:
+            if tx.investment_usd:
+                cash_flows.append((tx.date, -tx.investment_usd))
+            if tx.return_usd:
+                cash_flows.append((tx.date, tx.return_usd))
+
+        if self.status == 'active' and self.nav:
+            valued = [tx for tx in self.nav_transactions if tx.nav != 0]
+            if valued:
+                nav_date = valued[-1].date
+            elif self.transactions:
+                nav_date = self.transactions[-1].date
+            else:
+                nav_date = self.today
+            cash_flows.append((nav_date, abs(self.nav)))
+        return cash_flows
+
+    @cached_property
+    def irr(self):
+        return solve_xirr(self.cash_flows, self.name, self.status)
+
+    @cached_property
+    def npv(self):
+        if self.target_irr is None:
+            return None
+        return calculate_xnpv(
+            [amount for _, amount in self.cash_flows],
+            [cf_date for cf_date, _ in self.cash_flows],
+            self.target_irr,
+        )
+
+    @cached_property
+    def dpi(self):
+        if not self.total_invested:
+            return None
+        return round(self.total_returned / self.total_invested, 2)
+
+    @cached_property
+    def tvpi(self):
+        if not self.total_invested:
+            return 0.0
+        total_value = self.total_returned + ((self.nav or 0) if self.status == 'active' else 0)
+        return round(total_value / self.total_invested, 2)
+
+    @cached_property
+    def moic(self):
+        if self.stored_moic is not None:
+            return self.stored_moic
+        if not self.total_invested:
+            return None
+        if self.status == 'active':
+            return (self.total_returned + (self.nav or 0)) / self.total_invested
+        return self.total_returned / self.total_invested
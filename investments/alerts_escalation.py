@@ -0,0 +1,109 @@
+# investments/alerts_escalation.py
+"""
+Эскалация алертов по SLA.
+
+Корневой алерт в статусе NEW или ACKNOWLEDGED, который старше SLA своей
+severity (ALERT_SLA['SLA_MINUTES']), переводится в ESCALATED с повышением
+severity (ProjectAlert.ESCALATION_STEPS). Проход - одна выборка по индексу
+(status, severity, created_at), одно UPDATE, bulk_create логов и одна
+пачка уведомлений. Дочерние алерты шторма (parent_alert) не эскалируются:
+за группу отвечает корень. Запускается планировщиком alerts_scheduler.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .alerts_models import AlertLog, AlertStatistics, ProjectAlert, bump_alerts_version
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+ESCALATABLE_STATUSES = ('NEW', 'ACKNOWLEDGED')
+
+
+def get_config():
+    config = {
+        # None - severity не эскалируется
+        'SLA_MINUTES': {
+            'CRITICAL': 60,
+            'HIGH': 4 * 60,
+            'MEDIUM': 24 * 60,
+            'LOW': 3 * 24 * 60,
+            'INFO': None,
+        },
+        'INTERVAL_MINUTES': 5,
+    }
+    config.update(getattr(settings, 'ALERT_SLA', {}))
+    return config
+
+
+def overdue_alerts(now=None):
+    """Алерты, нарушившие SLA своей severity"""
+    now = now or timezone.now()
+    overdue = Q()
+    for severity, minutes in get_config()['SLA_MINUTES'].items():
+        if minutes is not None:
+            overdue |= Q(severity=severity, created_at__lt=now - timedelta(minutes=minutes))
+    if not overdue:
+        return ProjectAlert.objects.none()
+    return ProjectAlert.objects.filter(
+        overdue, status__in=ESCALATABLE_STATUSES, parent_alert__isnull=True
+    ).order_by()
+
+
+def escalated_severity():
+    """Выражение новой severity для UPDATE"""
+    return Case(
+        *[When(severity=old, then=Value(new)) for old, new in ProjectAlert.ESCALATION_STEPS.items()],
+        default=F('severity'),
+    )
+
+
+def escalate_overdue(manager=None, now=None, notify=True):
+    """Эскалировать просроченные алерты; вернуть их число"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(overdue_alerts(now).select_for_update().values_list('id', 'created_at', 'status', 'severity'))
+        if not rows:
+            return 0
+        ids = [row[0] for row in rows]
+        updated = ProjectAlert.objects.filter(id__in=ids).update(
+            status='ESCALATED',
+            severity=escalated_severity(),
+            escalated_at=now,
+            updated_at=now,
+        )
+
+        steps = ProjectAlert.ESCALATION_STEPS
+        AlertLog.objects.bulk_create([
+            AlertLog(
+                alert_id=alert_id,
+                action='ESCALATED',
+                details=f"SLA exceeded for {severity} alert",
+                old_value=f"{status}/{severity}",
+                new_value=f"ESCALATED/{steps.get(severity, severity)}",
+            )
+            for alert_id, created_at, status, severity in rows
+        ])
+        # update() не шлет сигналы - ведем статистику сами
+        AlertStatistics.record_transitions([
+            (created_at, status, severity, 'ESCALATED', steps.get(severity, severity))
+            for alert_id, created_at, status, severity in rows
+        ])
+    bump_alerts_version()
+
+    if notify:
+        from .alerts import AlertManager
+
+        manager = manager or AlertManager()
+        alerts = list(
+            ProjectAlert.objects.filter(id__in=ids, parent_alert__isnull=True).select_related('project', 'alert_type')
+        )
+        manager.queue_notifications(alerts)
+
+    logger.info("alert_escalation.sweep", escalated=updated)
+    return updated
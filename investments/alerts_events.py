@@ -0,0 +1,165 @@
+# investments/alerts_events.py
+"""
+Проверка алертов по событиям: запись транзакции ставит ее проект в
+очередь локального фонового потока, который выполняет только проверки,
+зависящие от изменившихся данных.
+
+    NAV        -> NAV_DROP, DRAWDOWN, DATA_QUALITY
+    Return     -> DISTRIBUTION
+    Investment -> IRR_GAP, NPV_NEGATIVE
+
+Записи одного проекта, пришедшие в течение DEBOUNCE_SECONDS, объединяются
+в одну проверку (импорт сотни транзакций - одна оценка проекта). Очередь
+живет в памяти процесса; при завершении процесса оставшиеся проекты
+проверяются синхронно. Полный проход check_alerts остается страховкой.
+
+Очередь работает только в процессах, которые включили ее сами
+(enable_for_process в tracker/wsgi.py и asgi.py), и при
+ALERT_EVENTS['ENABLED']. Management-команды (import_excel, create_test_data,
+remove_duplicate_transactions...) поток не запускают: их записи проверит
+следующий check_alerts.
+"""
+
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+CHECKS_BY_TRANSACTION_TYPE = {
+    'NAV': ('NAV_DROP', 'DRAWDOWN', 'DATA_QUALITY'),
+    'Return': ('DISTRIBUTION',),
+    'Investment': ('IRR_GAP', 'NPV_NEGATIVE'),
+}
+
+
+def get_config():
+    config = {
+        'ENABLED': False,
+        'DEBOUNCE_SECONDS': 2.0,
+    }
+    config.update(getattr(settings, 'ALERT_EVENTS', {}))
+    return config
+
+
+def checks_for_transaction(transaction_type):
+    return CHECKS_BY_TRANSACTION_TYPE.get(transaction_type, ())
+
+
+class AlertEventWorker:
+    """Фоновый поток с очередью {project_id: {коды проверок}}"""
+
+    def __init__(self, debounce_seconds=2.0):
+        self.debounce_seconds = debounce_seconds
+        self.manager = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._processing = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+
+    def enqueue(self, project_id, check_types):
+        if not check_types:
+            return
+        with self._lock:
+            self._pending.setdefault(project_id, set()).update(check_types)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='alert-events', daemon=True)
+                self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.drain)
+                self._atexit_registered = True
+        self._wakeup.set()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return {project_id: set(checks) for project_id, checks in self._pending.items()}
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Дать накопиться пачке записей (импорт, несколько форм подряд)
+            time.sleep(self.debounce_seconds)
+            self._wakeup.clear()
+            self.drain()
+
+    def drain(self):
+        """Проверить все проекты из очереди; возвращает число проектов"""
+        with self._processing:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self._process(batch)
+            except Exception as e:
+                logger.error("alert_events.batch_failed", projects=len(batch), error=str(e), exc_info=True)
+            finally:
+                # Соединения потока не должны висеть между пачками
+                if threading.current_thread() is self._thread:
+                    connections.close_all()
+            return len(batch)
+
+    def _process(self, batch):
+        from .alerts import AlertManager, AlertWriter
+        from .alerts_context import ProjectEvaluationContext
+        from .models import Project
+
+        started = time.perf_counter()
+        if self.manager is None:
+            self.manager = AlertManager()
+        writer = AlertWriter(self.manager)
+
+        projects = list(Project.objects.filter(id__in=list(batch), status='active'))
+        contexts = ProjectEvaluationContext.load_many(projects)
+
+        created = 0
+        for project in projects:
+            check_types = sorted(batch[project.id])
+            findings, errors = self.manager.evaluate_project(contexts[project.id], check_types)
+            for check_type, error in errors.items():
+                logger.warning("alert_events.check_error", project=project.name, check=check_type, error=error)
+            created += len(self.manager.apply_findings(project, findings, writer=writer))
+        writer.flush()
+
+        logger.info(
+            "alert_events.batch",
+            projects=len(projects),
+            alerts=created,
+            elapsed=round(time.perf_counter() - started, 3),
+        )
+
+
+_worker = None
+_worker_lock = threading.Lock()
+_process_enabled = False
+
+
+def enable_for_process():
+    """Разрешить фоновые проверки в текущем процессе (веб-сервер)"""
+    global _process_enabled
+    _process_enabled = True
+
+
+def get_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = AlertEventWorker(get_config()['DEBOUNCE_SECONDS'])
+        return _worker
+
+
+def enqueue_transaction_checks(project_id, transaction_type):
+    """Поставить проект в очередь проверок, зависящих от транзакции этого типа"""
+    if not _process_enabled or not get_config()['ENABLED']:
+        return
+    check_types = checks_for_transaction(transaction_type)
+    if check_types:
+        get_worker().enqueue(project_id, check_types)
@@ -4,11 +4,35 @@
 Модели для системы уведомлений и мониторинга инвестиционных проектов
 """
 
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
-from datetime import datetime, timedelta
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import gzip
 import json
+import threading
+
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Версия таблицы алертов: меняется при каждой записи, входит в ключи кэша статистики
+ALERTS_VERSION_KEY = 'alerts_table_version'
+
+
+def alerts_version():
+    return cache.get(ALERTS_VERSION_KEY, 0)
+
+
+def bump_alerts_version():
+    """Вызывать после записей в ProjectAlert в обход save() (bulk_create, update)"""
+    try:
+        cache.incr(ALERTS_VERSION_KEY)
+    except ValueError:
+        cache.set(ALERTS_VERSION_KEY, 1, None)
 
 
 class AlertType(models.Model):
@@ -47,6 +71,7 @@ class AlertType(models.Model):
         default=1440,  # минуты (24 часа по умолчанию)
         help_text="Частота проверки в минутах"
     )
+    last_checked = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     email_template = models.TextField(
         blank=True,
@@ -70,6 +95,12 @@ class AlertType(models.Model):
     
     def __str__(self):
         return self.name
+    
+    def next_check_at(self):
+        """Время следующей проверки по check_frequency (None - проверить сразу)"""
+        if self.last_checked is None:
+            return None
+        return self.last_checked + timedelta(minutes=max(self.check_frequency, 1))
 
 
 class ProjectAlert(models.Model):
@@ -89,9 +120,13 @@ class ProjectAlert(models.Model):
         ('IN_PROGRESS', 'In Progress'),
         ('RESOLVED', 'Resolved'),
         ('DISMISSED', 'Dismissed'),
-        ('ESCALATED', 'Escalated')
+        ('ESCALATED', 'Escalated'),
+        ('GROUPED', 'Grouped'),
     ]
     
+    # Требуют внимания; GROUPED - повторение под открытым корнем (alerts_storm)
+    OPEN_STATUSES = ['NEW', 'ACKNOWLEDGED', 'IN_PROGRESS', 'ESCALATED']
+    
     # Связи
     project = models.ForeignKey(
         'investments.Project',
@@ -217,11 +252,27 @@ class ProjectAlert(models.Model):
             models.Index(fields=['-created_at', 'status']),
             models.Index(fields=['project', '-created_at']),
             models.Index(fields=['severity', 'status']),
+            # Поиск просроченных по SLA (alerts_escalation)
+            models.Index(fields=['status', 'severity', 'created_at']),
         ]
     
+    # Повышение severity при эскалации
+    ESCALATION_STEPS = {
+        'LOW': 'MEDIUM',
+        'MEDIUM': 'HIGH',
+        'HIGH': 'CRITICAL',
+    }
+    
     def __str__(self):
         return f"{self.project.name} - {self.title} ({self.get_severity_display()})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Состояние при загрузке - для инкрементальной статистики (AlertStatistics)
+        instance._loaded_state = (instance.__dict__.get('status'), instance.__dict__.get('severity'))
+        return instance
+    
     def acknowledge(self, user=None):
         """Подтвердить получение алерта"""
         self.status = 'ACKNOWLEDGED'
@@ -244,12 +295,7 @@ class ProjectAlert(models.Model):
         """Эскалировать алерт"""
         self.status = 'ESCALATED'
         self.escalated_at = timezone.now()
-        if self.severity == 'LOW':
-            self.severity = 'MEDIUM'
-        elif self.severity == 'MEDIUM':
-            self.severity = 'HIGH'
-        elif self.severity == 'HIGH':
-            self.severity = 'CRITICAL'
+        self.severity = self.ESCALATION_STEPS.get(self.severity, self.severity)
         self.save()
     
     def get_severity_color(self):
@@ -277,7 +323,7 @@ class ProjectAlert(models.Model):
     @property
     def is_open(self):
         """Проверить, открыт ли алерт"""
-        return self.status not in ['RESOLVED', 'DISMISSED']
+        return self.status in self.OPEN_STATUSES
     
     @property
     def age_days(self):
@@ -381,6 +427,23 @@ class AlertSettings(models.Model):
     def __str__(self):
         return f"Alert Settings for {self.user.username}"
     
+    def is_quiet_time(self, moment):
+        """Попадает ли moment в quiet hours (окно может переходить через полночь)"""
+        if not (self.quiet_hours_enabled and self.quiet_hours_start and self.quiet_hours_end):
+            return False
+        now = timezone.localtime(moment).time()
+        if self.quiet_hours_start <= self.quiet_hours_end:
+            return self.quiet_hours_start <= now <= self.quiet_hours_end
+        return now >= self.quiet_hours_start or now <= self.quiet_hours_end
+    
+    def is_muted_at(self, moment):
+        """Уведомления выключены в moment: quiet hours или выходные"""
+        if self.is_quiet_time(moment):
+            return True
+        if not self.weekend_notifications and timezone.localtime(moment).weekday() in [5, 6]:  # Saturday, Sunday
+            return True
+        return False
+    
     def should_send_notification(self, alert):
         """Проверить, нужно ли отправлять уведомление"""
         # Vacation mode
@@ -398,16 +461,9 @@ class AlertSettings(models.Model):
         if alert_level < min_level:
             return False
         
-        # Check quiet hours
-        if self.quiet_hours_enabled:
-            now = timezone.now().time()
-            if self.quiet_hours_start <= now <= self.quiet_hours_end:
-                return False
-        
-        # Check weekend
-        if not self.weekend_notifications:
-            if timezone.now().weekday() in [5, 6]:  # Saturday, Sunday
-                return False
+        # Check quiet hours and weekend
+        if self.is_muted_at(timezone.now()):
+            return False
         
         # Check subscriptions
         if self.subscribed_types.exists():
@@ -568,42 +624,107 @@ class AlertRule(models.Model):
     def __str__(self):
         return f"{self.name} ({self.alert_type.name})"
     
+    def next_check_at(self):
+        """Время следующей проверки по check_schedule (None - проверить сразу)"""
+        from .cron import CronError, parse_cron
+        
+        if self.last_checked is None:
+            return None
+        last_checked = timezone.localtime(self.last_checked)
+        try:
+            return parse_cron(self.check_schedule).next_after(last_checked)
+        except CronError as e:
+            # Некорректное расписание - раз в час, как раньше
+            logger.warning("alert_rule.invalid_schedule", rule=self.name, error=str(e))
+            return last_checked + timedelta(hours=1)
+    
+    def is_due(self, now=None):
+        next_check = self.next_check_at()
+        return next_check is None or next_check <= (now or timezone.now())
+    
+    def clean(self):
+        """Проверить custom условие и расписание при сохранении из админки"""
+        from django.core.exceptions import ValidationError
+        from .cron import CronError, parse_cron
+        from .rule_engine import RuleSyntaxError, compile_condition
+
+        errors = {}
+        if self.condition_type == 'CUSTOM' and self.custom_condition:
+            try:
+                compile_condition(self.custom_condition)
+            except RuleSyntaxError as e:
+                errors['custom_condition'] = str(e)
+        try:
+            parse_cron(self.check_schedule)
+        except CronError as e:
+            errors['check_schedule'] = str(e)
+        if errors:
+            raise ValidationError(errors)
+    
     def check_condition(self, project, current_value):
         """Проверить условие правила для проекта"""
         if self.condition_type == 'CUSTOM' and self.custom_condition:
-            # Выполнить custom код
+            # Условие компилируется один раз и берется из кэша
+            from .rule_engine import get_compiled_rule
             try:
-                # Безопасное выполнение с ограниченным контекстом
-                local_vars = {
-                    'project': project,
-                    'value': current_value,
-                    'threshold': self.threshold_value
-                }
-                exec(self.custom_condition, {"__builtins__": {}}, local_vars)
-                return local_vars.get('result', False)
+                return get_compiled_rule(self).evaluate(
+                    project=project,
+                    value=current_value,
+                    threshold=self.threshold_value,
+                )
             except Exception as e:
-                print(f"Error in custom condition: {e}")
+                logger.warning("alert_rule.custom_condition_error", rule=self.name, error=str(e))
                 return False
         
         # Стандартные проверки
-        if self.operator == 'GT':
-            return current_value > self.threshold_value
+        return self.compare(current_value)
+    
+    def compare(self, value):
+        """
+        Сравнить значение с порогом по оператору правила.
+        
+        Для CHANGE/TREND правил value - изменение или наклон метрики
+        (см. investments.rule_planner).
+        """
+        if value is None or self.threshold_value is None:
+            return False
+        if self.operator in ('GT', 'CHANGE_GT'):
+            return value > self.threshold_value
         elif self.operator == 'GTE':
-            return current_value >= self.threshold_value
-        elif self.operator == 'LT':
-            return current_value < self.threshold_value
+            return value >= self.threshold_value
+        elif self.operator in ('LT', 'CHANGE_LT'):
+            return value < self.threshold_value
         elif self.operator == 'LTE':
-            return current_value <= self.threshold_value
+            return value <= self.threshold_value
         elif self.operator == 'EQ':
-            return current_value == self.threshold_value
+            return value == self.threshold_value
         elif self.operator == 'NEQ':
-            return current_value != self.threshold_value
+            return value != self.threshold_value
         
         return False
 
 
+def merge_counts(target, source):
+    """Сложить дневные вклады AlertStatistics.collect() (вложенные словари - по именам)"""
+    for field, value in source.items():
+        if isinstance(value, dict):
+            top = target.setdefault(field, {})
+            for name, count in value.items():
+                top[name] = top.get(name, 0) + count
+        else:
+            target[field] += value
+
+
 class AlertStatistics(models.Model):
-    """Статистика по алертам для дашборда"""
+    """
+    Дневные агрегаты по алертам для дашборда.
+    
+    Счетчики по severity и статусу относятся к алертам, созданным в этот
+    день; реакции и решения - к подтверждениям и решениям, сделанным в
+    этот день. Счетчики ведутся инкрементально (record_created,
+    record_transition); rebuild() пересчитывает диапазон дат группировкой.
+    Топ проектов и типов не хранится - top() считает его при чтении.
+    """
     
     date = models.DateField(unique=True)
     
@@ -620,6 +741,13 @@ class AlertStatistics(models.Model):
     resolved_count = models.IntegerField(default=0)
     dismissed_count = models.IntegerField(default=0)
     
+    # Создано, подтверждено и решено за день
+    created_count = models.IntegerField(default=0)
+    acknowledgements_count = models.IntegerField(default=0)
+    response_hours_sum = models.FloatField(default=0)
+    resolutions_count = models.IntegerField(default=0)
+    resolution_hours_sum = models.FloatField(default=0)
+    
     # Метрики производительности
     avg_response_time = models.FloatField(
         null=True,
@@ -632,21 +760,29 @@ class AlertStatistics(models.Model):
         help_text="Среднее время решения в часах"
     )
     
-    # Top алерты
-    top_projects = models.JSONField(
-        default=list,
-        blank=True,
-        help_text="Топ проектов по количеству алертов"
-    )
-    top_types = models.JSONField(
-        default=list,
-        blank=True,
-        help_text="Топ типов алертов"
-    )
-    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    STATUS_FIELDS = {
+        'NEW': 'new_count',
+        'ACKNOWLEDGED': 'acknowledged_count',
+        'RESOLVED': 'resolved_count',
+        'DISMISSED': 'dismissed_count',
+    }
+    
+    # (момент, счетчик, сумма часов) для времени реакции и решения
+    DURATION_FIELDS = (
+        ('acknowledged_at', 'acknowledgements_count', 'response_hours_sum'),
+        ('resolved_at', 'resolutions_count', 'resolution_hours_sum'),
+    )
+    AVERAGE_FIELDS = {
+        'acknowledgements_count': 'avg_response_time',
+        'resolutions_count': 'avg_resolution_time',
+    }
+    
+    # Флаг потока: при архивации удаление алертов не меняет счетчики
+    _pause = threading.local()
+    
     class Meta:
         ordering = ['-date']
         verbose_name = "Alert Statistics"
@@ -655,48 +791,527 @@ class AlertStatistics(models.Model):
     def __str__(self):
         return f"Alert Statistics for {self.date}"
     
+    @staticmethod
+    def _severity_field(severity):
+        return f"{severity.lower()}_count" if severity else None
+    
     @classmethod
-    def calculate_for_date(cls, date):
-        """Рассчитать статистику для указанной даты"""
-        from django.db.models import Count, Avg
-        
-        alerts = ProjectAlert.objects.filter(
-            created_at__date=date
+    @contextmanager
+    def paused(cls):
+        """Не вести инкрементальные счетчики внутри блока (текущий поток)"""
+        cls._pause.paused = True
+        try:
+            yield
+        finally:
+            cls._pause.paused = False
+    
+    @classmethod
+    def _increment(cls, day, changes):
+        """Атомарно изменить счетчики дня: changes = {поле: приращение}"""
+        changes = {field: delta for field, delta in changes.items() if field and delta}
+        if not changes or getattr(cls._pause, 'paused', False):
+            return
+        cls.objects.bulk_create([cls(date=day)], ignore_conflicts=True)
+        cls.objects.filter(date=day).update(
+            **{field: models.F(field) + delta for field, delta in changes.items()}
         )
+    
+    @classmethod
+    def record_created(cls, alerts):
+        """Учесть новые алерты (одно UPDATE на дату создания)"""
+        by_day = {}
+        for alert in alerts:
+            changes = by_day.setdefault(timezone.localdate(alert.created_at), {})
+            for field in ('created_count', cls._severity_field(alert.severity),
+                          cls.STATUS_FIELDS.get(alert.status)):
+                if field:
+                    changes[field] = changes.get(field, 0) + 1
+        for day, changes in by_day.items():
+            cls._increment(day, changes)
+    
+    @classmethod
+    def record_transitions(cls, transitions):
+        """
+        Учесть смены статуса и severity пачкой (одно UPDATE на дату создания).
         
-        stats, created = cls.objects.get_or_create(date=date)
+        transitions - (created_at, старый статус, старая severity, новый статус, новая severity).
+        """
+        by_day = {}
+        for created_at, old_status, old_severity, new_status, new_severity in transitions:
+            changes = by_day.setdefault(timezone.localdate(created_at), defaultdict(int))
+            if old_status != new_status:
+                changes[cls.STATUS_FIELDS.get(old_status)] -= 1
+                changes[cls.STATUS_FIELDS.get(new_status)] += 1
+            if old_severity != new_severity:
+                changes[cls._severity_field(old_severity)] -= 1
+                changes[cls._severity_field(new_severity)] += 1
+        for day, changes in by_day.items():
+            cls._increment(day, changes)
+    
+    @classmethod
+    def record_transition(cls, alert, old_status, old_severity):
+        """Учесть смену статуса или severity сохраненного алерта"""
+        cls.record_transitions([(alert.created_at, old_status, old_severity, alert.status, alert.severity)])
         
-        # Подсчет по severity
-        severity_counts = alerts.values('severity').annotate(count=Count('id'))
-        for item in severity_counts:
-            setattr(stats, f"{item['severity'].lower()}_count", item['count'])
+        if old_status == alert.status:
+            return
+        if alert.status == 'ACKNOWLEDGED' and old_status == 'NEW' and alert.acknowledged_at:
+            cls._record_duration(
+                timezone.localdate(alert.acknowledged_at), 'acknowledgements_count', 'response_hours_sum',
+                'avg_response_time', alert.acknowledged_at - alert.created_at,
+            )
+        if alert.status == 'RESOLVED' and alert.resolved_at:
+            cls._record_duration(
+                timezone.localdate(alert.resolved_at), 'resolutions_count', 'resolution_hours_sum',
+                'avg_resolution_time', alert.resolved_at - alert.created_at,
+            )
+    
+    @classmethod
+    def record_deleted(cls, alert, status, severity):
+        """Убрать удаленный алерт из счетчиков"""
+        cls._increment(timezone.localdate(alert.created_at), {
+            'created_count': -1,
+            cls._severity_field(severity): -1,
+            cls.STATUS_FIELDS.get(status): -1,
+        })
+        if alert.acknowledged_at:
+            cls._record_duration(
+                timezone.localdate(alert.acknowledged_at), 'acknowledgements_count', 'response_hours_sum',
+                'avg_response_time', alert.acknowledged_at - alert.created_at, sign=-1,
+            )
+        if alert.resolved_at:
+            cls._record_duration(
+                timezone.localdate(alert.resolved_at), 'resolutions_count', 'resolution_hours_sum',
+                'avg_resolution_time', alert.resolved_at - alert.created_at, sign=-1,
+            )
+    
+    @classmethod
+    def _record_duration(cls, day, count_field, sum_field, avg_field, duration, sign=1):
+        if getattr(cls._pause, 'paused', False):
+            return
+        hours = sign * max(duration.total_seconds(), 0) / 3600
+        cls.objects.bulk_create([cls(date=day)], ignore_conflicts=True)
+        # Правая часть UPDATE видит значения до изменения
+        cls.objects.filter(date=day).update(**{
+            count_field: models.F(count_field) + sign,
+            sum_field: models.F(sum_field) + hours,
+            avg_field: models.Case(
+                models.When(**{f'{count_field}__lte': -sign}, then=models.Value(None)),
+                default=(models.F(sum_field) + hours) / (models.F(count_field) + sign),
+                output_field=models.FloatField(),
+            ),
+        })
+    
+    @classmethod
+    def collect(cls, alerts, start=None, end=None):
+        """
+        Дневные вклады набора алертов группировкой по TruncDate.
+        
+        Возвращает {дата: {поле: значение}}; 'top_projects' и 'top_types' -
+        словари {имя: количество}. start/end ограничивают даты.
+        """
+        from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+        from django.db.models.functions import TruncDate
         
-        # Подсчет по статусу  
-        status_counts = alerts.values('status').annotate(count=Count('id'))
-        for item in status_counts:
-            setattr(stats, f"{item['status'].lower()}_count", item['count'])
+        def in_range(moment_field):
+            if start is None:
+                return alerts.filter(**{f'{moment_field}__isnull': False})
+            return alerts.filter(**{f'{moment_field}__date__range': (start, end)})
         
-        # Средние времена
-        resolved_alerts = alerts.filter(resolved_at__isnull=False)
-        if resolved_alerts.exists():
-            times = []
-            for alert in resolved_alerts:
-                if alert.resolution_time_hours:
-                    times.append(alert.resolution_time_hours)
-            if times:
-                stats.avg_resolution_time = sum(times) / len(times)
+        counts = defaultdict(lambda: defaultdict(int))
         
-        # Top проекты
-        top_projects = alerts.values('project__name').annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
-        stats.top_projects = list(top_projects)
+        created = in_range('created_at').annotate(day=TruncDate('created_at'))
+        for row in created.values('day', 'severity', 'status').annotate(count=Count('id')).order_by():
+            day = counts[row['day']]
+            day['created_count'] += row['count']
+            day[cls._severity_field(row['severity'])] += row['count']
+            status_field = cls.STATUS_FIELDS.get(row['status'])
+            if status_field:
+                day[status_field] += row['count']
         
-        # Top типы
-        top_types = alerts.values('alert_type__name').annotate(
-            count=Count('id')
-        ).order_by('-count')[:5]
-        stats.top_types = list(top_types)
+        for moment_field, count_field, sum_field in cls.DURATION_FIELDS:
+            rows = in_range(moment_field).annotate(day=TruncDate(moment_field)).values('day').annotate(
+                count=Count('id'),
+                total=Sum(ExpressionWrapper(F(moment_field) - F('created_at'), output_field=DurationField())),
+            ).order_by()
+            for row in rows:
+                day = counts[row['day']]
+                day[count_field] += row['count']
+                day[sum_field] += row['total'].total_seconds() / 3600 if row['total'] else 0
         
-        stats.save()
-        return stats
\ No newline at end of file
+        for name_field, target in (('project__name', 'top_projects'), ('alert_type__name', 'top_types')):
+            for row in created.values('day', name_field).annotate(count=Count('id')).order_by():
+                top = counts[row['day']].setdefault(target, {})
+                top[row[name_field]] = top.get(row[name_field], 0) + row['count']
+        return counts
+    
+    @classmethod
+    def rebuild(cls, start, end):
+        """
+        Пересчитать агрегаты за [start, end]; вернуть строки.
+        
+        Живые алерты считаются collect(), архивированные (AlertArchive) -
+        по сохраненным при архивации дневным вкладам.
+        """
+        counts = cls.collect(ProjectAlert.objects.all(), start, end)
+        archives = AlertArchive.objects.filter(span_start__lte=end, span_end__gte=start).only('daily_counts')
+        for archive in archives:
+            for day, archived in archive.daily_counts.items():
+                day = date.fromisoformat(day)
+                if start <= day <= end:
+                    merge_counts(counts[day], archived)
+        
+        days = {}
+        day = start
+        while day <= end:
+            stats = cls(date=day)
+            for field, value in counts.get(day, {}).items():
+                if field in ('top_projects', 'top_types'):
+                    continue
+                setattr(stats, field, value)
+            for _, count_field, sum_field in cls.DURATION_FIELDS:
+                count = getattr(stats, count_field)
+                setattr(stats, cls.AVERAGE_FIELDS[count_field], getattr(stats, sum_field) / count if count else None)
+            days[day] = stats
+            day += timedelta(days=1)
+        
+        existing = {stats.date: stats for stats in cls.objects.filter(date__range=(start, end))}
+        fields = [
+            field.name for field in cls._meta.concrete_fields
+            if field.name not in ('id', 'date', 'created_at')
+        ]
+        to_update = []
+        for day, stats in days.items():
+            if day in existing:
+                stats.pk = existing[day].pk
+                stats.created_at = existing[day].created_at
+                stats.updated_at = timezone.now()
+                to_update.append(stats)
+        with transaction.atomic():
+            cls.objects.bulk_update(to_update, fields, batch_size=200)
+            cls.objects.bulk_create([stats for day, stats in days.items() if day not in existing])
+        return [days[day] for day in sorted(days)]
+    
+    @classmethod
+    def top(cls, start, end, limit=10):
+        """
+        Топ проектов и типов по созданным за [start, end] алертам.
+        
+        Считается при чтении: живые алерты - группировкой, архивированные -
+        по дневным вкладам AlertArchive. Возвращает {'top_projects': [...],
+        'top_types': [...]}, элементы - {имя поля: имя, 'count': количество}.
+        """
+        from django.db.models import Count
+        
+        created = ProjectAlert.objects.filter(created_at__date__range=(start, end))
+        result = {}
+        for target, name_field in (('top_projects', 'project__name'), ('top_types', 'alert_type__name')):
+            totals = defaultdict(int)
+            for row in created.values(name_field).annotate(count=Count('id')).order_by():
+                totals[row[name_field]] += row['count']
+            result[target] = totals
+        
+        archives = AlertArchive.objects.filter(span_start__lte=end, span_end__gte=start).only('daily_counts')
+        for archive in archives:
+            for day, archived in archive.daily_counts.items():
+                if start <= date.fromisoformat(day) <= end:
+                    for target, totals in result.items():
+                        for name, count in archived.get(target, {}).items():
+                            totals[name] += count
+        
+        return {
+            target: [
+                {name_field: name, 'count': count}
+                for name, count in sorted(result[target].items(), key=lambda item: (-item[1], item[0]))[:limit]
+            ]
+            for target, name_field in (('top_projects', 'project__name'), ('top_types', 'alert_type__name'))
+        }
+    
+    @classmethod
+    def calculate_for_date(cls, date):
+        """Рассчитать статистику для указанной даты"""
+        return cls.rebuild(date, date)[0]
+
+
+class LeaseLost(Exception):
+    """Блокировка прохода перехвачена другим процессом"""
+
+
+class SweepLock(models.Model):
+    """
+    Lease-блокировка и чекпоинт периодических проходов (check_alerts).
+
+    Блокировку держит один процесс до истечения lease; каждый чекпоинт
+    (пачка обработанных проектов) продлевает lease и сохраняет прогресс. Если проход упал, статус
+    остается RUNNING и следующий запуск продолжает с last_project_id.
+    """
+
+    STATUS_CHOICES = [
+        ('IDLE', 'Idle'),
+        ('RUNNING', 'Running'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IDLE')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    # Чекпоинт текущего прохода
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_project_id = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text="ID последнего полностью обработанного проекта"
+    )
+    projects_done = models.IntegerField(default=0)
+    last_completed_at = models.DateTimeField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Sweep Lock"
+        verbose_name_plural = "Sweep Locks"
+
+    def __str__(self):
+        return f"{self.name} ({self.status}, owner: {self.owner or '-'})"
+
+    @classmethod
+    def acquire(cls, name, owner, ttl_seconds=600):
+        """Захватить lease; None если блокировку держит другой живой процесс"""
+        from django.db import IntegrityError
+        from django.db.models import Q
+
+        try:
+            cls.objects.get_or_create(name=name)
+        except IntegrityError:
+            pass  # создал параллельный процесс
+
+        now = timezone.now()
+        taken = cls.objects.filter(name=name).filter(
+            Q(lease_expires_at__isnull=True) |
+            Q(lease_expires_at__lt=now) |
+            Q(owner=owner)
+        ).update(
+            owner=owner,
+            lease_expires_at=now + timedelta(seconds=ttl_seconds),
+            heartbeat_at=now,
+        )
+        if not taken:
+            return None
+
+        lock = cls.objects.get(name=name)
+        lock.ttl_seconds = ttl_seconds
+        return lock
+
+    @property
+    def resume_after(self):
+        """ID проекта, после которого продолжать прерванный проход"""
+        if self.status == 'RUNNING':
+            return self.last_project_id
+        return None
+
+    def start(self, restart=False):
+        """Начать проход (или продолжить прерванный, если restart=False)"""
+        if self.status == 'RUNNING' and not restart:
+            return
+        self.status = 'RUNNING'
+        self.started_at = timezone.now()
+        self.last_project_id = None
+        self.projects_done = 0
+        self.save(update_fields=['status', 'started_at', 'last_project_id', 'projects_done', 'updated_at'])
+
+    def checkpoint(self, project_id, count=1):
+        """Сохранить прогресс и продлить lease; LeaseLost если lease уже чужой"""
+        now = timezone.now()
+        updated = SweepLock.objects.filter(pk=self.pk, owner=self.owner).update(
+            last_project_id=project_id,
+            projects_done=models.F('projects_done') + count,
+            lease_expires_at=now + timedelta(seconds=getattr(self, 'ttl_seconds', 600)),
+            heartbeat_at=now,
+        )
+        if not updated:
+            raise LeaseLost(f"Lease for {self.name} was taken over by another process")
+        self.last_project_id = project_id
+
+    def renew(self):
+        """Продлить lease без чекпоинта; LeaseLost если lease уже чужой"""
+        now = timezone.now()
+        updated = SweepLock.objects.filter(pk=self.pk, owner=self.owner).update(
+            lease_expires_at=now + timedelta(seconds=getattr(self, 'ttl_seconds', 600)),
+            heartbeat_at=now,
+        )
+        if not updated:
+            raise LeaseLost(f"Lease for {self.name} was taken over by another process")
+
+    def release(self, completed=True):
+        """Освободить lease; при completed=False чекпоинт сохраняется для продолжения"""
+        fields = {'owner': '', 'lease_expires_at': None}
+        if completed:
+            fields.update(
+                status='IDLE',
+                last_project_id=None,
+                last_completed_at=timezone.now(),
+            )
+        SweepLock.objects.filter(pk=self.pk, owner=self.owner).update(**fields)
+
+
+class NotificationOutbox(models.Model):
+    """
+    Очередь исходящих уведомлений об алертах.
+
+    create_alert только записывает сюда сообщения; отправляет их команда
+    deliver_notifications пакетами через одно SMTP-соединение, с повторами
+    и dead-letter после исчерпания попыток.
+
+    Для пользователей с email_frequency HOURLY/DAILY/WEEKLY next_attempt_at -
+    время ближайшего дайджеста; все записи окна уходят одним письмом.
+    """
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('DEAD', 'Dead letter'),
+    ]
+
+    CHANNEL_CHOICES = [
+        ('EMAIL', 'Email'),
+    ]
+
+    alert = models.ForeignKey(
+        ProjectAlert,
+        on_delete=models.CASCADE,
+        related_name='notifications'
+    )
+    user = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES, default='EMAIL')
+    frequency = models.CharField(
+        max_length=20,
+        default='IMMEDIATE',
+        help_text="IMMEDIATE - отдельное письмо, HOURLY/DAILY/WEEKLY - в дайджест"
+    )
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=300)
+    body = models.TextField()
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        verbose_name = "Notification"
+        verbose_name_plural = "Notification Outbox"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient}: {self.subject} ({self.status})"
+
+
+class AlertThrottle(models.Model):
+    """
+    Token bucket алертов одного типа по проекту (подавление штормов).
+
+    Каждый записанный повтор открытого алерта забирает токен; токены
+    восстанавливаются со скоростью REFILL_PER_HOUR до BUCKET_CAPACITY.
+    Без токена событие только увеличивает счетчики (suppressed_count).
+    """
+
+    project = models.ForeignKey(
+        'investments.Project',
+        on_delete=models.CASCADE,
+        related_name='alert_throttles'
+    )
+    alert_type = models.ForeignKey(
+        AlertType,
+        on_delete=models.CASCADE,
+        related_name='throttles'
+    )
+    tokens = models.FloatField(default=0)
+    refilled_at = models.DateTimeField(default=timezone.now)
+    suppressed_count = models.IntegerField(
+        default=0,
+        help_text="Подавлено событий за все время"
+    )
+    last_suppressed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Alert Throttle"
+        verbose_name_plural = "Alert Throttles"
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'alert_type'], name='unique_alert_throttle'),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id}/{self.alert_type_id}: {self.tokens:.1f} tokens, {self.suppressed_count} suppressed"
+
+    def take(self, now, capacity, refill_per_hour):
+        """Восстановить токены на момент now и забрать один; False - токенов нет"""
+        elapsed_hours = max((now - self.refilled_at).total_seconds(), 0) / 3600
+        self.tokens = min(capacity, self.tokens + elapsed_hours * refill_per_hour)
+        self.refilled_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.suppressed_count += 1
+        self.last_suppressed_at = now
+        return False
+
+
+class AlertArchive(models.Model):
+    """
+    Архив решенных и отклоненных алертов: сжатый JSON Lines за месяц.
+
+    Каждая строка blob - алерт со списком его AlertLog в ключе 'logs'.
+    Один проход archive_alerts пишет по сегменту на месяц создания
+    алертов; daily_counts хранит их вклад в AlertStatistics, чтобы
+    пересчет статистики учитывал архивированные алерты.
+    """
+
+    month = models.DateField(db_index=True, help_text="Первое число месяца создания алертов")
+    span_start = models.DateField(help_text="Первая дата в daily_counts")
+    span_end = models.DateField(help_text="Последняя дата в daily_counts")
+    alert_count = models.IntegerField(default=0)
+    log_count = models.IntegerField(default=0)
+    first_alert_id = models.IntegerField()
+    last_alert_id = models.IntegerField()
+    data = models.BinaryField(help_text="gzip JSON Lines")
+    daily_counts = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['month', 'id']
+        verbose_name = "Alert Archive"
+        verbose_name_plural = "Alert Archives"
+        indexes = [
+            models.Index(fields=['span_start', 'span_end']),
+        ]
+
+    def __str__(self):
+        return f"Alerts {self.month:%Y-%m}: {self.alert_count} alerts, {self.log_count} logs"
+
+    @staticmethod
+    def pack(records):
+        """Сжать записи в gzip JSON Lines"""
+        from django.core.serializers.json import DjangoJSONEncoder
+
+        lines = (json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) for record in records)
+        return gzip.compress('\n'.join(lines).encode('utf-8'))
+
+    def records(self):
+        """Архивированные алерты (словари с ключом 'logs')"""
+        for line in gzip.decompress(bytes(self.data)).decode('utf-8').splitlines():
+            yield json.loads(line)
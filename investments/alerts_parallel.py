@@ -0,0 +1,59 @@
+# investments/alerts_parallel.py
+"""
+Параллельная оценка проверок алертов в пуле процессов (check_alerts --workers N).
+
+Родительский процесс загружает контексты проектов (ProjectEvaluationContext)
+и раздает их воркерам. Воркеры только считают и возвращают срабатывания,
+не обращаясь к БД; алерты создает родитель одной транзакцией.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _init_worker():
+    """Инициализация воркера (нужна при spawn/forkserver)"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tracker.settings')
+        django.setup()
+
+
+def evaluate_shard(contexts, check_types=None):
+    """Оценить часть проектов в воркере"""
+    from .alerts import AlertManager
+
+    manager = AlertManager()
+    started = time.perf_counter()
+    results = []
+    for ctx in contexts:
+        findings, errors = manager.evaluate_project(ctx, check_types)
+        results.append((ctx.project_id, findings, errors))
+    return {
+        'worker': os.getpid(),
+        'projects': len(contexts),
+        'elapsed': time.perf_counter() - started,
+        'results': results,
+    }
+
+
+def shard_contexts(contexts, shards):
+    """Разбить контексты на shards частей, выравнивая по числу транзакций"""
+    buckets = [[] for _ in range(shards)]
+    loads = [0] * shards
+    for ctx in sorted(contexts, key=lambda c: len(c.transactions), reverse=True):
+        index = loads.index(min(loads))
+        buckets[index].append(ctx)
+        loads[index] += len(ctx.transactions) + 1
+    return [bucket for bucket in buckets if bucket]
+
+
+def evaluate_parallel(contexts, check_types=None, workers=2):
+    """Оценить контексты в пуле из workers процессов; список результатов по шардам"""
+    shards = shard_contexts(list(contexts), workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(evaluate_shard, shard, check_types) for shard in shards]
+        return [future.result() for future in futures]
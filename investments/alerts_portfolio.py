@@ -0,0 +1,119 @@
+# investments/alerts_portfolio.py
+"""
+Данные для портфельных проверок AlertManager (PORTFOLIO_CHECKS).
+
+Проверки идут по всему набору проектов сразу, а не по одному:
+
+    NO_UPDATE       - давность последней транзакции (Max по transactions)
+    PORTFOLIO_RISK  - концентрация NAV: индекс Херфиндаля (HHI) и доля
+                      крупнейшей позиции
+    TARGET_MISS     - IRR, нужный на оставшийся горизонт, чтобы выйти на
+                      целевой за весь срок (из текущего IRR)
+    SHARPE_DECLINE  - скользящий Sharpe по отметкам NAV
+                      (nav_analytics.rolling_sharpe)
+
+Строки проектов (последняя транзакция, первая дата, NAV в USD по последней
+отметке) читаются одним запросом, транзакции для Sharpe - одним запросом
+ProjectEvaluationContext.load_many (или берутся уже загруженные контексты).
+"""
+
+from datetime import date
+from functools import cached_property
+
+from django.conf import settings
+from django.db.models import F, FloatField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Project, Transaction
+
+
+def get_config():
+    config = {
+        # Дней без транзакций: severity -> порог
+        'NO_UPDATE_DAYS': {'MEDIUM': 90, 'HIGH': 180},
+        'MAX_HHI': 0.25,
+        'MAX_POSITION_SHARE': 0.4,
+        'MIN_POSITIONS': 3,
+        'SHARPE_WINDOW': 4,
+        'SHARPE_MIN_DROP': 0.5,
+        # Горизонт проекта без end_date, лет от начала
+        'TARGET_HORIZON_YEARS': 7,
+        # Превышение нужного IRR над целевым: severity -> порог
+        'TARGET_MISS_MARGIN': {'MEDIUM': 0.03, 'HIGH': 0.10},
+    }
+    config.update(getattr(settings, 'ALERT_PORTFOLIO', {}))
+    return config
+
+
+def latest_nav_usd():
+    """Подзапрос: NAV последней отметки проекта в USD"""
+    return Subquery(
+        Transaction.objects.filter(project=OuterRef('pk'), nav__isnull=False)
+        .order_by('-date', '-id')
+        .annotate(nav_usd=F('nav') * Coalesce('x_rate', Value(1.0)))
+        .values('nav_usd')[:1],
+        output_field=FloatField(),
+    )
+
+
+def concentration(navs):
+    """(HHI, доли позиций) по массиву NAV; отрицательные NAV не учитываются"""
+    import numpy as np
+
+    navs = np.clip(np.asarray(navs, dtype=np.float64), 0, None)
+    total = navs.sum()
+    if total <= 0:
+        return None, np.zeros_like(navs)
+    shares = navs / total
+    return float(np.square(shares).sum()), shares
+
+
+def required_irr(irr, target, elapsed_years, horizon_years):
+    """
+    IRR на оставшийся срок, при котором весь горизонт дает target:
+    (1 + target)^T = (1 + irr)^t * (1 + r)^(T - t). NaN - срок вышел.
+    """
+    import numpy as np
+
+    irr = np.clip(np.asarray(irr, dtype=np.float64), -0.99, None)
+    target = np.asarray(target, dtype=np.float64)
+    elapsed = np.asarray(elapsed_years, dtype=np.float64)
+    horizon = np.asarray(horizon_years, dtype=np.float64)
+    remaining = horizon - elapsed
+
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        log_growth = horizon * np.log1p(target) - elapsed * np.log1p(irr)
+        required = np.expm1(np.divide(log_growth, remaining, out=np.full_like(remaining, np.nan), where=remaining > 0))
+    return required
+
+
+class PortfolioSnapshot:
+    """Данные набора проектов для портфельных проверок"""
+
+    def __init__(self, projects, contexts=None, today=None):
+        self.projects = list(projects)
+        self.project_ids = [project.id for project in self.projects]
+        self._contexts = contexts
+        self.today = today or date.today()
+        self.config = get_config()
+
+    @cached_property
+    def rows(self):
+        """{project_id: строка} - один запрос"""
+        queryset = Project.objects.filter(id__in=self.project_ids).annotate(
+            last_transaction=Max('transactions__date'),
+            first_transaction=Min('transactions__date'),
+            nav_usd=Coalesce(latest_nav_usd(), F('nav'), Value(0.0)),
+        ).values(
+            'id', 'name', 'status', 'irr', 'target_irr', 'start_date', 'end_date',
+            'last_transaction', 'first_transaction', 'nav_usd',
+        )
+        return {row['id']: row for row in queryset}
+
+    @property
+    def contexts(self):
+        """Контексты оценки (загружаются одним запросом, если не переданы)"""
+        if self._contexts is None:
+            from .alerts_context import ProjectEvaluationContext
+            self._contexts = ProjectEvaluationContext.load_many(self.projects)
+        return self._contexts
@@ -0,0 +1,120 @@
+# investments/alerts_retention.py
+"""
+Политика хранения алертов.
+
+Решенные и отклоненные алерты старше DAYS дней (по resolved_at, для
+отклоненных - по updated_at) вместе с их AlertLog переносятся в
+AlertArchive - сжатые JSON Lines по месяцам создания - и удаляются из
+рабочих таблиц. Вклад алертов в AlertStatistics сохраняется в архиве,
+счетчики дней не меняются.
+
+Перенос идет пачками по CHUNK_SIZE алертов, каждая - в своей транзакции:
+прерванный проход просто продолжается следующим запуском.
+Алерты с неотправленными уведомлениями не архивируются.
+
+Группа шторма (корень и его child_alerts) архивируется целиком и только
+когда закрыты все ее члены: иначе удаление корня (parent_alert,
+SET_NULL) сделало бы открытые дочерние алерты самостоятельными.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .alerts_models import (
+    AlertArchive, AlertLog, AlertStatistics, NotificationOutbox, ProjectAlert,
+    bump_alerts_version,
+)
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+ARCHIVED_STATUSES = ('RESOLVED', 'DISMISSED')
+
+
+def get_config():
+    config = {
+        'DAYS': 180,
+        'CHUNK_SIZE': 500,
+    }
+    config.update(getattr(settings, 'ALERT_RETENTION', {}))
+    return config
+
+
+def archivable_alerts(days=None, now=None):
+    """Корни групп, подлежащих архивации, в порядке id"""
+    days = get_config()['DAYS'] if days is None else days
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    pending = NotificationOutbox.objects.filter(status__in=['PENDING', 'SENDING']).values('alert_id')
+    # Группы с открытыми или ожидающими уведомления членами ждут
+    blocked = ProjectAlert.objects.filter(parent_alert__isnull=False).filter(
+        Q(status__in=ProjectAlert.OPEN_STATUSES) | Q(id__in=pending)
+    ).values('parent_alert_id')
+    return ProjectAlert.objects.filter(status__in=ARCHIVED_STATUSES, parent_alert__isnull=True).annotate(
+        closed_at=Coalesce('resolved_at', 'updated_at')
+    ).filter(closed_at__lt=cutoff).exclude(id__in=pending).exclude(id__in=blocked).order_by('id')
+
+
+def group_members(root_ids):
+    """Корни вместе с их дочерними алертами"""
+    return ProjectAlert.objects.filter(Q(id__in=root_ids) | Q(parent_alert_id__in=root_ids))
+
+
+def _alert_records(alert_ids):
+    """Алерты со вложенными логами как словари для JSON"""
+    fields = [field.attname for field in ProjectAlert._meta.concrete_fields]
+    alerts = list(ProjectAlert.objects.filter(id__in=alert_ids).values(
+        *fields, project_name=F('project__name'), alert_type_code=F('alert_type__code'),
+    ).order_by('id'))
+
+    logs = defaultdict(list)
+    log_fields = [field.attname for field in AlertLog._meta.concrete_fields]
+    for log in AlertLog.objects.filter(alert_id__in=alert_ids).values(*log_fields).order_by('id'):
+        logs[log['alert_id']].append(log)
+    for alert in alerts:
+        alert['logs'] = logs.get(alert['id'], [])
+    return alerts
+
+
+def archive_chunk(alert_ids):
+    """
+    Перенести корни (archivable_alerts) вместе с дочерними алертами в архив
+    одной транзакцией; вернуть (алерты, логи, сегменты)
+    """
+    with transaction.atomic():
+        records = _alert_records(list(group_members(alert_ids).values_list('id', flat=True)))
+        by_month = defaultdict(list)
+        for record in records:
+            by_month[timezone.localdate(record['created_at']).replace(day=1)].append(record)
+
+        archives = []
+        for month, month_records in sorted(by_month.items()):
+            ids = [record['id'] for record in month_records]
+            counts = AlertStatistics.collect(ProjectAlert.objects.filter(id__in=ids))
+            archives.append(AlertArchive(
+                month=month,
+                span_start=min(counts),
+                span_end=max(counts),
+                alert_count=len(month_records),
+                log_count=sum(len(record['logs']) for record in month_records),
+                first_alert_id=ids[0],
+                last_alert_id=ids[-1],
+                data=AlertArchive.pack(month_records),
+                daily_counts={day.isoformat(): dict(values) for day, values in counts.items()},
+            ))
+        AlertArchive.objects.bulk_create(archives)
+
+        ids = [record['id'] for record in records]
+        with AlertStatistics.paused():
+            logs_deleted, _ = AlertLog.objects.filter(alert_id__in=ids).delete()
+            ProjectAlert.objects.filter(id__in=ids).delete()
+    bump_alerts_version()
+
+    log_count = sum(archive.log_count for archive in archives)
+    logger.info("alert_retention.chunk", alerts=len(records), logs=log_count, segments=len(archives))
+    return len(records), log_count, len(archives)
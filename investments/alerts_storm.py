@@ -0,0 +1,115 @@
+# investments/alerts_storm.py
+"""
+Подавление штормов алертов.
+
+Отпечаток алерта - (проект, тип, полоса severity), а не заголовок:
+заголовки содержат меняющиеся числа ("NAV упал на 7.3%"). Событие с
+отпечатком открытого корневого алерта группируется под ним:
+
+    токен есть   -> дочерний алерт (parent_alert) в статусе GROUPED,
+                    без уведомления
+    токена нет   -> только счетчики (recurrence_count корня,
+                    AlertThrottle.suppressed_count)
+
+Токены ведутся по (проект, тип алерта) в AlertThrottle: BUCKET_CAPACITY
+штук, восстанавливаются по REFILL_PER_HOUR в час. Корень группы
+открыт для новых событий, пока последнее событие было не раньше
+GROUP_WINDOW_HOURS назад.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .alerts_models import AlertThrottle, ProjectAlert
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+SEVERITY_BANDS = {
+    'CRITICAL': 'HIGH',
+    'HIGH': 'HIGH',
+    'MEDIUM': 'MEDIUM',
+    'LOW': 'LOW',
+    'INFO': 'LOW',
+}
+
+OPEN_STATUSES = ProjectAlert.OPEN_STATUSES
+
+
+def get_config():
+    config = {
+        'BUCKET_CAPACITY': 3,
+        'REFILL_PER_HOUR': 1.0,
+        'GROUP_WINDOW_HOURS': 24,
+    }
+    config.update(getattr(settings, 'ALERT_STORMS', {}))
+    return config
+
+
+def fingerprint(project_id, alert_type_id, severity):
+    return (project_id, alert_type_id, SEVERITY_BANDS.get(severity, severity))
+
+
+def open_group_roots(project_ids=None, now=None):
+    """Открытые корневые алерты с недавними событиями: {отпечаток: алерт}"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=get_config()['GROUP_WINDOW_HOURS'])
+    roots = ProjectAlert.objects.filter(
+        Q(created_at__gte=cutoff) | Q(last_occurrence__gte=cutoff),
+        status__in=OPEN_STATUSES,
+        parent_alert__isnull=True,
+    ).order_by('created_at', 'id')
+    if project_ids is not None:
+        roots = roots.filter(project_id__in=project_ids)
+    # При нескольких совпадениях остается самый новый
+    return {fingerprint(root.project_id, root.alert_type_id, root.severity): root for root in roots}
+
+
+class StormGuard:
+    """Token buckets AlertThrottle одного прохода: загрузка разом, запись в save()"""
+
+    def __init__(self, project_ids=None):
+        config = get_config()
+        self.capacity = config['BUCKET_CAPACITY']
+        self.refill_per_hour = config['REFILL_PER_HOUR']
+
+        throttles = AlertThrottle.objects.all()
+        if project_ids is not None:
+            throttles = throttles.filter(project_id__in=project_ids)
+        self.buckets = {(throttle.project_id, throttle.alert_type_id): throttle for throttle in throttles}
+        self.changed = {}
+        self.suppressed = 0
+
+    def allow(self, project_id, alert_type_id, now=None):
+        """Забрать токен для записи повтора; False - событие подавлено"""
+        now = now or timezone.now()
+        key = (project_id, alert_type_id)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = AlertThrottle(
+                project_id=project_id, alert_type_id=alert_type_id,
+                tokens=self.capacity, refilled_at=now,
+            )
+            self.buckets[key] = bucket
+        self.changed[key] = bucket
+
+        allowed = bucket.take(now, self.capacity, self.refill_per_hour)
+        if not allowed:
+            self.suppressed += 1
+        return allowed
+
+    def save(self):
+        """Записать измененные buckets (вызывается внутри транзакции flush)"""
+        changed = list(self.changed.values())
+        self.changed = {}
+        if not changed:
+            return
+        fields = ['tokens', 'refilled_at', 'suppressed_count', 'last_suppressed_at']
+        AlertThrottle.objects.bulk_update([bucket for bucket in changed if bucket.pk], fields)
+        AlertThrottle.objects.bulk_create([bucket for bucket in changed if not bucket.pk])
+        if self.suppressed:
+            logger.info("alert_storm.suppressed", events=self.suppressed, buckets=len(changed))
+            self.suppressed = 0
@@ -11,6 +11,7 @@ urlpatterns = [
     path('projects/<int:pk>/', views.ProjectDetailView.as_view(), name='project-detail'),
     # ЗАКОММЕНТИРУЕМ эту строку пока не добавим функцию в views.py
     path('projects/<int:project_id>/detail/', views.project_detail_api, name='project-detail-api'),
+    path('projects/<int:project_id>/nav-analytics/', views.project_nav_analytics, name='project-nav-analytics'),
     path('projects/create/', views.create_project, name='project-create'),
     
     # Транзакции
@@ -19,6 +20,7 @@ urlpatterns = [
     
     # Портфель
     path('portfolio/summary/', views.portfolio_summary, name='portfolio-summary'),
+    path('portfolio/nav-analytics/', views.portfolio_nav_analytics, name='portfolio-nav-analytics'),
     
     # Аналитика
     path('analytics/', views.analytics_view, name='analytics'),
@@ -5,8 +5,13 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from ..alerts_context import ProjectEvaluationContext
 from ..models import Project, Transaction
+from ..nav_analytics import analyze_many, drawdown_series, summarize
 from .serializers import ProjectSerializer, TransactionSerializer
+from ..structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 
 class ProjectListCreateView(generics.ListCreateAPIView):
@@ -58,12 +63,12 @@ def portfolio_summary(request):
                 portfolio_mirr = calculated_mirr
             else:
                 portfolio_mirr = 0
-                print("mIRR calculation returned None")
+                logger.debug("portfolio_summary.mirr_none")
         except Exception as e:
-            print(f"Error calculating mIRR: {e}")
+            logger.warning("portfolio_summary.mirr_error", error=str(e))
             portfolio_mirr = 0
     else:
-        print("metrics.py not found, using default mIRR")
+        logger.warning("portfolio_summary.metrics_unavailable")
         portfolio_mirr = 0
     
     # ✅ НОВОЕ: Расчет Portfolio DPI (Distributed to Paid-In)
@@ -85,7 +90,7 @@ def portfolio_summary(request):
             total_nav_active = sum(p.get_nav() or 0 for p in projects if p.status == 'active')
             portfolio_rvpi = round(total_nav_active / total_invested, 2) if total_invested > 0 else 0
     except Exception as e:
-        print(f"Error calculating RVPI: {e}")
+        logger.warning("portfolio_summary.rvpi_error", error=str(e))
         # Fallback расчет
         total_nav_active = sum(p.get_nav() or 0 for p in projects if p.status == 'active')
         portfolio_rvpi = round(total_nav_active / total_invested, 2) if total_invested > 0 else 0
@@ -116,8 +121,11 @@ def portfolio_summary(request):
     }
     
     # Логирование для отладки
-    print(f"[API] Portfolio metrics: DPI={portfolio_dpi}, RVPI={portfolio_rvpi} ({rvpi_color}), TVPI={portfolio_tvpi}")
-    print(f"[API] Check formula: TVPI ({portfolio_tvpi}) = DPI ({portfolio_dpi}) + RVPI ({portfolio_rvpi}) = {portfolio_dpi + portfolio_rvpi}")
+    logger.debug(
+        "portfolio_summary.metrics",
+        dpi=portfolio_dpi, rvpi=portfolio_rvpi, rvpi_color=rvpi_color, tvpi=portfolio_tvpi,
+        formula_check=round(portfolio_dpi + portfolio_rvpi, 4),
+    )
     
     return Response(data)
 
@@ -160,6 +168,30 @@ def project_detail_api(request, project_id):
     return Response(data)
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def project_nav_analytics(request, project_id):
+    """NAV changes over 1/7/30/90 days and drawdown statistics for one project"""
+    project = get_object_or_404(Project, id=project_id)
+    ctx = ProjectEvaluationContext.load(project)
+    data = summarize(ctx)
+    if request.query_params.get('series'):
+        data['drawdown_series'] = drawdown_series(ctx.value_series)
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def portfolio_nav_analytics(request):
+    """NAV changes and drawdowns for all active projects in one pass"""
+    projects = list(Project.objects.filter(status='active').order_by('name'))
+    analytics = analyze_many(projects)
+    return Response([
+        {'project_id': project.id, 'project': project.name, **analytics[project.id]}
+        for project in projects
+    ])
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def create_project(request):
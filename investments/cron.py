@@ -0,0 +1,159 @@
+# investments/cron.py
+"""
+Разбор cron-выражений (AlertRule.check_schedule).
+
+Поддерживается стандартный формат из 5 полей:
+
+    минута час день-месяца месяц день-недели
+
+со значениями *, N, A-B, */S, A-B/S, списками через запятую, именами
+месяцев и дней (jan, mon) и сокращениями @hourly, @daily, @weekly,
+@monthly, @yearly. Если ограничены и день месяца, и день недели,
+срабатывание по любому из них (как в классическом cron).
+
+Время перебирается по часам стены moment (timezone.localtime). При
+переводе часов вперед несуществующее время срабатывает после перевода;
+результат всегда позже moment и в абсолютном времени, в том числе во
+втором проходе повторяющегося часа при переводе назад.
+"""
+
+from datetime import timedelta
+from functools import lru_cache
+
+ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+MONTH_NAMES = {name: number for number, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1
+)}
+DAY_NAMES = {name: number for number, name in enumerate(
+    ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+)}
+
+# (минимум, максимум, имена) для каждого поля
+FIELDS = (
+    (0, 59, None),
+    (0, 23, None),
+    (1, 31, None),
+    (1, 12, MONTH_NAMES),
+    (0, 7, DAY_NAMES),
+)
+
+# Дальше этого горизонта выражение считается невыполнимым (например, 30 февраля)
+SEARCH_LIMIT_DAYS = 366 * 5
+
+
+class CronError(ValueError):
+    """Некорректное cron-выражение"""
+
+
+def _value(token, names, expression):
+    token = token.lower()
+    if names and token in names:
+        return names[token]
+    try:
+        return int(token)
+    except ValueError:
+        raise CronError(f"Invalid value '{token}' in '{expression}'")
+
+
+def _parse_field(text, minimum, maximum, names, expression):
+    values = set()
+    for part in text.split(','):
+        range_part, _, step_part = part.partition('/')
+        step = _value(step_part, None, expression) if step_part else 1
+        if step < 1:
+            raise CronError(f"Invalid step in '{expression}'")
+
+        if range_part == '*':
+            start, end = minimum, maximum
+        elif '-' in range_part:
+            start_token, end_token = range_part.split('-', 1)
+            start = _value(start_token, names, expression)
+            end = _value(end_token, names, expression)
+        else:
+            start = _value(range_part, names, expression)
+            end = maximum if step_part else start
+
+        if not (minimum <= start <= maximum and minimum <= end <= maximum and start <= end):
+            raise CronError(f"Value out of range in '{expression}'")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """Разобранное выражение; next_after(moment) - следующее срабатывание"""
+
+    def __init__(self, expression):
+        self.expression = expression
+        text = ALIASES.get(expression.strip().lower(), expression)
+        parts = text.split()
+        if len(parts) != 5:
+            raise CronError(f"Expected 5 fields in '{expression}'")
+
+        fields = [
+            _parse_field(part, minimum, maximum, names, expression)
+            for part, (minimum, maximum, names) in zip(parts, FIELDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        # 7 - тоже воскресенье
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    def __repr__(self):
+        return f"CronExpression({self.expression!r})"
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        # isoweekday: пн=1..вс=7 -> cron: вс=0
+        weekday_ok = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment):
+        """Первое время срабатывания строго после moment (с точностью до минуты)"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=SEARCH_LIMIT_DAYS)
+
+        while candidate < limit:
+            if candidate.month not in self.months:
+                # Первое число следующего месяца
+                year = candidate.year + candidate.month // 12
+                month = candidate.month % 12 + 1
+                candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            if candidate.tzinfo is not None and candidate.timestamp() <= moment.timestamp():
+                # moment во втором проходе повторяющегося часа (fold=1), а
+                # арифметика вернула первый; второй проход этого времени еще впереди
+                repeated = candidate.replace(fold=1)
+                if repeated.timestamp() > moment.timestamp():
+                    return repeated
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+
+        raise CronError(f"'{self.expression}' never fires")
+
+
+@lru_cache(maxsize=256)
+def parse_cron(expression):
+    """Разобранное выражение (кэшируется по строке)"""
+    return CronExpression(expression)
@@ -0,0 +1,265 @@
+# investments/csv_import.py
+"""
+Потоковый импорт транзакций из CSV (команда import_csv).
+
+Файл читается порциями по chunk_size строк; строки порции проверяются и
+приводятся к типам модели, имена проектов разрешаются через кэш
+{имя: id} (недостающие проекты создаются одним bulk_create на порцию),
+а транзакции вставляются bulk_create(batch_size=...) в транзакции на
+порцию. Transaction.save при этом не вызывается: equity считается при
+вставке (EquityTracker), а в конце equity и метрики каждого затронутого
+проекта пересчитываются один раз (Project.recalculate_equity +
+Project.save), и только тогда проекты ставятся в очередь проверок
+алертов (сигналы bulk_create не шлет).
+
+Колонки (регистр не важен), включая заголовки export_transactions:
+project, date, transaction_type (type), investment, return
+(return_amount), equity, nav, x_rate (x-rate).
+"""
+
+import csv
+import time
+from itertools import islice
+from typing import Dict, List, NamedTuple, Set
+
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .alerts_events import enqueue_transaction_checks
+from .models import EquityWalker, Project, Transaction
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 10000
+BATCH_SIZE = 1000
+
+COLUMN_ALIASES = {
+    'project': 'project',
+    'date': 'date',
+    'transaction_type': 'transaction_type',
+    'type': 'transaction_type',
+    'investment': 'investment',
+    'return': 'return_amount',
+    'return_amount': 'return_amount',
+    'equity': 'equity',
+    'nav': 'nav',
+    'x_rate': 'x_rate',
+    'x-rate': 'x_rate',
+}
+
+NUMBER_FIELDS = ('investment', 'return_amount', 'equity', 'nav', 'x_rate')
+
+TRANSACTION_TYPES = {value for value, _ in Transaction.TRANSACTION_TYPES}
+
+
+class RowError(NamedTuple):
+    """Пропущенная строка файла"""
+    line: int
+    message: str
+
+
+class ImportResult:
+    """Итоги импорта"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors: List[RowError] = []
+        self.projects_created: List[str] = []
+        self.touched: Dict[int, Set[str]] = {}
+        self.equity_updated = 0
+        self.elapsed = 0.0
+
+
+def _number(value):
+    """Число из ячейки; None для пустой; ValueError для нечисловой"""
+    value = (value or '').strip()
+    return float(value) if value else None
+
+
+def coerce_rows(rows, start_line):
+    """
+    Проверить и привести строки порции.
+
+    Возвращает ([(имя проекта, {поле: значение})], [RowError]).
+    """
+    valid, errors = [], []
+    for line, row in enumerate(rows, start=start_line):
+        name = (row.get('project') or '').strip()
+        tx_type = (row.get('transaction_type') or '').strip()
+        try:
+            tx_date = parse_date((row.get('date') or '').strip())
+        except ValueError:
+            tx_date = None
+
+        if not name:
+            errors.append(RowError(line, "missing project"))
+            continue
+        if tx_date is None:
+            errors.append(RowError(line, f"invalid date {row.get('date')!r}"))
+            continue
+        if tx_type not in TRANSACTION_TYPES:
+            errors.append(RowError(line, f"unknown transaction type {tx_type!r}"))
+            continue
+
+        try:
+            values = {field: _number(row.get(field)) for field in NUMBER_FIELDS}
+        except ValueError as e:
+            errors.append(RowError(line, f"invalid number: {e}"))
+            continue
+        if values['x_rate'] is None:
+            values['x_rate'] = 1.0
+        values.update(date=tx_date, transaction_type=tx_type)
+        valid.append((name, values))
+    return valid, errors
+
+
+class ProjectCache:
+    """Имена проектов -> id: загружаются одним запросом, новые создаются пачкой"""
+
+    def __init__(self):
+        self.ids = {}
+        # dry_run: проекты, которые были бы созданы (в ids только настоящие id)
+        self.planned = set()
+        for project_id, name in Project.objects.order_by('id').values_list('id', 'name'):
+            self.ids.setdefault(name, project_id)
+
+    def resolve(self, names, create=True):
+        """
+        Создать недостающие проекты (Project.save не нужен - метрик еще нет)
+        и вернуть их имена; с create=False только запомнить, каждое один раз.
+        """
+        missing = {name for name in names if name not in self.ids}
+        if not create:
+            missing -= self.planned
+            self.planned.update(missing)
+            return sorted(missing)
+        missing = sorted(missing)
+        if missing:
+            for project in Project.objects.bulk_create([Project(name=name) for name in missing]):
+                self.ids[project.name] = project.id
+            self.planned.difference_update(missing)
+        return missing
+
+
+class EquityTracker:
+    """
+    Equity новых транзакций при вставке (EquityWalker на проект). Пока
+    даты строк проекта не убывают, результат совпадает с пересчетом и
+    Project.recalculate_equity ничего не обновляет; после строки с более
+    ранней датой проект досчитывается только пересчетом.
+    """
+
+    def __init__(self):
+        self.walkers = {}
+
+    def start(self, created_ids, project_ids):
+        """Состояние для впервые встреченных проектов: существующие - одним запросом"""
+        new_ids = set(project_ids) - set(self.walkers)
+        for project_id in new_ids:
+            self.walkers[project_id] = EquityWalker()
+        existing = new_ids - set(created_ids)
+        if existing:
+            rows = Transaction.objects.filter(project_id__in=existing).order_by('project_id', 'date', 'id').values_list(
+                'project_id', 'date', 'transaction_type', 'investment', 'return_amount', 'equity'
+            )
+            for project_id, *values in rows.iterator(chunk_size=2000):
+                self.walkers[project_id].step(*values)
+
+    def step(self, tx):
+        walker = self.walkers.get(tx.project_id)
+        if walker is None:
+            return tx.equity
+        if walker.day is not None and tx.date < walker.day:
+            self.walkers[tx.project_id] = None
+            return tx.equity
+        return walker.step(tx.date, tx.transaction_type, tx.investment, tx.return_amount, tx.equity)
+
+
+def _normalize(reader):
+    """Строки DictReader с каноническими именами колонок"""
+    fields = {}
+    for column in reader.fieldnames or []:
+        alias = COLUMN_ALIASES.get(column.strip().lower())
+        if alias:
+            fields[column] = alias
+    for row in reader:
+        yield {alias: row.get(column) for column, alias in fields.items()}
+
+
+def import_transactions(csvfile, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, dry_run=False, progress=None):
+    """
+    Импортировать транзакции из открытого CSV-файла.
+
+    progress(номер порции, импортировано, ошибок) вызывается после каждой
+    порции. В dry_run строки только проверяются.
+    """
+    started = time.perf_counter()
+    result = ImportResult()
+    cache = ProjectCache()
+    equity = EquityTracker()
+    rows = _normalize(csv.DictReader(csvfile))
+
+    # Строка 1 - заголовок
+    line = 2
+    chunk_number = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        chunk_number += 1
+        valid, errors = coerce_rows(chunk, line)
+        line += len(chunk)
+        result.rows += len(chunk)
+        result.errors.extend(errors)
+
+        if dry_run:
+            result.projects_created.extend(cache.resolve((name for name, _ in valid), create=False))
+        else:
+            with transaction.atomic():
+                created = cache.resolve(name for name, _ in valid)
+                result.projects_created.extend(created)
+                equity.start({cache.ids[name] for name in created}, {cache.ids[name] for name, _ in valid})
+                objects = []
+                for name, values in valid:
+                    tx = Transaction(project_id=cache.ids[name], **values)
+                    tx.fill_type_defaults()
+                    tx.equity = equity.step(tx)
+                    objects.append(tx)
+                    result.touched.setdefault(tx.project_id, set()).add(tx.transaction_type)
+                Transaction.objects.bulk_create(objects, batch_size=batch_size)
+        result.imported += len(valid)
+
+        if progress:
+            progress(chunk_number, len(valid), len(errors))
+
+    if not dry_run:
+        result.equity_updated = rebuild_projects(result.touched)
+
+    result.elapsed = time.perf_counter() - started
+    logger.info(
+        "csv_import.done",
+        rows=result.rows,
+        imported=result.imported,
+        errors=len(result.errors),
+        projects=len(result.touched),
+        dry_run=dry_run,
+        elapsed=round(result.elapsed, 3),
+    )
+    return result
+
+
+def rebuild_projects(touched):
+    """Пересчитать equity и метрики каждого затронутого проекта один раз"""
+    equity_updated = 0
+    for project in Project.objects.filter(id__in=list(touched)).order_by('id'):
+        with transaction.atomic():
+            equity_updated += project.recalculate_equity()
+            # save() существующего проекта пересчитывает метрики и пишет снимок истории
+            project.save()
+            for tx_type in sorted(touched[project.id]):
+                transaction.on_commit(
+                    lambda project_id=project.id, tx_type=tx_type: enqueue_transaction_checks(project_id, tx_type)
+                )
+    return equity_updated
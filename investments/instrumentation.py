@@ -0,0 +1,261 @@
+# investments/instrumentation.py
+"""
+Инструментирование запросов: количество и время SQL, вызовы солверов
+(XIRR/mIRR), попадания в кэш.
+
+QueryTimingMiddleware собирает профиль каждого запроса, отдает его в
+заголовке Server-Timing и складывает в скользящую гистограмму по view,
+которую показывает страница админки "Request Performance".
+
+Настройки (settings.INSTRUMENTATION):
+    ENABLED               - включить middleware (по умолчанию True)
+    WINDOW                - сколько последних запросов хранить на view
+    RECENT_REQUESTS       - сколько последних запросов держать для "самых медленных"
+    DEFAULT_QUERY_BUDGET  - лимит SQL-запросов для всех view (None - без лимита)
+    QUERY_BUDGETS         - {view_name: лимит} для отдельных view
+"""
+
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current_profile = contextvars.ContextVar('investments_request_profile', default=None)
+
+
+def get_config():
+    config = {
+        'ENABLED': True,
+        'WINDOW': 500,
+        'RECENT_REQUESTS': 200,
+        'DEFAULT_QUERY_BUDGET': None,
+        'QUERY_BUDGETS': {},
+    }
+    config.update(getattr(settings, 'INSTRUMENTATION', {}))
+    return config
+
+
+class RequestProfile:
+    """Счетчики одного запроса (или одного запуска команды)"""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.solver_calls = {}
+        self.solver_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        """Обертка для connection.execute_wrapper"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+
+    def record_solver(self, name, elapsed):
+        self.solver_calls[name] = self.solver_calls.get(name, 0) + 1
+        self.solver_time += elapsed
+
+    def server_timing(self, total):
+        """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+        solver_desc = " ".join(f"{k}={v}" for k, v in sorted(self.solver_calls.items())) or "none"
+        return ", ".join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'solver;dur={self.solver_time * 1000:.1f};desc="{solver_desc}"',
+            f'cache;desc="hits={self.cache_hits} misses={self.cache_misses}"',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def current_profile():
+    """Профиль текущего запроса или None вне инструментированного контекста"""
+    return _current_profile.get()
+
+
+@contextmanager
+def profiling(profile=None):
+    """Сделать profile текущим и считать SQL всех подключений"""
+    profile = profile or RequestProfile()
+    token = _current_profile.set(profile)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(profile.sql_wrapper))
+            yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+@contextmanager
+def track_solver(name):
+    """Учесть вызов солвера (xirr, mirr) в текущем профиле"""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.record_solver(name, time.perf_counter() - started)
+
+
+def record_cache_access(hit):
+    """Учесть обращение к кэшу в текущем профиле"""
+    profile = _current_profile.get()
+    if profile is None:
+        return
+    if hit:
+        profile.cache_hits += 1
+    else:
+        profile.cache_misses += 1
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class ViewStats:
+    """Скользящее окно длительностей и числа запросов одного view"""
+
+    def __init__(self, window):
+        self.durations = deque(maxlen=window)
+        self.query_counts = deque(maxlen=window)
+        self.total_requests = 0
+        self.budget_violations = 0
+
+    def add(self, duration, sql_count):
+        self.durations.append(duration)
+        self.query_counts.append(sql_count)
+        self.total_requests += 1
+
+    def summary(self):
+        durations = sorted(self.durations)
+        queries = sorted(self.query_counts)
+        return {
+            'requests': self.total_requests,
+            'window': len(durations),
+            'p50_ms': _ms(_percentile(durations, 50)),
+            'p95_ms': _ms(_percentile(durations, 95)),
+            'p99_ms': _ms(_percentile(durations, 99)),
+            'max_ms': _ms(durations[-1] if durations else None),
+            'queries_p50': _percentile(queries, 50),
+            'queries_max': queries[-1] if queries else None,
+            'budget_violations': self.budget_violations,
+        }
+
+
+def _ms(value):
+    return round(value * 1000, 1) if value is not None else None
+
+
+class PerformanceRegistry:
+    """Хранилище статистики по всем view текущего процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._recent = deque()
+
+    def record(self, view_name, method, path, status, duration, profile, over_budget):
+        config = get_config()
+        with self._lock:
+            stats = self._views.get(view_name)
+            if stats is None:
+                stats = self._views[view_name] = ViewStats(config['WINDOW'])
+            stats.add(duration, profile.sql_count)
+            if over_budget:
+                stats.budget_violations += 1
+
+            self._recent.append({
+                'view': view_name,
+                'method': method,
+                'path': path,
+                'status': status,
+                'duration_ms': _ms(duration),
+                'sql_count': profile.sql_count,
+                'sql_ms': _ms(profile.sql_time),
+                'solver_calls': dict(profile.solver_calls),
+                'cache_hits': profile.cache_hits,
+                'timestamp': time.time(),
+            })
+            while len(self._recent) > config['RECENT_REQUESTS']:
+                self._recent.popleft()
+
+    def view_summaries(self):
+        with self._lock:
+            items = [(name, stats.summary()) for name, stats in self._views.items()]
+        return sorted(items, key=lambda item: item[1]['p95_ms'] or 0, reverse=True)
+
+    def slowest_requests(self, limit=20):
+        with self._lock:
+            recent = list(self._recent)
+        return sorted(recent, key=lambda r: r['duration_ms'], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._recent.clear()
+
+
+registry = PerformanceRegistry()
+
+
+def query_budget_for(view_name):
+    config = get_config()
+    return config['QUERY_BUDGETS'].get(view_name, config['DEFAULT_QUERY_BUDGET'])
+
+
+class QueryTimingMiddleware:
+    """Middleware: профиль запроса, Server-Timing и бюджеты SQL-запросов"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = get_config()['ENABLED']
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with profiling() as profile:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view_name = self._view_name(request)
+        budget = query_budget_for(view_name)
+        over_budget = budget is not None and profile.sql_count > budget
+        if over_budget:
+            logger.warning(
+                "Query budget exceeded for %s: %d queries (budget %d), %.1f ms, path=%s",
+                view_name, profile.sql_count, budget, duration * 1000, request.path,
+            )
+
+        response['Server-Timing'] = profile.server_timing(duration)
+        registry.record(
+            view_name, request.method, request.path,
+            getattr(response, 'status_code', None), duration, profile, over_budget,
+        )
+        return response
+
+    @staticmethod
+    def _view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+        return match.view_name or match._func_path
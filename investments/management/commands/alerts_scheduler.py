@@ -0,0 +1,316 @@
+# investments/management/commands/alerts_scheduler.py
+"""
+Планировщик проверок алертов - долгоживущий процесс вместо запусков по cron
+
+Использование:
+    python manage.py alerts_scheduler
+    python manage.py alerts_scheduler --once
+    python manage.py alerts_scheduler --reload-interval 120 --max-sleep 30
+
+Правила AlertRule запускаются по cron-выражению check_schedule, проверки
+проектов и портфельные проверки - по AlertType.check_frequency (в
+минутах), эскалация по SLA - каждые ALERT_SLA['INTERVAL_MINUTES'].
+Ближайшие срабатывания хранятся в min-куче; при пробуждении выполняются только наступившие задачи.
+Импорты, скомпилированные условия правил и роутер уведомлений остаются
+прогретыми между срабатываниями.
+
+Одновременно работает только один планировщик (SweepLock "alerts_scheduler").
+Ошибка задачи записывается в лог и не останавливает процесс; задача
+переносится на следующий срок в любом случае.
+"""
+
+import heapq
+import os
+import signal
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from investments.alerts import AlertManager, AlertWriter
+from investments.alerts_context import ProjectEvaluationContext
+from investments.alerts_escalation import escalate_overdue, get_config as get_escalation_config
+from investments.alerts_models import AlertRule, AlertType, LeaseLost, SweepLock
+from investments.cron import CronError, parse_cron
+from investments.models import Project
+from investments.rule_planner import apply_rule
+from investments.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+LOCK_NAME = 'alerts_scheduler'
+
+
+class Command(BaseCommand):
+    help = 'Run alert rules on their cron schedules and project checks on their AlertType frequency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs that are due now and exit',
+        )
+        parser.add_argument(
+            '--reload-interval',
+            type=float,
+            default=60,
+            help='Seconds between reloads of rules and alert types from the database',
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=float,
+            default=60,
+            help='Longest sleep between wake-ups in seconds (lease is renewed on every wake-up)',
+        )
+        parser.add_argument(
+            '--lease-ttl',
+            type=int,
+            default=300,
+            help='Scheduler lock lease in seconds (default: 300)',
+        )
+        parser.add_argument(
+            '--verbose',
+            action='store_true',
+            help='Verbose output',
+        )
+
+    def handle(self, *args, **options):
+        self.verbose = options['verbose']
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.lock = SweepLock.acquire(LOCK_NAME, owner, options['lease_ttl'])
+        if self.lock is None:
+            self.stdout.write(self.style.WARNING('🔒 Another alerts_scheduler is running - exiting'))
+            return
+
+        self.lease_ttl = options['lease_ttl']
+        self.lease_renewed_at = time.monotonic()
+
+        self.manager = AlertManager()
+        self.rules = {}
+        self.check_types = {}
+        self.heap = []
+        # Эскалация не хранится в БД - срок переживает перезагрузки кучи
+        self.next_escalation_at = None
+
+        self.stdout.write(self.style.SUCCESS(f'🕒 Alert scheduler started ({owner})'))
+        # SIGTERM (systemd, docker stop) завершает так же, как Ctrl+C - с освобождением lease
+        signal.signal(signal.SIGTERM, self._terminate)
+        try:
+            self._reload()
+            next_reload = time.monotonic() + options['reload_interval']
+            while True:
+                self._run_due(timezone.now())
+                if options['once']:
+                    break
+
+                if time.monotonic() >= next_reload:
+                    self._reload()
+                    next_reload = time.monotonic() + options['reload_interval']
+                self._renew_lease(force=True)
+
+                time.sleep(self._sleep_seconds(options['max_sleep'], next_reload))
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted')
+        except LeaseLost as e:
+            self.stdout.write(self.style.ERROR(f'🔒 {str(e)} - stopping'))
+            self.lock = None
+        finally:
+            if self.lock:
+                self.lock.release()
+
+    def _terminate(self, signum, frame):
+        raise KeyboardInterrupt
+
+    def _renew_lease(self, force=False):
+        """Продлить lease; внутри долгой задачи - не чаще раза в треть TTL"""
+        if force or time.monotonic() - self.lease_renewed_at >= self.lease_ttl / 3:
+            self.lock.renew()
+            self.lease_renewed_at = time.monotonic()
+
+    # --- Расписание ---
+
+    def _reload(self):
+        """Перечитать правила и типы алертов и пересобрать кучу"""
+        now = timezone.now()
+        self.rules = {
+            rule.id: rule
+            for rule in AlertRule.objects.filter(is_active=True).select_related('alert_type')
+        }
+        self.check_types = {
+            alert_type.code: alert_type
+            for alert_type in AlertType.objects.filter(
+                is_active=True,
+                code__in=list(AlertManager.PROJECT_CHECKS) + list(AlertManager.PORTFOLIO_CHECKS),
+            )
+        }
+
+        self.heap = [
+            (rule.next_check_at() or now, ('rule', rule_id))
+            for rule_id, rule in self.rules.items()
+        ] + [
+            (alert_type.next_check_at() or now, ('check', code))
+            for code, alert_type in self.check_types.items()
+        ] + [
+            (self.next_escalation_at or now, ('escalation', 'sla')),
+        ]
+        heapq.heapify(self.heap)
+
+        if self.verbose:
+            self.stdout.write(f'🔄 Loaded {len(self.rules)} rules and {len(self.check_types)} check types')
+            if self.heap:
+                fire_at, (kind, key) = self.heap[0]
+                self.stdout.write(f'   next: {kind} {key} at {timezone.localtime(fire_at):%Y-%m-%d %H:%M}')
+
+    def _sleep_seconds(self, max_sleep, next_reload):
+        wake_at = time.monotonic() + max_sleep
+        if self.heap:
+            until_due = (self.heap[0][0] - timezone.now()).total_seconds()
+            wake_at = min(wake_at, time.monotonic() + until_due)
+        wake_at = min(wake_at, next_reload)
+        return max(wake_at - time.monotonic(), 0.5)
+
+    def _pop_due(self, now):
+        """Снять с кучи все наступившие задачи"""
+        due = set()
+        while self.heap and self.heap[0][0] <= now:
+            due.add(heapq.heappop(self.heap)[1])
+        return due
+
+    def _next_rule_fire(self, rule, now):
+        try:
+            return parse_cron(rule.check_schedule).next_after(timezone.localtime(now))
+        except CronError:
+            return now + timedelta(hours=1)
+
+    # --- Выполнение ---
+
+    def _run_due(self, now):
+        due = self._pop_due(now)
+        if not due:
+            return
+
+        codes = sorted(key for kind, key in due if kind == 'check' and key in self.check_types)
+        rule_ids = sorted(key for kind, key in due if kind == 'rule' and key in self.rules)
+
+        # Задачи уже сняты с кучи - возвращаются в finally, даже если упали
+        if codes:
+            try:
+                self._run_checks(codes, now)
+            except LeaseLost:
+                raise
+            except Exception as e:
+                logger.error("alerts_scheduler.checks_error", checks=codes, error=str(e))
+            finally:
+                for code in codes:
+                    frequency = max(self.check_types[code].check_frequency, 1)
+                    heapq.heappush(self.heap, (now + timedelta(minutes=frequency), ('check', code)))
+
+        if rule_ids:
+            try:
+                self._run_rules([self.rules[rule_id] for rule_id in rule_ids], now)
+            except LeaseLost:
+                raise
+            except Exception as e:
+                logger.error("alerts_scheduler.rules_error", rules=rule_ids, error=str(e))
+            finally:
+                for rule_id in rule_ids:
+                    fire_at = self._next_rule_fire(self.rules[rule_id], now)
+                    heapq.heappush(self.heap, (fire_at, ('rule', rule_id)))
+
+        if ('escalation', 'sla') in due:
+            try:
+                self._run_escalation(now)
+            finally:
+                interval = max(get_escalation_config()['INTERVAL_MINUTES'], 1)
+                self.next_escalation_at = now + timedelta(minutes=interval)
+                heapq.heappush(self.heap, (self.next_escalation_at, ('escalation', 'sla')))
+
+    def _run_checks(self, codes, now):
+        """Проверки проектов для наступивших типов алертов"""
+        started = time.perf_counter()
+        writer = AlertWriter(self.manager)
+        projects = list(Project.objects.filter(status='active').order_by('id'))
+        contexts = ProjectEvaluationContext.load_many(projects)
+
+        created, errors = 0, 0
+        project_codes = [code for code in codes if code in AlertManager.PROJECT_CHECKS]
+        if project_codes:
+            for project in projects:
+                # Полный проход может быть дольше TTL - иначе lease перехватит другой планировщик
+                self._renew_lease()
+                try:
+                    findings, check_errors = self.manager.evaluate_project(contexts[project.id], project_codes)
+                    for check_type, error in check_errors.items():
+                        logger.warning("alerts_scheduler.check_error", project=project.name,
+                                       check=check_type, error=error)
+                    created += len(self.manager.apply_findings(project, findings, writer=writer))
+                except Exception as e:
+                    errors += 1
+                    logger.error("alerts_scheduler.project_error", project=project.name, error=str(e))
+
+        # Портфельные проверки - по всему набору проектов на тех же контекстах
+        portfolio_codes = [code for code in codes if code in AlertManager.PORTFOLIO_CHECKS]
+        if portfolio_codes:
+            self._renew_lease()
+            findings, check_errors = self.manager.evaluate_portfolio(projects, portfolio_codes, contexts)
+            for check_type, error in check_errors.items():
+                errors += 1
+                logger.warning("alerts_scheduler.check_error", check=check_type, error=error)
+            for project in projects:
+                if project.id not in findings:
+                    continue
+                try:
+                    created += len(self.manager.apply_findings(project, findings[project.id], writer=writer))
+                except Exception as e:
+                    errors += 1
+                    logger.error("alerts_scheduler.project_error", project=project.name, error=str(e))
+        writer.flush()
+
+        AlertType.objects.filter(code__in=codes).update(last_checked=now)
+        for code in codes:
+            self.check_types[code].last_checked = now
+
+        elapsed = time.perf_counter() - started
+        logger.info("alerts_scheduler.checks", checks=codes, projects=len(projects),
+                    alerts=created, errors=errors, elapsed=round(elapsed, 3))
+        self.stdout.write(
+            f"⏰ {timezone.localtime(now):%H:%M:%S} checks {', '.join(codes)}: "
+            f"{len(projects)} projects, {created} alerts, {errors} errors in {elapsed:.2f}s"
+        )
+
+    def _run_escalation(self, now):
+        """Эскалация алертов, нарушивших SLA"""
+        try:
+            escalated = escalate_overdue(self.manager, now)
+        except Exception as e:
+            logger.error("alerts_scheduler.escalation_error", error=str(e))
+            return
+        if escalated or self.verbose:
+            self.stdout.write(f"⏰ {timezone.localtime(now):%H:%M:%S} escalation: {escalated} alerts past SLA")
+
+    def _run_rules(self, rules, now):
+        """Наступившие правила AlertRule"""
+        started = time.perf_counter()
+        writer = AlertWriter(self.manager)
+        plans = {'query': 0, 'history': 0, 'python': 0}
+
+        created = 0
+        for rule in rules:
+            self._renew_lease()
+            try:
+                alerts, plan = apply_rule(rule, writer, now)
+                plans[plan] += 1
+                created += len(alerts)
+            except Exception as e:
+                logger.error("alerts_scheduler.rule_error", rule=rule.name, error=str(e))
+        writer.flush()
+
+        elapsed = time.perf_counter() - started
+        logger.info("alerts_scheduler.rules", rules=len(rules), alerts=created, elapsed=round(elapsed, 3), **plans)
+        self.stdout.write(
+            f"⏰ {timezone.localtime(now):%H:%M:%S} rules: {len(rules)} "
+            f"({plans['query']} as queries, {plans['history']} from history, {plans['python']} in Python), "
+            f"{created} alerts in {elapsed:.2f}s"
+        )
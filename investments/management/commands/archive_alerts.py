@@ -0,0 +1,106 @@
+# investments/management/commands/archive_alerts.py
+"""
+Архивация старых решенных и отклоненных алертов (AlertArchive)
+
+Использование:
+    python manage.py archive_alerts
+    python manage.py archive_alerts --days 90 --chunk-size 1000
+    python manage.py archive_alerts --max-chunks 10
+    python manage.py archive_alerts --dry-run
+
+Алерты и их логи переносятся пачками, каждая пачка - отдельная транзакция,
+поэтому прерванный запуск безопасно продолжается следующим. Одновременно
+работает только один процесс архивации (SweepLock "archive_alerts").
+"""
+
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from investments.alerts_models import AlertLog, LeaseLost, SweepLock
+from investments.alerts_retention import archivable_alerts, archive_chunk, get_config, group_members
+
+LOCK_NAME = 'archive_alerts'
+
+
+class Command(BaseCommand):
+    help = 'Move old resolved and dismissed alerts with their logs into compressed monthly archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Archive alerts closed more than this many days ago (default: ALERT_RETENTION["DAYS"])',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Alerts per transaction (default: ALERT_RETENTION["CHUNK_SIZE"])',
+        )
+        parser.add_argument(
+            '--max-chunks',
+            type=int,
+            help='Stop after this many chunks (default: until nothing is left)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count what would be archived',
+        )
+        parser.add_argument(
+            '--lease-ttl',
+            type=int,
+            default=600,
+            help='Archive lock lease in seconds, renewed after every chunk (default: 600)',
+        )
+
+    def handle(self, *args, **options):
+        config = get_config()
+        days = options['days'] if options['days'] is not None else config['DAYS']
+        chunk_size = options['chunk_size'] or config['CHUNK_SIZE']
+
+        if options['dry_run']:
+            alerts = group_members(archivable_alerts(days).values('id'))
+            logs = AlertLog.objects.filter(alert__in=alerts.values('id')).count()
+            self.stdout.write(f'🔍 Would archive {alerts.count()} alerts and {logs} logs older than {days} days')
+            return
+
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        lock = SweepLock.acquire(LOCK_NAME, owner, options['lease_ttl'])
+        if lock is None:
+            self.stdout.write(self.style.WARNING('🔒 Another archive_alerts is running - exiting'))
+            return
+
+        started = time.perf_counter()
+        totals = {'alerts': 0, 'logs': 0, 'segments': 0}
+        chunks = 0
+        try:
+            while True:
+                ids = list(archivable_alerts(days).values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                alerts, logs, segments = archive_chunk(ids)
+                totals['alerts'] += alerts
+                totals['logs'] += logs
+                totals['segments'] += segments
+                chunks += 1
+                lock.renew()
+                self.stdout.write(f'📦 Chunk {chunks}: {alerts} alerts, {logs} logs')
+
+                if options['max_chunks'] and chunks >= options['max_chunks']:
+                    break
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted')
+        except LeaseLost as e:
+            self.stdout.write(self.style.ERROR(f'🔒 {str(e)} - stopping'))
+            lock = None
+        finally:
+            if lock:
+                lock.release()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Archived {totals['alerts']} alerts and {totals['logs']} logs "
+            f"into {totals['segments']} segments in {time.perf_counter() - started:.2f}s"
+        ))
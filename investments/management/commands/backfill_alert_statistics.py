@@ -0,0 +1,56 @@
+# investments/management/commands/backfill_alert_statistics.py
+"""
+Пересчет дневной статистики алертов (AlertStatistics) за диапазон дат
+
+Использование:
+    python manage.py backfill_alert_statistics
+    python manage.py backfill_alert_statistics --start 2025-01-01 --end 2025-03-31
+
+По умолчанию - с даты первого алерта по сегодня. Весь диапазон считается
+несколькими группировками по TruncDate, а не запросами на каждый день.
+"""
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from investments.alerts_models import AlertStatistics, ProjectAlert, bump_alerts_version
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily AlertStatistics rollups for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help='First date, YYYY-MM-DD (default: date of the first alert)',
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help='Last date, YYYY-MM-DD (default: today)',
+        )
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start']
+        if start is None:
+            first = ProjectAlert.objects.aggregate(first=Min('created_at'))['first']
+            start = timezone.localdate(first) if first else end
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        started = time.perf_counter()
+        rows = AlertStatistics.rebuild(start, end)
+        bump_alerts_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'📊 Rebuilt {len(rows)} days ({start} - {end}): '
+            f'{sum(row.created_count for row in rows)} alerts created, '
+            f'{sum(row.resolutions_count for row in rows)} resolved '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
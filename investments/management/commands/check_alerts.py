@@ -8,6 +8,20 @@ Management команда для автоматической проверки 
     python manage.py check_alerts --dry-run
     python manage.py check_alerts --project="Project Name"
     python manage.py check_alerts --email-summary
+    python manage.py check_alerts --debug-capture
+    python manage.py check_alerts --restart --lease-ttl 900
+    python manage.py check_alerts --workers 4
+
+Полный проход держит lease-блокировку (SweepLock), поэтому параллельные
+cron-запуски не проверяют одни и те же проекты. После каждого проекта
+сохраняется чекпоинт: прерванный проход продолжается с места остановки.
+
+С --workers N проверки считаются в пуле процессов (без обращения к БД),
+а алерты создаются родительским процессом одной транзакцией.
+
+Портфельные проверки (AlertManager.PORTFOLIO_CHECKS: NO_UPDATE,
+PORTFOLIO_RISK, SHARPE_DECLINE, TARGET_MISS) идут в том же проходе после
+проектов - по всем активным проектам сразу, ограниченным числом запросов.
 """
 
 from django.core.management.base import BaseCommand, CommandError
@@ -16,15 +30,23 @@ from django.conf import settings
 from django.utils import timezone
 from django.template.loader import render_to_string
 from django.contrib.auth.models import User
+from django.db import transaction
 from datetime import datetime, timedelta
 import logging
+import os
+import socket
+import time
 
 from investments.models import Project
-from investments.alerts import AlertManager, AlertAnalyzer
+from investments.alerts import AlertManager, AlertAnalyzer, AlertWriter
+from investments.alerts_context import ProjectEvaluationContext
+from investments.alerts_parallel import evaluate_parallel
+from investments.rule_planner import apply_rule
 from investments.alerts_models import (
     ProjectAlert, AlertType, AlertSettings, 
-    AlertStatistics, AlertRule
+    AlertStatistics, AlertRule, SweepLock, LeaseLost
 )
+from investments.structured_logging import capture_debug
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +54,9 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Check all projects and generate alerts based on defined rules'
     
+    # Сколько проектов накапливать перед записью алертов и чекпоинтом
+    FLUSH_EVERY = 100
+    
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
@@ -68,14 +93,61 @@ class Command(BaseCommand):
             action='store_true',
             help='Verbose output',
         )
+        
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Evaluate projects in a pool of N processes (default: 1, serial)',
+        )
+        
+        parser.add_argument(
+            '--lease-ttl',
+            type=int,
+            default=600,
+            help=f'Sweep lock lease in seconds, renewed at every checkpoint '
+                 f'(each {self.FLUSH_EVERY} projects) (default: 600)',
+        )
+        
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint of an interrupted sweep and start from the first project',
+        )
+        
+        parser.add_argument(
+            '--debug-capture',
+            action='store_true',
+            help='Capture all log events of this run in a ring buffer and print them at the end',
+        )
     
     def handle(self, *args, **options):
+        if not options.get('debug_capture'):
+            return self._run(*args, **options)
+        
+        with capture_debug(label='check_alerts') as capture:
+            try:
+                return self._run(*args, **options)
+            finally:
+                self._print_capture(capture)
+    
+    def _print_capture(self, capture):
+        """Вывести события, захваченные за время запуска"""
+        self.stdout.write(f'\n🔎 Debug capture: {len(capture.records)} events (dropped: {capture.dropped})')
+        for line in capture.format_lines():
+            self.stdout.write(f'  {line}')
+    
+    def _run(self, *args, **options):
         self.dry_run = options.get('dry_run', False)
         self.verbose = options.get('verbose', False)
         self.email_summary = options.get('email_summary', False)
         self.force = options.get('force', False)
         self.specific_project = options.get('project')
         self.specific_type = options.get('type')
+        self.lease_ttl = options.get('lease_ttl') or 600
+        self.restart = options.get('restart', False)
+        self.workers = max(1, options.get('workers') or 1)
+        self.sweep_lock = None
         
         start_time = timezone.now()
         
@@ -92,18 +164,37 @@ class Command(BaseCommand):
                     self.stdout.write(self.style.WARNING('⏳ Skipping - checked less than 5 minutes ago'))
                     return
             
+            # Полный проход - только под lease-блокировкой
+            if self._uses_sweep_lock():
+                self.sweep_lock = SweepLock.acquire(self._sweep_lock_name(), self._lock_owner(), self.lease_ttl)
+                if self.sweep_lock is None:
+                    self.stdout.write(self.style.WARNING('🔒 Skipping - another sweep holds the lock'))
+                    return
+                self.sweep_lock.start(restart=self.restart)
+            
             # Инициализируем менеджеры
             alert_manager = AlertManager()
             analyzer = AlertAnalyzer()
+            self.writer = None if self.dry_run else AlertWriter(alert_manager)
+            self.contexts = None
             
             # Получаем проекты для проверки
             projects = self._get_projects_to_check()
             
-            if not projects:
-                self.stdout.write(self.style.WARNING('No projects to check'))
-                return
+            resume_after = self.sweep_lock.resume_after if self.sweep_lock else None
+            if resume_after is not None:
+                projects = projects.filter(id__gt=resume_after)
+                self.stdout.write(self.style.WARNING(
+                    f'↩️  Resuming interrupted sweep after project id {resume_after} '
+                    f'({self.sweep_lock.projects_done} already checked)'
+                ))
             
-            self.stdout.write(f'📊 Checking {len(projects)} projects...')
+            # Портфельные проверки и правила выполняются и без проектов:
+            # проход, прерванный после последнего проекта, их еще не сделал
+            if projects:
+                self.stdout.write(f'📊 Checking {len(projects)} projects...')
+            else:
+                self.stdout.write(self.style.WARNING('No projects to check'))
             
             # Статистика
             stats = {
@@ -119,46 +210,19 @@ class Command(BaseCommand):
                 'alerts_by_project': {}
             }
             
-            # Проверяем каждый проект
-            for project in projects:
-                if self.verbose:
-                    self.stdout.write(f'  Checking {project.name}...')
-                
-                try:
-                    alerts = self._check_project(project, alert_manager)
-                    stats['projects_checked'] += 1
-                    
-                    for alert in alerts:
-                        if not self.dry_run:
-                            # Алерт уже создан в alert_manager
-                            pass
-                        else:
-                            # В dry-run режиме просто выводим информацию
-                            self._print_alert_preview(alert)
-                        
-                        # Обновляем статистику
-                        stats['alerts_created'] += 1
-                        severity_key = f"{alert.severity.lower()}_alerts"
-                        if severity_key in stats:
-                            stats[severity_key] += 1
-                        
-                        # По типам
-                        alert_type = getattr(alert, 'alert_type_code', 'UNKNOWN')
-                        stats['alerts_by_type'][alert_type] = stats['alerts_by_type'].get(alert_type, 0) + 1
-                        
-                        # По проектам
-                        stats['alerts_by_project'][project.name] = stats['alerts_by_project'].get(project.name, 0) + 1
-                
-                except Exception as e:
-                    stats['errors'] += 1
-                    self.stdout.write(
-                        self.style.ERROR(f'  ❌ Error checking {project.name}: {str(e)}')
-                    )
-                    logger.error(f'Error checking project {project.name}: {str(e)}', exc_info=True)
+            # Проверяем проекты: последовательно или в пуле процессов
+            evaluation_started = time.perf_counter()
+            if projects and self.workers > 1:
+                self._check_projects_parallel(projects, alert_manager, stats)
+            elif projects:
+                self._check_projects_serial(projects, alert_manager, stats)
+            self._check_portfolio(alert_manager, stats)
+            stats['evaluation_seconds'] = time.perf_counter() - evaluation_started
             
             # Проверяем правила если не dry-run
             if not self.dry_run:
                 self._check_alert_rules(alert_manager, stats)
+                self.writer.flush()
             
             # Обновляем статистику дня
             if not self.dry_run:
@@ -174,6 +238,10 @@ class Command(BaseCommand):
             # Записываем время последней проверки
             if not self.dry_run:
                 self._save_last_check_time()
+            if self._uses_sweep_lock():
+                # Планировщик alerts_scheduler отсчитывает check_frequency от этой отметки
+                AlertType.objects.filter(code__in=self._checks_to_run()).update(last_checked=timezone.now())
+            self._release_sweep_lock(completed=True)
             
             end_time = timezone.now()
             duration = (end_time - start_time).total_seconds()
@@ -182,11 +250,32 @@ class Command(BaseCommand):
                 self.style.SUCCESS(f'✅ Alert check completed in {duration:.1f} seconds')
             )
             
+        except LeaseLost as e:
+            self.sweep_lock = None
+            self.stdout.write(self.style.ERROR(f'🔒 {str(e)} - stopping'))
+            raise CommandError(f'Alert check aborted: {str(e)}')
         except Exception as e:
+            # Чекпоинт сохраняется - следующий запуск продолжит с него
+            self._release_sweep_lock(completed=False)
             self.stdout.write(self.style.ERROR(f'Fatal error: {str(e)}'))
             logger.error(f'Fatal error in check_alerts: {str(e)}', exc_info=True)
             raise CommandError(f'Alert check failed: {str(e)}')
     
+    def _uses_sweep_lock(self):
+        """Блокировка и чекпоинты нужны только полному проходу"""
+        return not self.dry_run and not self.specific_project
+    
+    def _sweep_lock_name(self):
+        return f"check_alerts:{self.specific_type or 'all'}"
+    
+    def _lock_owner(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+    
+    def _release_sweep_lock(self, completed):
+        if self.sweep_lock:
+            self.sweep_lock.release(completed=completed)
+            self.sweep_lock = None
+    
     def _get_projects_to_check(self):
         """Получить список проектов для проверки"""
         if self.specific_project:
@@ -195,152 +284,199 @@ class Command(BaseCommand):
             except Project.DoesNotExist:
                 raise CommandError(f'Project "{self.specific_project}" not found')
         else:
-            # Проверяем только активные проекты
-            return Project.objects.filter(status='active')
+            # Проверяем только активные проекты; порядок по id нужен для чекпоинтов
+            return Project.objects.filter(status='active').order_by('id')
     
-    def _check_project(self, project, alert_manager):
-        """Проверить один проект"""
-        alerts = []
+    def _checks_to_run(self):
+        """Коды проверок для этого запуска"""
+        if self.specific_type:
+            return [self.specific_type]
+        return list(AlertManager.PROJECT_CHECKS) + list(AlertManager.PORTFOLIO_CHECKS)
+    
+    def _check_projects_serial(self, projects, alert_manager, stats):
+        """Проверить проекты по одному в текущем процессе"""
+        unflushed = []
+        for project in projects:
+            if self.verbose:
+                self.stdout.write(f'  Checking {project.name}...')
+            
+            try:
+                # Транзакции и метрики проекта загружаются один раз для всех проверок
+                ctx = alert_manager.evaluation_context(project)
+                findings, errors = alert_manager.evaluate_project(ctx, self._checks_to_run())
+                self._record_project(project, findings, errors, alert_manager, stats)
+            except Exception as e:
+                self._record_project_error(project, e, stats)
+            
+            unflushed.append(project.id)
+            if len(unflushed) >= self.FLUSH_EVERY:
+                self._flush(unflushed)
         
-        # Определяем какие проверки выполнять
-        checks_to_run = []
+        self._flush(unflushed)
+    
+    def _check_projects_parallel(self, projects, alert_manager, stats):
+        """Посчитать проверки в пуле процессов и применить результаты одной транзакцией"""
+        projects = list(projects)
+        contexts = ProjectEvaluationContext.load_many(projects)
+        # Контексты переиспользуются портфельными проверками, если проход не продолжен с чекпоинта
+        self.contexts = contexts
         
-        if self.specific_type:
-            checks_to_run = [self.specific_type]
-        else:
-            checks_to_run = [
-                'IRR_GAP',
-                'NAV_DROP',
-                'NPV_NEGATIVE',
-                'DATA_QUALITY',
-                'DRAWDOWN',
-                'DISTRIBUTION',
-                'PERFORMANCE'
-            ]
+        parallel_started = time.perf_counter()
+        shard_results = evaluate_parallel(contexts.values(), self._checks_to_run(), self.workers)
+        stats['parallel_seconds'] = time.perf_counter() - parallel_started
+        # Оценка могла занять заметную часть lease - продлеваем до записи
+        if self.sweep_lock:
+            self.sweep_lock.renew()
+        stats['workers'] = [
+            {'worker': shard['worker'], 'projects': shard['projects'], 'elapsed': shard['elapsed']}
+            for shard in shard_results
+        ]
         
-        # Выполняем проверки
-        for check_type in checks_to_run:
-            try:
-                if check_type == 'IRR_GAP':
-                    alert = alert_manager.check_irr_gap(project)
-                    if alert:
-                        alert.alert_type_code = 'IRR_GAP'
-                        alerts.append(alert)
-                
-                elif check_type == 'NAV_DROP':
-                    alert = alert_manager.check_nav_drop(project)
-                    if alert:
-                        alert.alert_type_code = 'NAV_DROP'
-                        alerts.append(alert)
-                
-                elif check_type == 'NPV_NEGATIVE':
-                    alert = alert_manager.check_npv_negative(project)
-                    if alert:
-                        alert.alert_type_code = 'NPV_NEGATIVE'
-                        alerts.append(alert)
-                
-                elif check_type == 'DATA_QUALITY':
-                    quality_alerts = alert_manager.check_data_quality(project)
-                    for alert in quality_alerts:
-                        alert.alert_type_code = 'DATA_QUALITY'
-                        alerts.append(alert)
-                
-                elif check_type == 'DRAWDOWN':
-                    alert = alert_manager.check_drawdown(project)
-                    if alert:
-                        alert.alert_type_code = 'DRAWDOWN'
-                        alerts.append(alert)
-                
-                elif check_type == 'DISTRIBUTION':
-                    alert = alert_manager.check_distribution_received(project)
-                    if alert:
-                        alert.alert_type_code = 'DISTRIBUTION'
-                        alerts.append(alert)
-                
-                elif check_type == 'PERFORMANCE':
-                    alert = alert_manager.check_performance_milestone(project)
-                    if alert:
-                        alert.alert_type_code = 'PERFORMANCE'
-                        alerts.append(alert)
+        results = {
+            project_id: (findings, errors)
+            for shard in shard_results
+            for project_id, findings, errors in shard['results']
+        }
+        
+        unflushed = []
+        with transaction.atomic():
+            for project in projects:
+                if self.verbose:
+                    self.stdout.write(f'  Applying {project.name}...')
                 
+                findings, errors = results[project.id]
+                try:
+                    with transaction.atomic():
+                        self._record_project(project, findings, errors, alert_manager, stats)
+                except Exception as e:
+                    self._record_project_error(project, e, stats)
+                unflushed.append(project.id)
+            
+            self._flush(unflushed)
+    
+    def _check_portfolio(self, alert_manager, stats):
+        """Портфельные проверки по всем активным проектам (не для --project)"""
+        checks = [code for code in self._checks_to_run() if code in AlertManager.PORTFOLIO_CHECKS]
+        if self.specific_project or not checks:
+            return
+        
+        # Концентрация считается по всему портфелю, даже если проход продолжен с чекпоинта
+        projects = list(Project.objects.filter(status='active').order_by('id'))
+        contexts = self.contexts
+        if contexts is not None and set(contexts) != {project.id for project in projects}:
+            contexts = None
+        
+        findings, errors = alert_manager.evaluate_portfolio(projects, checks, contexts)
+        for check_type, error in errors.items():
+            stats['errors'] += 1
+            self.stdout.write(self.style.WARNING(f'  Warning in {check_type}: {error}'))
+            logger.warning(f'Error in {check_type} portfolio check: {error}')
+        
+        for project in projects:
+            if project.id not in findings:
+                continue
+            try:
+                alerts = self._apply_findings(project, findings[project.id], alert_manager)
             except Exception as e:
-                if self.verbose:
-                    self.stdout.write(
-                        self.style.WARNING(f'    Warning in {check_type}: {str(e)}')
-                    )
-                logger.warning(f'Error in {check_type} check for {project.name}: {str(e)}')
+                self._record_project_error(project, e, stats)
+                continue
+            self._count_alerts(project, alerts, stats)
+        if self.writer:
+            self.writer.flush()
+    
+    def _flush(self, project_ids):
+        """Записать накопленные алерты и сдвинуть чекпоинт на обработанные проекты"""
+        if self.writer:
+            self.writer.flush()
+        if self.sweep_lock and project_ids:
+            self.sweep_lock.checkpoint(project_ids[-1], count=len(project_ids))
+        project_ids.clear()
+    
+    def _record_project(self, project, findings, errors, alert_manager, stats):
+        """Создать алерты по срабатываниям проекта и обновить статистику"""
+        for check_type, error in errors.items():
+            if self.verbose:
+                self.stdout.write(
+                    self.style.WARNING(f'    Warning in {check_type}: {error}')
+                )
+            logger.warning(f'Error in {check_type} check for {project.name}: {error}')
         
+        alerts = self._apply_findings(project, findings, alert_manager)
+        stats['projects_checked'] += 1
+        self._count_alerts(project, alerts, stats)
+    
+    def _count_alerts(self, project, alerts, stats):
+        """Учесть созданные алерты в статистике (и показать их в dry-run)"""
+        for alert in alerts:
+            if self.dry_run:
+                # В dry-run режиме просто выводим информацию
+                self._print_alert_preview(alert)
+            
+            # Обновляем статистику
+            stats['alerts_created'] += 1
+            severity_key = f"{alert.severity.lower()}_alerts"
+            if severity_key in stats:
+                stats[severity_key] += 1
+            
+            # По типам
+            alert_type = getattr(alert, 'alert_type_code', 'UNKNOWN')
+            stats['alerts_by_type'][alert_type] = stats['alerts_by_type'].get(alert_type, 0) + 1
+            
+            # По проектам
+            stats['alerts_by_project'][project.name] = stats['alerts_by_project'].get(project.name, 0) + 1
+    
+    def _record_project_error(self, project, error, stats):
+        stats['errors'] += 1
+        self.stdout.write(
+            self.style.ERROR(f'  ❌ Error checking {project.name}: {str(error)}')
+        )
+        logger.error(f'Error checking project {project.name}: {str(error)}', exc_info=True)
+    
+    def _apply_findings(self, project, findings, alert_manager):
+        """Создать алерты (или несохраненные превью в dry-run режиме)"""
+        alerts = []
+        for finding in findings:
+            if self.dry_run:
+                skip_if = finding.get('skip_if')
+                if skip_if and ProjectAlert.objects.filter(project=project, **skip_if).exists():
+                    continue
+                created = [ProjectAlert(
+                    project=project,
+                    severity=finding.get('severity', 'MEDIUM'),
+                    title=finding['title'],
+                    message=finding['message'],
+                    metric_value=finding.get('metric_value'),
+                    threshold_value=finding.get('threshold_value'),
+                )]
+            else:
+                created = alert_manager.apply_findings(project, [finding], writer=self.writer)
+            
+            for alert in created:
+                alert.alert_type_code = finding['alert_type_code']
+                alerts.append(alert)
         return alerts
 # ПРОДОЛЖЕНИЕ check_alerts.py - добавьте после _check_project
     
     def _check_alert_rules(self, alert_manager, stats):
         """Проверить кастомные правила алертов"""
-        rules = AlertRule.objects.filter(is_active=True)
+        rules = AlertRule.objects.filter(is_active=True).select_related('alert_type')
+        stats['rule_plans'] = {'query': 0, 'history': 0, 'python': 0}
         
+        now = timezone.now()
         for rule in rules:
             try:
-                # Проверяем расписание
-                if not self._should_check_rule(rule):
+                # Проверяем расписание (cron-выражение check_schedule)
+                if not rule.is_due(now):
                     continue
                 
-                # Получаем проекты для правила
-                if rule.applies_to_all_projects:
-                    projects = Project.objects.filter(status='active')
-                else:
-                    projects = rule.specific_projects.filter(status='active')
-                
-                for project in projects:
-                    # Получаем значение метрики
-                    try:
-                        current_value = getattr(project, rule.metric_field, None)
-                        if callable(current_value):
-                            current_value = current_value()
-                    except:
-                        continue
-                    
-                    if current_value is None:
-                        continue
-                    
-                    # Проверяем условие
-                    if rule.check_condition(project, current_value):
-                        # Создаем алерт
-                        severity = rule.severity_override or rule.alert_type.default_severity
-                        
-                        alert = alert_manager.create_alert(
-                            project=project,
-                            alert_type_code=rule.alert_type.code,
-                            title=f"{rule.name} triggered",
-                            message=f"{rule.metric_field} = {current_value} (rule: {rule.operator} {rule.threshold_value})",
-                            severity=severity,
-                            metric_value=current_value,
-                            threshold_value=rule.threshold_value,
-                            details={'rule_id': rule.id, 'rule_name': rule.name}
-                        )
-                        
-                        if alert:
-                            stats['alerts_created'] += 1
-                            # Обновляем счетчики правила
-                            rule.last_triggered = timezone.now()
-                            rule.trigger_count += 1
-                            rule.save()
-                
-                # Обновляем время последней проверки
-                rule.last_checked = timezone.now()
-                rule.save()
+                # Пороговые правила по хранимым колонкам и правила по истории - одним запросом
+                created, plan = apply_rule(rule, self.writer, now)
+                stats['rule_plans'][plan] += 1
+                stats['alerts_created'] += len(created)
                 
             except Exception as e:
                 logger.error(f'Error checking rule {rule.name}: {str(e)}')
     
-    def _should_check_rule(self, rule):
-        """Проверить, нужно ли запускать правило"""
-        # Здесь можно добавить проверку cron расписания
-        # Пока просто проверяем, что правило не проверялось последний час
-        if rule.last_checked:
-            hours_since_check = (timezone.now() - rule.last_checked).total_seconds() / 3600
-            if hours_since_check < 1:
-                return False
-        return True
-    
     def _print_alert_preview(self, alert):
         """Вывести превью алерта в dry-run режиме"""
         icon = '🚨' if alert.severity == 'CRITICAL' else '⚠️' if alert.severity == 'HIGH' else 'ℹ️'
@@ -388,6 +524,29 @@ class Command(BaseCommand):
         if stats['errors'] > 0:
             self.stdout.write(self.style.ERROR(f"\n❌ Errors: {stats['errors']}"))
         
+        if stats.get('workers'):
+            self.stdout.write('\nWorkers:')
+            for worker in stats['workers']:
+                self.stdout.write(
+                    f"  pid {worker['worker']}: {worker['projects']} projects in {worker['elapsed']:.2f}s"
+                )
+            busy = sum(worker['elapsed'] for worker in stats['workers'])
+            wall = stats['parallel_seconds']
+            # Загрузка пула, а не ускорение: последовательный проход здесь не измеряется
+            utilisation = busy / (wall * self.workers) if wall else 0
+            self.stdout.write(
+                f"Parallel evaluation: {wall:.2f}s wall, {busy:.2f}s in workers, "
+                f"{self.workers} workers at {utilisation:.0%} utilisation"
+            )
+        if 'evaluation_seconds' in stats:
+            self.stdout.write(f"Checks total: {stats['evaluation_seconds']:.2f}s")
+        if stats.get('rule_plans'):
+            plans = stats['rule_plans']
+            self.stdout.write(
+                f"Alert rules: {plans['query']} as queries, {plans['history']} from history, "
+                f"{plans['python']} in Python"
+            )
+        
         self.stdout.write('='*50)
     
     def _send_email_summary(self, stats, analyzer):
@@ -0,0 +1,88 @@
+# investments/management/commands/deliver_notifications.py
+"""
+Доставка уведомлений из NotificationOutbox
+
+Использование:
+    python manage.py deliver_notifications
+    python manage.py deliver_notifications --batch-size 200 --max-batches 10
+    python manage.py deliver_notifications --loop --interval 30
+    python manage.py deliver_notifications --requeue-dead
+
+Уведомления пользователей с email_frequency HOURLY/DAILY/WEEKLY становятся
+доступны в время дайджеста и отправляются одним письмом на пользователя.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from investments.alerts_models import NotificationOutbox
+from investments.notifications import deliver_pending, requeue_dead
+
+
+class Command(BaseCommand):
+    help = 'Send queued alert notifications in batches over a single mail connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Messages per batch (default: NOTIFICATIONS["BATCH_SIZE"])',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Stop after this many batches (default: until the queue is drained)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Polling interval in seconds for --loop',
+        )
+        parser.add_argument(
+            '--requeue-dead',
+            action='store_true',
+            help='Move dead letters back to the queue before sending',
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            count = requeue_dead()
+            self.stdout.write(f'♻️  Requeued {count} dead letters')
+
+        totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'dead': 0, 'messages': 0}
+        batches = 0
+        try:
+            while True:
+                result = deliver_pending(batch_size=options.get('batch_size'))
+                for key in totals:
+                    totals[key] += result[key]
+                if result['claimed']:
+                    batches += 1
+                    self.stdout.write(
+                        f"📤 Batch {batches}: sent {result['sent']} in {result['messages']} messages, "
+                        f"retry {result['retried']}, dead {result['dead']}"
+                    )
+
+                if options.get('max_batches') and batches >= options['max_batches']:
+                    break
+                if not result['claimed']:
+                    if not options['loop']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted')
+
+        pending = NotificationOutbox.objects.filter(status__in=['PENDING', 'SENDING']).count()
+        dead = NotificationOutbox.objects.filter(status='DEAD').count()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Sent {totals['sent']} notifications as {totals['messages']} messages in {batches} batches "
+            f"(retry scheduled: {totals['retried']}, dead: {totals['dead']}; "
+            f"queue: {pending} pending, {dead} dead letters)"
+        ))
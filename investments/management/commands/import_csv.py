@@ -1,9 +1,24 @@
-import csv
+# investments/management/commands/import_csv.py
+"""
+Импорт транзакций из CSV
+
+Использование:
+    python manage.py import_csv transactions.csv
+    python manage.py import_csv transactions.csv --chunk-size 50000 --batch-size 2000
+    python manage.py import_csv transactions.csv --dry-run
+
+Файл читается потоково порциями, транзакции вставляются bulk_create,
+equity и метрики пересчитываются один раз на проект (investments.csv_import).
+"""
+
 import os
-from decimal import Decimal, InvalidOperation
+
 from django.core.management.base import BaseCommand
-from django.utils.dateparse import parse_date
-from investments.models import Project, Transaction
+
+from investments.csv_import import BATCH_SIZE, CHUNK_SIZE, import_transactions
+
+# Сколько пропущенных строк показывать
+MAX_ERRORS_SHOWN = 20
 
 
 class Command(BaseCommand):
@@ -11,6 +26,23 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("filepath", type=str, help="Path to CSV file")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help=f"Rows read and inserted per transaction (default: {CHUNK_SIZE})",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Rows per INSERT statement (default: {BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only validate rows, do not write anything",
+        )
 
     def handle(self, *args, **kwargs):
         filepath = kwargs["filepath"]
@@ -19,45 +51,34 @@ class Command(BaseCommand):
             self.stderr.write(f"❌ File not found: {filepath}")
             return
 
-        with open(filepath, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            count = 0
-
-            for row in reader:
-                project_name = row.get("project", "").strip()
-                date = parse_date(row.get("date", "").strip())
-                tx_type = row.get("transaction_type", "").strip()
-
-                # Надёжное чтение чисел как Decimal
-                def parse_decimal(value):
-                    try:
-                        return Decimal(value.strip()) if value and value.strip() else None
-                    except (InvalidOperation, AttributeError):
-                        return None
-
-                investment = parse_decimal(row.get("investment"))
-                returned = parse_decimal(row.get("return"))
-                equity = parse_decimal(row.get("equity"))
-                nav = parse_decimal(row.get("nav"))
-                cash_flow = parse_decimal(row.get("cash_flow"))
-
-                if not project_name or not date or not tx_type:
-                    self.stdout.write(f"⛔ Skipping incomplete row: {row}")
-                    continue
-
-                project, _ = Project.objects.get_or_create(name=project_name)
-
-                Transaction.objects.create(
-                    project=project,
-                    date=date,
-                    transaction_type=tx_type,
-                    investment=investment or Decimal("0"),
-                    return_amount=returned or Decimal("0"),
-                    equity=equity,
-                    nav=nav,
-                    cash_flow=cash_flow,
-                )
-
-                count += 1
-
-            self.stdout.write(self.style.SUCCESS(f"✅ Imported {count} transactions."))
\ No newline at end of file
+        def progress(chunk, imported, errors):
+            self.stdout.write(f"📥 Chunk {chunk}: {imported} rows, {errors} skipped")
+
+        with open(filepath, newline='', encoding='utf-8-sig') as csvfile:
+            result = import_transactions(
+                csvfile,
+                chunk_size=max(kwargs["chunk_size"], 1),
+                batch_size=max(kwargs["batch_size"], 1),
+                dry_run=kwargs["dry_run"],
+                progress=progress,
+            )
+
+        for error in result.errors[:MAX_ERRORS_SHOWN]:
+            self.stdout.write(f"⛔ Skipping line {error.line}: {error.message}")
+        if len(result.errors) > MAX_ERRORS_SHOWN:
+            self.stdout.write(f"⛔ ... and {len(result.errors) - MAX_ERRORS_SHOWN} more skipped rows")
+
+        if result.projects_created:
+            verb = "Would create" if kwargs["dry_run"] else "Created"
+            self.stdout.write(f"🆕 {verb} {len(result.projects_created)} projects: {', '.join(result.projects_created[:10])}")
+
+        if kwargs["dry_run"]:
+            self.stdout.write(self.style.WARNING(
+                f"🔍 Dry run: {result.imported} of {result.rows} rows are valid ({result.elapsed:.2f}s)"
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Imported {result.imported} transactions into {len(result.touched)} projects "
+            f"in {result.elapsed:.2f}s ({result.equity_updated} equity values recalculated)."
+        ))
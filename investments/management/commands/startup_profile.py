@@ -0,0 +1,139 @@
+# investments/management/commands/startup_profile.py
+"""
+Профиль времени импорта при старте (аналог python -X importtime)
+
+Использование:
+    python manage.py startup_profile
+    python manage.py startup_profile --target investments.management.commands.update_all_projects
+    python manage.py startup_profile --top 40 --budget-ms 800
+    python manage.py startup_profile --forbid scipy numpy
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_TARGETS = [
+    'investments.management.commands.check_alerts',
+    'investments.management.commands.update_all_projects',
+]
+
+# Модули, которые не должны попадать в холодный старт cron-команд
+DEFAULT_FORBIDDEN = ['scipy', 'numpy']
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+BOOTSTRAP = """
+import os, sys
+sys.path.insert(0, {base_dir!r})
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+import django
+django.setup()
+import importlib
+for name in {targets!r}:
+    importlib.import_module(name)
+"""
+
+
+class Command(BaseCommand):
+    help = 'Report import-time breakdown of Django startup plus the given target modules'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target',
+            action='append',
+            help='Module imported after django.setup() (repeatable, default: cron commands)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=25,
+            help='Number of slowest modules to show',
+        )
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            help='Fail if total import time exceeds this budget',
+        )
+        parser.add_argument(
+            '--forbid',
+            nargs='*',
+            default=DEFAULT_FORBIDDEN,
+            help='Top-level packages that must not be imported (default: scipy numpy)',
+        )
+
+    def handle(self, *args, **options):
+        targets = options.get('target') or DEFAULT_TARGETS
+        records = self._profile(targets)
+        if not records:
+            raise CommandError('No -X importtime output captured')
+
+        top_level = [r for r in records if r['depth'] == 0]
+        total_us = sum(r['cumulative'] for r in top_level)
+
+        by_package = {}
+        for record in records:
+            package = record['module'].split('.')[0]
+            by_package[package] = by_package.get(package, 0) + record['self']
+
+        self.stdout.write(self.style.SUCCESS(f'⏱️  Startup import time: {total_us / 1000:.1f} ms ({len(records)} modules)'))
+        self.stdout.write(f'Targets: {", ".join(targets)}\n')
+
+        self.stdout.write('Slowest top-level imports (cumulative):')
+        for record in sorted(top_level, key=lambda r: r['cumulative'], reverse=True)[:options['top']]:
+            self.stdout.write(f"  {record['cumulative'] / 1000:9.1f} ms  {record['module']}")
+
+        self.stdout.write('\nBy package (self time):')
+        for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+            share = self_us / total_us * 100 if total_us else 0
+            self.stdout.write(f"  {self_us / 1000:9.1f} ms  {share:5.1f}%  {package}")
+
+        problems = []
+        imported = set(by_package)
+        forbidden = [name for name in options['forbid'] if name in imported]
+        if forbidden:
+            problems.append(f'forbidden packages imported at startup: {", ".join(forbidden)}')
+
+        budget = options.get('budget_ms')
+        if budget is not None and total_us / 1000 > budget:
+            problems.append(f'import time {total_us / 1000:.1f} ms exceeds budget {budget:.1f} ms')
+
+        if problems:
+            raise CommandError('; '.join(problems))
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Startup profile within limits'))
+
+    def _profile(self, targets):
+        """Запустить чистый интерпретатор с -X importtime и разобрать stderr"""
+        code = BOOTSTRAP.format(
+            base_dir=str(settings.BASE_DIR),
+            settings_module=os.environ.get('DJANGO_SETTINGS_MODULE', 'tracker.settings'),
+            targets=list(targets),
+        )
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True,
+            text=True,
+            cwd=str(settings.BASE_DIR),
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+
+        records = []
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if not match:
+                continue
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append({
+                'self': int(self_us),
+                'cumulative': int(cumulative_us),
+                # importtime сдвигает вложенные импорты на 2 пробела на уровень
+                'depth': max(0, (len(indent) - 1) // 2),
+                'module': module,
+            })
+        return records
@@ -1,10 +1,31 @@
 from django.core.management.base import BaseCommand
+from investments.metric_history import compact_history
 from investments.models import Project
+from investments.structured_logging import capture_debug
 
 class Command(BaseCommand):
     help = "Update all project metrics (XIRR, TVPI, DPI, etc.)"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--debug-capture",
+            action="store_true",
+            help="Capture all log events of this run in a ring buffer and print them at the end",
+        )
+
     def handle(self, *args, **kwargs):
+        if not kwargs.get("debug_capture"):
+            return self.update_projects()
+
+        with capture_debug(label="update_all_projects") as capture:
+            try:
+                return self.update_projects()
+            finally:
+                self.stdout.write(f"\n🔎 Debug capture: {len(capture.records)} events (dropped: {capture.dropped})")
+                for line in capture.format_lines():
+                    self.stdout.write(f"  {line}")
+
+    def update_projects(self):
         projects = Project.objects.all()
         count = 0
         for project in projects:
@@ -15,4 +36,9 @@ class Command(BaseCommand):
                 self.stdout.write(f"✅ Updated: {project.name}")
             except Exception as e:
                 self.stderr.write(f"❌ Error updating {project.name}: {e}")
-        self.stdout.write(self.style.SUCCESS(f"✔ Done. Updated {count} projects."))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"✔ Done. Updated {count} projects."))
+
+        # История метрик пишется при сохранении; старые точки прореживаем
+        deleted = compact_history()
+        if deleted:
+            self.stdout.write(f"🗜  Compacted metric history: removed {deleted} old points")
@@ -0,0 +1,194 @@
+# investments/metric_history.py
+"""
+История метрик проектов (ProjectMetricSnapshot).
+
+Запись:
+    record_snapshot(project)   - после пересчета метрик (Project.save, если
+                                 пересчет изменил значения из БД);
+                                 неизменившиеся значения не пишутся,
+                                 в течение дня точка обновляется на месте
+    compact_history()          - прореживание старых точек: старше
+                                 WEEKLY_AFTER_DAYS - последняя точка недели,
+                                 старше MONTHLY_AFTER_DAYS - последняя точка месяца
+
+Чтение (один запрос на все проекты):
+    window_history(metric, since)    - {project_id: MetricWindow}: значение
+                                       на начало окна и точки внутри него
+
+История - ступенчатая функция: значение действует до следующей точки.
+"""
+
+import math
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+
+from .models import ProjectMetricSnapshot
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Хранимые колонки Project, которые попадают в историю
+SNAPSHOT_METRICS = ('irr', 'tvpi', 'dpi', 'nav', 'xnpv', 'gap_to_target', 'moic')
+
+
+def get_config():
+    config = {
+        'WEEKLY_AFTER_DAYS': 90,
+        'MONTHLY_AFTER_DAYS': 365,
+    }
+    config.update(getattr(settings, 'METRIC_HISTORY', {}))
+    return config
+
+
+def _same(a, b):
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+
+
+def _latest_date(on_or_before=None):
+    """Подзапрос: дата последней точки той же метрики того же проекта"""
+    queryset = ProjectMetricSnapshot.objects.filter(
+        project_id=OuterRef('project_id'),
+        metric=OuterRef('metric'),
+    )
+    if on_or_before is not None:
+        queryset = queryset.filter(date__lte=on_or_before)
+    return Subquery(queryset.order_by('-date').values('date')[:1])
+
+
+def record_snapshot(project, today=None):
+    """Записать текущие значения метрик проекта; возвращает число измененных точек"""
+    today = today or date.today()
+    latest = {
+        snapshot.metric: snapshot
+        for snapshot in ProjectMetricSnapshot.objects.filter(
+            project_id=project.id, date=_latest_date()
+        )
+    }
+
+    to_create, to_update = [], []
+    for metric in SNAPSHOT_METRICS:
+        value = getattr(project, metric)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        last = latest.get(metric)
+        if last is not None and _same(last.value, value):
+            continue
+        if last is not None and last.date >= today:
+            last.value = value
+            to_update.append(last)
+        else:
+            to_create.append(ProjectMetricSnapshot(
+                project_id=project.id, metric=metric, date=today, value=value
+            ))
+
+    if to_create:
+        ProjectMetricSnapshot.objects.bulk_create(to_create)
+    if to_update:
+        ProjectMetricSnapshot.objects.bulk_update(to_update, ['value'])
+    return len(to_create) + len(to_update)
+
+
+def compact_history(today=None):
+    """Проредить старые точки; возвращает число удаленных строк"""
+    config = get_config()
+    today = today or date.today()
+    weekly_before = date.fromordinal(today.toordinal() - config['WEEKLY_AFTER_DAYS'])
+    monthly_before = date.fromordinal(today.toordinal() - config['MONTHLY_AFTER_DAYS'])
+
+    rows = ProjectMetricSnapshot.objects.filter(
+        date__lt=weekly_before
+    ).order_by('project_id', 'metric', 'date').values_list('id', 'project_id', 'metric', 'date', 'value')
+
+    def bucket(snapshot_date):
+        if snapshot_date < monthly_before:
+            return ('M', snapshot_date.year, snapshot_date.month)
+        return ('W',) + tuple(snapshot_date.isocalendar()[:2])
+
+    to_delete = []
+    for _, series in groupby(rows.iterator(chunk_size=2000), key=itemgetter(1, 2)):
+        series = list(series)
+        kept_value = None
+        for index, (snapshot_id, _, _, snapshot_date, value) in enumerate(series):
+            # В корзине остается последняя точка
+            if index + 1 < len(series) and bucket(series[index + 1][3]) == bucket(snapshot_date):
+                to_delete.append(snapshot_id)
+            # После прореживания значение не изменилось - точка лишняя
+            elif kept_value is not None and _same(kept_value, value):
+                to_delete.append(snapshot_id)
+            else:
+                kept_value = value
+
+    for start in range(0, len(to_delete), 500):
+        ProjectMetricSnapshot.objects.filter(id__in=to_delete[start:start + 500]).delete()
+
+    if to_delete:
+        logger.info("metric_history.compacted", deleted=len(to_delete))
+    return len(to_delete)
+
+
+class MetricWindow(NamedTuple):
+    """История метрики за окно: значение на начало и точки после него"""
+    since: date
+    baseline: Optional[float]
+    points: List[Tuple[date, float]]
+
+    def change(self, current):
+        """Относительное изменение от начала окна до current (None без базы)"""
+        if self.baseline is None or current is None or self.baseline == 0:
+            return None
+        return (current - self.baseline) / abs(self.baseline)
+
+    def slope(self, today=None):
+        """Наклон МНК (в единицах метрики за день) по ступенчатой истории окна"""
+        today = today or date.today()
+        samples = []
+        if self.baseline is not None:
+            samples.append((self.since, self.baseline))
+        samples.extend(self.points)
+        if not samples:
+            return None
+        # Последнее значение действует до сегодняшнего дня
+        if samples[-1][0] < today:
+            samples.append((today, samples[-1][1]))
+        if len(samples) < 2:
+            return None
+
+        origin = self.since.toordinal()
+        xs = [point_date.toordinal() - origin for point_date, _ in samples]
+        ys = [value for _, value in samples]
+        n = len(samples)
+        mean_x = sum(xs) / n
+        mean_y = sum(ys) / n
+        variance = sum((x - mean_x) ** 2 for x in xs)
+        if variance == 0:
+            return None
+        covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+        return covariance / variance
+
+
+def window_history(metric, since, project_ids=None):
+    """{project_id: MetricWindow} за период (since, сегодня] одним запросом"""
+    queryset = ProjectMetricSnapshot.objects.filter(metric=metric).filter(
+        Q(date__gt=since) | Q(date=_latest_date(since))
+    )
+    if project_ids is not None:
+        queryset = queryset.filter(project_id__in=list(project_ids))
+
+    baselines, points = {}, {}
+    for project_id, snapshot_date, value in queryset.order_by('project_id', 'date').values_list(
+        'project_id', 'date', 'value'
+    ):
+        if snapshot_date <= since:
+            baselines[project_id] = value
+        else:
+            points.setdefault(project_id, []).append((snapshot_date, value))
+
+    return {
+        project_id: MetricWindow(since, baselines.get(project_id), points.get(project_id, []))
+        for project_id in set(baselines) | set(points)
+    }
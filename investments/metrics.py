@@ -6,7 +6,11 @@
 
 from datetime import datetime, date
 from typing import List, Tuple, Optional
-import numpy as np
+
+from .instrumentation import track_solver
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 
 def calculate_mirr(cash_flows: List[float], 
@@ -43,7 +47,7 @@ def calculate_mirr(cash_flows: List[float],
     
     # Проверяем, что есть и инвестиции, и возвраты
     if not negative_flows or not positive_flows:
-        print(f"[mIRR] Недостаточно данных: negative={len(negative_flows)}, positive={len(positive_flows)}")
+        logger.debug("mirr.insufficient_data", negative=len(negative_flows), positive=len(positive_flows))
         return None
     
     # Базовая и конечная даты
@@ -71,10 +75,10 @@ def calculate_mirr(cash_flows: List[float],
     # Расчет mIRR
     try:
         mirr = (fv_positive / pv_negative) ** (1 / total_years) - 1
-        print(f"[mIRR] Calculated: {mirr:.4f} ({mirr*100:.2f}%)")
+        logger.debug("mirr.calculated", sampled=True, mirr=round(mirr, 6))
         return mirr
     except Exception as e:
-        print(f"[mIRR] Calculation error: {e}")
+        logger.warning("mirr.error", error=str(e))
         return None
 
 
@@ -124,7 +128,7 @@ def calculate_portfolio_mirr(projects, finance_rate: float = 0.08, reinvest_rate
             })
     
     if not all_flows:
-        print("[Portfolio mIRR] No cash flows found")
+        logger.debug("portfolio_mirr.no_cash_flows")
         return None
     
     # Сортируем по датам
@@ -134,13 +138,18 @@ def calculate_portfolio_mirr(projects, finance_rate: float = 0.08, reinvest_rate
     cash_flows = [f['amount'] for f in all_flows]
     dates = [f['date'] for f in all_flows]
     
-    print(f"[Portfolio mIRR] Total flows: {len(cash_flows)}")
-    print(f"[Portfolio mIRR] Date range: {dates[0]} to {dates[-1]}")
-    print(f"[Portfolio mIRR] Total invested: ${sum(cf for cf in cash_flows if cf < 0):,.0f}")
-    print(f"[Portfolio mIRR] Total returned + NAV: ${sum(cf for cf in cash_flows if cf > 0):,.0f}")
+    logger.debug(
+        "portfolio_mirr.flows",
+        flows=len(cash_flows),
+        date_from=dates[0],
+        date_to=dates[-1],
+        invested=round(sum(cf for cf in cash_flows if cf < 0), 2),
+        returned_and_nav=round(sum(cf for cf in cash_flows if cf > 0), 2),
+    )
     
     # Рассчитываем mIRR
-    mirr = calculate_mirr(cash_flows, dates, finance_rate, reinvest_rate)
+    with track_solver("mirr"):
+        mirr = calculate_mirr(cash_flows, dates, finance_rate, reinvest_rate)
     
     if mirr is not None:
         return round(mirr * 100, 2)  # Возвращаем в процентах
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0013_alertstatistics_alerttype_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SweepLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('owner', models.CharField(blank=True, max_length=200)),
+                ('status', models.CharField(choices=[('IDLE', 'Idle'), ('RUNNING', 'Running')], default='IDLE', max_length=20)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('last_project_id', models.IntegerField(blank=True, help_text='ID последнего полностью обработанного проекта', null=True)),
+                ('projects_done', models.IntegerField(default=0)),
+                ('last_completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sweep Lock',
+                'verbose_name_plural': 'Sweep Locks',
+            },
+        ),
+    ]
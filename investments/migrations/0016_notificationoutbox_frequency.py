@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0015_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='frequency',
+            field=models.CharField(default='IMMEDIATE', help_text='IMMEDIATE - отдельное письмо, HOURLY/DAILY/WEEKLY - в дайджест', max_length=20),
+        ),
+    ]
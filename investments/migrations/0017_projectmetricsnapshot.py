@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0016_notificationoutbox_frequency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMetricSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=30)),
+                ('date', models.DateField()),
+                ('value', models.FloatField()),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_snapshots', to='investments.project')),
+            ],
+            options={
+                'ordering': ['project', 'metric', 'date'],
+                'indexes': [models.Index(fields=['metric', 'date'], name='investments_metric_c11b1b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'metric', 'date'), name='unique_metric_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0017_projectmetricsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alerttype',
+            name='last_checked',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
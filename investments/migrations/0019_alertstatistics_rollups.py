@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0018_alerttype_last_checked'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertstatistics',
+            name='acknowledgements_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='alertstatistics',
+            name='created_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='alertstatistics',
+            name='resolution_hours_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='alertstatistics',
+            name='resolutions_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='alertstatistics',
+            name='response_hours_sum',
+            field=models.FloatField(default=0),
+        ),
+    ]
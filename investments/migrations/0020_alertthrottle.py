@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0019_alertstatistics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertThrottle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tokens', models.FloatField(default=0)),
+                ('refilled_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('suppressed_count', models.IntegerField(default=0, help_text='Подавлено событий за все время')),
+                ('last_suppressed_at', models.DateTimeField(blank=True, null=True)),
+                ('alert_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='throttles', to='investments.alerttype')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_throttles', to='investments.project')),
+            ],
+            options={
+                'verbose_name': 'Alert Throttle',
+                'verbose_name_plural': 'Alert Throttles',
+                'constraints': [models.UniqueConstraint(fields=('project', 'alert_type'), name='unique_alert_throttle')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0020_alertthrottle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, help_text='Первое число месяца создания алертов')),
+                ('span_start', models.DateField(help_text='Первая дата в daily_counts')),
+                ('span_end', models.DateField(help_text='Последняя дата в daily_counts')),
+                ('alert_count', models.IntegerField(default=0)),
+                ('log_count', models.IntegerField(default=0)),
+                ('first_alert_id', models.IntegerField()),
+                ('last_alert_id', models.IntegerField()),
+                ('data', models.BinaryField(help_text='gzip JSON Lines')),
+                ('daily_counts', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Alert Archive',
+                'verbose_name_plural': 'Alert Archives',
+                'ordering': ['month', 'id'],
+                'indexes': [models.Index(fields=['span_start', 'span_end'], name='investments_span_st_6d69e2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0021_alertarchive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectalert',
+            index=models.Index(fields=['status', 'severity', 'created_at'], name='investments_status_1c1f12_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-19 05:53
+
+from django.db import migrations, models
+
+
+def group_children(apps, schema_editor):
+    # Повторения, созданные как NEW, не должны считаться открытыми
+    ProjectAlert = apps.get_model('investments', 'ProjectAlert')
+    ProjectAlert.objects.filter(parent_alert__isnull=False, status='NEW').update(status='GROUPED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0022_projectalert_sla_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projectalert',
+            name='status',
+            field=models.CharField(choices=[('NEW', 'New'), ('ACKNOWLEDGED', 'Acknowledged'), ('IN_PROGRESS', 'In Progress'), ('RESOLVED', 'Resolved'), ('DISMISSED', 'Dismissed'), ('ESCALATED', 'Escalated'), ('GROUPED', 'Grouped')], db_index=True, default='NEW', max_length=20),
+        ),
+        migrations.RunPython(group_children, migrations.RunPython.noop),
+    ]
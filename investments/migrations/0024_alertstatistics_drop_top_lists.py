@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investments', '0023_projectalert_grouped_status'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='alertstatistics',
+            name='top_projects',
+        ),
+        migrations.RemoveField(
+            model_name='alertstatistics',
+            name='top_types',
+        ),
+    ]
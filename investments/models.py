@@ -1,5 +1,6 @@
 from django.db import models
 from datetime import datetime, timedelta, date
+from .structured_logging import get_logger
 from .utils import (
     calculate_estimated_return,
     gap_to_target,  # ✅ Алиас есть в utils.py
@@ -13,6 +14,8 @@ from .utils import (
     calculate_estimated_return_to_date,
 )
 
+logger = get_logger(__name__)
+
 
 class Project(models.Model):
     STATUS_CHOICES = [
@@ -128,11 +131,12 @@ class Project(models.Model):
                         nav_date = last_transaction.date if last_transaction else date.today()
                     
                     cash_flows.append((nav_date, abs(nav)))
-                    print(f"[DEBUG] Active project {self.name}: added NAV {abs(nav)} on date {nav_date} (not today!)")
+                    logger.debug("cash_flows.nav_added", sampled=True, project=self.name,
+                                 nav=abs(nav), nav_date=nav_date)
             
             elif self.status == 'closed':
-                # Для закрытых проектов не добавляем NAV
-                print(f"[DEBUG] Closed project {self.name}: NAV not added (should be in final transaction)")
+                # Для закрытых проектов не добавляем NAV (он должен быть в финальной транзакции)
+                logger.debug("cash_flows.nav_skipped", sampled=True, project=self.name)
         
         return cash_flows
 
@@ -234,6 +238,32 @@ class Project(models.Model):
         else:
             self.xnpv = None
 
+    def recalculate_equity(self):
+        """
+        Пересчитать equity всех транзакций проекта по правилам Transaction.save
+        (после bulk_create, который save не вызывает). Возвращает число
+        измененных транзакций.
+        """
+        walker = EquityWalker()
+        changed = []
+        for tx in self.transactions.order_by('date', 'id').only(
+            'id', 'project_id', 'date', 'transaction_type', 'investment', 'return_amount', 'equity'
+        ):
+            equity = walker.step(tx.date, tx.transaction_type, tx.investment, tx.return_amount, tx.equity)
+            if equity != tx.equity:
+                tx.equity = equity
+                changed.append(tx)
+        Transaction.objects.bulk_update(changed, ['equity'], batch_size=1000)
+        return len(changed)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        from .metric_history import SNAPSHOT_METRICS
+        # Метрики при загрузке: история пишется, только если пересчет их изменил
+        instance._loaded_metrics = {metric: instance.__dict__.get(metric) for metric in SNAPSHOT_METRICS}
+        return instance
+
     def save(self, *args, **kwargs):
         """Сохранить проект с обновлением метрик"""
         is_new = self.pk is None
@@ -247,6 +277,12 @@ class Project(models.Model):
                 "gap_to_target", "xnpv", "nav", "estimated_return",
                 "moic", "moic_source"
             ])
+            from .metric_history import SNAPSHOT_METRICS, record_snapshot
+            metrics = {metric: getattr(self, metric) for metric in SNAPSHOT_METRICS}
+            # Без изменений не тратим чтение и запись истории (массовые пересчеты)
+            if metrics != getattr(self, '_loaded_metrics', None):
+                record_snapshot(self)
+            self._loaded_metrics = metrics
 
     def horizon_years(self):
         """Получить горизонт проекта в годах"""
@@ -321,6 +357,36 @@ class Project(models.Model):
         }
 
 
+class EquityWalker:
+    """
+    Equity по правилам Transaction.save для транзакций проекта в порядке
+    (date, id): Investment/Return - equity предыдущей даты + инвестиции -
+    возвраты, остальные типы сохраняют свою equity (или 0). При нескольких
+    транзакциях за дату equity даты берется у последней Investment/Return.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.previous_equity = 0
+        self.day_equity = 0
+        self.day_has_flow = False
+
+    def step(self, tx_date, transaction_type, investment, return_amount, equity):
+        """Equity очередной транзакции"""
+        if tx_date != self.day:
+            self.previous_equity = self.day_equity
+            self.day, self.day_has_flow = tx_date, False
+        is_flow = transaction_type in ['Investment', 'Return']
+        if is_flow:
+            equity = round(self.previous_equity + (investment or 0) - (return_amount or 0), 2)
+        else:
+            equity = equity or 0
+        if is_flow or not self.day_has_flow:
+            self.day_equity = equity
+        self.day_has_flow = self.day_has_flow or is_flow
+        return equity
+
+
 class Transaction(models.Model):
     """Модель транзакции проекта"""
     
@@ -343,10 +409,8 @@ class Transaction(models.Model):
     def __str__(self):
         return f"{self.project.name} - {self.date}"
 
-    def save(self, *args, **kwargs):
-        """Сохранить транзакцию с автоматическим заполнением и расчетом equity"""
-        
-        # 🔧 АВТОМАТИЧЕСКОЕ ЗАПОЛНЕНИЕ в зависимости от типа
+    def fill_type_defaults(self):
+        """Обнулить суммы, не относящиеся к типу транзакции"""
         if self.transaction_type == 'Investment':
             if not self.investment:
                 self.investment = 0
@@ -364,6 +428,12 @@ class Transaction(models.Model):
             if not self.nav:
                 self.nav = 0
 
+    def save(self, *args, **kwargs):
+        """Сохранить транзакцию с автоматическим заполнением и расчетом equity"""
+        
+        # 🔧 АВТОМАТИЧЕСКОЕ ЗАПОЛНЕНИЕ в зависимости от типа
+        self.fill_type_defaults()
+
         # Расчет equity для всех типов кроме NAV
         if self.transaction_type in ['Investment', 'Return']:
             # Находим предыдущую транзакцию для расчета equity
@@ -409,6 +479,32 @@ class Transaction(models.Model):
         ordering = ['date']
 
 
+class ProjectMetricSnapshot(models.Model):
+    """
+    История хранимых метрик проекта (investments.metric_history).
+
+    Точка пишется только при изменении значения, не чаще раза в день;
+    старые точки прореживаются до недельных и месячных.
+    """
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="metric_snapshots")
+    metric = models.CharField(max_length=30)
+    date = models.DateField()
+    value = models.FloatField()
+
+    class Meta:
+        ordering = ['project', 'metric', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'metric', 'date'], name='unique_metric_snapshot'),
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id} {self.metric}@{self.date} = {self.value}"
+
+
 def recalculate_all_metrics():
     """Пересчитать метрики для всех проектов"""
     for project in Project.objects.all():
@@ -477,7 +573,7 @@ class Portfolio(models.Model):
         try:
             return xirr(datetime_flows)
         except Exception as e:
-            print(f"[Portfolio XIRR] Error: {e}")
+            logger.warning("portfolio_xirr.error", error=str(e))
             return None
     
     def calculate_portfolio_mirr(self):
@@ -0,0 +1,220 @@
+# investments/nav_analytics.py
+"""
+Аналитика ряда стоимости проекта (NAV, а где его нет - equity).
+
+Ряд [(date, value)] переводится в массивы NumPy один раз, и по ним
+считаются:
+
+    changes            - изменение, % за окна WINDOWS (1/7/30/90 дней):
+                         последнее значение против значения на дату
+                         today - окно (последнего на эту дату или раньше)
+    drawdown_series    - просадка, % от бегущего максимума в каждой точке
+    max_drawdown       - максимальная просадка, ее пик и дно
+    recovery_days      - дней от дна максимальной просадки до возврата
+                         к пику (None - не восстановилась)
+    drawdown_days      - сколько дней длится текущая просадка
+    max_drawdown_days  - самый долгий период ниже пика
+    rolling_sharpe     - скользящие волатильность и Sharpe по доходностям
+                         между отметками NAV (без учета потоков капитала)
+
+Проверки алертов берут изменения по ряду NAV (ctx.nav_analytics), а
+просадки - по ряду NAV/equity (ctx.value_analytics). NumPy импортируется
+при первом расчете, а не при загрузке модуля. Для набора проектов ряды
+берутся из ProjectEvaluationContext.load_many - одним запросом на все
+транзакции.
+"""
+
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+WINDOWS = (1, 7, 30, 90)
+
+
+class NavAnalytics(NamedTuple):
+    as_of: date
+    current: float
+    changes: Dict[int, Optional[float]]
+    past_values: Dict[int, Optional[float]]
+    peak: float
+    current_drawdown: float
+    drawdown_days: int
+    max_drawdown: float
+    max_drawdown_peak_date: date
+    max_drawdown_trough_date: date
+    recovery_days: Optional[int]
+    max_drawdown_days: int
+
+    def as_dict(self):
+        """Для JSON (ключи окон - строки)"""
+        data = self._asdict()
+        data['changes'] = {str(days): value for days, value in self.changes.items()}
+        data['past_values'] = {str(days): value for days, value in self.past_values.items()}
+        return data
+
+
+def _arrays(series):
+    """Массивы (порядковые дни, значения); для одной даты - последнее значение"""
+    import numpy as np
+
+    days = np.fromiter((point[0].toordinal() for point in series), dtype=np.int64, count=len(series))
+    values = np.fromiter((point[1] for point in series), dtype=np.float64, count=len(series))
+    last_of_day = np.append(days[1:] != days[:-1], True)
+    return days[last_of_day], values[last_of_day]
+
+
+def _optional(value):
+    import numpy as np
+
+    return None if np.isnan(value) else float(value)
+
+
+def _drawdowns(values):
+    """Бегущий максимум и просадка от него, %"""
+    import numpy as np
+
+    running_max = np.maximum.accumulate(values)
+    drawdowns = np.divide(
+        running_max - values, running_max,
+        out=np.zeros_like(values), where=running_max > 0,
+    ) * 100
+    return running_max, drawdowns
+
+
+def drawdown_series(series):
+    """[(date, просадка %)] от бегущего максимума"""
+    if not series:
+        return []
+    days, values = _arrays(series)
+    _, drawdowns = _drawdowns(values)
+    return [(date.fromordinal(int(day)), float(value)) for day, value in zip(days, drawdowns)]
+
+
+def analyze(series, today=None, windows=WINDOWS):
+    """NavAnalytics по ряду [(date, value)] в порядке дат; None для пустого ряда"""
+    import numpy as np
+
+    if not series:
+        return None
+    today = today or date.today()
+    days, values = _arrays(series)
+    current = values[-1]
+
+    # Изменения за окна: значение на дату today - окно или раньше
+    windows = tuple(windows)
+    positions = np.searchsorted(days, today.toordinal() - np.asarray(windows, dtype=np.int64), side='right') - 1
+    past = np.where(positions >= 0, values[np.clip(positions, 0, None)], np.nan)
+    valid = past > 0
+    changes = np.full(len(windows), np.nan)
+    changes[valid] = (current - past[valid]) / past[valid] * 100
+
+    # Просадки от бегущего максимума
+    running_max, drawdowns = _drawdowns(values)
+
+    trough = int(np.argmax(drawdowns))
+    peak_value = running_max[trough]
+    peak = int(np.flatnonzero(values[:trough + 1] >= peak_value)[-1])
+    recovered = np.flatnonzero(values[trough:] >= peak_value)
+    recovery_days = int(days[trough + recovered[0]] - days[trough]) if recovered.size and trough != peak else None
+
+    # Периоды ниже пика: между соседними точками на пике (и от последнего пика до today)
+    at_peak = np.flatnonzero(drawdowns == 0)
+    underwater = np.diff(days[at_peak])[np.diff(at_peak) > 1]
+    open_days = today.toordinal() - int(days[at_peak[-1]]) if at_peak[-1] != len(values) - 1 else 0
+    max_drawdown_days = int(max(underwater.max() if underwater.size else 0, open_days))
+
+    return NavAnalytics(
+        as_of=today,
+        current=float(current),
+        changes={window: _optional(change) for window, change in zip(windows, changes)},
+        past_values={window: _optional(value) for window, value in zip(windows, past)},
+        peak=float(running_max[-1]),
+        current_drawdown=float(drawdowns[-1]),
+        drawdown_days=open_days,
+        max_drawdown=float(drawdowns[trough]),
+        max_drawdown_peak_date=date.fromordinal(int(days[peak])),
+        max_drawdown_trough_date=date.fromordinal(int(days[trough])),
+        recovery_days=recovery_days,
+        max_drawdown_days=max_drawdown_days,
+    )
+
+
+class RollingSharpe(NamedTuple):
+    dates: List[date]
+    volatility: List[float]
+    sharpe: List[float]
+    periods_per_year: float
+
+
+def rolling_sharpe(series, flows=(), window=4, risk_free=0.0):
+    """
+    Скользящие волатильность и Sharpe (годовые) по окнам из window
+    доходностей между соседними отметками ряда [(date, value)].
+
+    Потоки [(date, amount)] (вложения +, возвраты -) между отметками
+    вычитаются из прироста стоимости. Частота отметок - медианный
+    интервал между ними. None - отметок меньше window + 1.
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    if len(series) < window + 1:
+        return None
+    days, values = _arrays(series)
+    if len(values) < window + 1:
+        return None
+
+    # Нарастающий поток на каждую отметку: потоки в (предыдущая, текущая]
+    flow_days = np.fromiter((point[0].toordinal() for point in flows), dtype=np.int64, count=len(flows))
+    flow_amounts = np.fromiter((point[1] for point in flows), dtype=np.float64, count=len(flows))
+    order = np.argsort(flow_days, kind='stable')
+    cumulative = np.concatenate(([0.0], np.cumsum(flow_amounts[order])))
+    at_mark = cumulative[np.searchsorted(flow_days[order], days, side='right')]
+
+    previous = values[:-1]
+    gains = values[1:] - previous - np.diff(at_mark)
+    returns = np.divide(gains, previous, out=np.full_like(gains, np.nan), where=previous > 0)
+
+    periods_per_year = 365.0 / max(float(np.median(np.diff(days))), 1.0)
+    windows = sliding_window_view(returns, window)
+    mean = windows.mean(axis=1)
+    std = windows.std(axis=1, ddof=1)
+    volatility = std * np.sqrt(periods_per_year)
+    sharpe = np.divide(
+        (mean - risk_free / periods_per_year) * np.sqrt(periods_per_year), std,
+        out=np.full_like(mean, np.nan), where=std > 0,
+    )
+    return RollingSharpe(
+        dates=[date.fromordinal(int(day)) for day in days[window:]],
+        volatility=[_optional(value) for value in volatility],
+        sharpe=[_optional(value) for value in sharpe],
+        periods_per_year=periods_per_year,
+    )
+
+
+def summarize(ctx):
+    """
+    Сводка для API по ProjectEvaluationContext: изменения за окна по ряду
+    NAV, просадки - по ряду NAV/equity (как в проверках NAV_DROP и DRAWDOWN)
+    """
+    nav, value = ctx.nav_analytics, ctx.value_analytics
+    return {
+        'as_of': ctx.today,
+        'nav': nav.current if nav else None,
+        'changes': nav.as_dict()['changes'] if nav else {},
+        'drawdown': {
+            field: getattr(value, field)
+            for field in (
+                'peak', 'current_drawdown', 'drawdown_days', 'max_drawdown',
+                'max_drawdown_peak_date', 'max_drawdown_trough_date',
+                'recovery_days', 'max_drawdown_days',
+            )
+        } if value else None,
+    }
+
+
+def analyze_many(projects):
+    """{project_id: summarize()} для набора проектов - один запрос транзакций"""
+    from .alerts_context import ProjectEvaluationContext
+
+    contexts = ProjectEvaluationContext.load_many(projects)
+    return {project_id: summarize(ctx) for project_id, ctx in contexts.items()}
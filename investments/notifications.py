@@ -0,0 +1,472 @@
+# investments/notifications.py
+"""
+Очередь уведомлений об алертах (NotificationOutbox) и ее доставка.
+
+AlertManager только ставит сообщения в очередь; deliver_pending() забирает
+пакет, отправляет его через одно соединение почтового бэкенда
+(get_connection + send_messages) и планирует повтор с экспоненциальной
+задержкой. После MAX_ATTEMPTS неудачных попыток сообщение становится
+dead letter (статус DEAD) и ждет ручного requeue_dead().
+
+Дайджесты: если у пользователя AlertSettings.email_frequency HOURLY, DAILY
+или WEEKLY, уведомления ставятся в очередь на ближайшее время дайджеста
+(email_digest_time) и при доставке склеиваются в одно письмо на
+пользователя. Число писем ограничено числом пользователей, а не алертов.
+
+Получателей определяет NotificationRouter - индекс по AlertSettings
+(severity -> пользователи, тип -> подписчики, проект -> подписчики),
+который строится один раз и сбрасывается сигналами при изменении настроек
+(версия в общем кэше, см. investments/signals.py).
+
+Настройки (settings.NOTIFICATIONS):
+    BATCH_SIZE    - сколько сообщений забирать за один пакет
+    MAX_ATTEMPTS  - попыток до dead letter
+    BACKOFF_BASE  - задержка первого повтора в секундах (дальше удваивается)
+    BACKOFF_MAX   - максимальная задержка в секундах
+    CLAIM_TTL     - через сколько секунд сообщение, забранное упавшим
+                    воркером (SENDING), снова доступно для отправки; результат
+                    записывается только пока claim_token воркера не сменился
+    ROUTER_TTL    - сколько секунд индекс получателей считается свежим
+                    (quiet hours и выходные зависят от времени)
+"""
+
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .alerts_models import AlertLog, AlertSettings, NotificationOutbox, ProjectAlert
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_config():
+    config = {
+        'BATCH_SIZE': 100,
+        'MAX_ATTEMPTS': 5,
+        'BACKOFF_BASE': 60,
+        'BACKOFF_MAX': 3600,
+        'CLAIM_TTL': 300,
+        'ROUTER_TTL': 60,
+    }
+    config.update(getattr(settings, 'NOTIFICATIONS', {}))
+    return config
+
+
+ROUTER_VERSION_KEY = 'alerts_notification_router_version'
+SEVERITY_LEVELS = ['INFO', 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
+
+def current_router_version():
+    return cache.get(ROUTER_VERSION_KEY, 0)
+
+
+def invalidate_router():
+    """Сбросить индекс получателей во всех процессах"""
+    try:
+        cache.incr(ROUTER_VERSION_KEY)
+    except ValueError:
+        cache.set(ROUTER_VERSION_KEY, 1, None)
+
+
+class NotificationRouter:
+    """
+    Индекс получателей уведомлений по AlertSettings.
+
+    Строится несколькими запросами; дальше получатели алерта находятся
+    пересечением множеств, без запросов к БД. Отпуск, quiet hours и выходные
+    вычисляются на момент построения (поэтому индекс живет ROUTER_TTL секунд).
+    """
+
+    def __init__(self, now=None):
+        now = now or timezone.now()
+        self.built_at = now
+        self.version = current_router_version()
+
+        self.admins = list(User.objects.filter(is_staff=True, is_active=True))
+        self.users = {}
+        self.settings_by_user = {}
+        self.severity_users = {severity: set() for severity in SEVERITY_LEVELS}
+        self.any_type = set()
+        self.type_subscribers = defaultdict(set)
+        self.any_project = set()
+        self.project_subscribers = defaultdict(set)
+
+        rows = list(AlertSettings.objects.filter(email_enabled=True).select_related('user'))
+        types_by_settings = self._subscriptions(AlertSettings.subscribed_types.through, 'alerttype_id')
+        projects_by_settings = self._subscriptions(AlertSettings.subscribed_projects.through, 'project_id')
+
+        expired_vacations = []
+        for row in rows:
+            user_id = row.user_id
+            # Расписание дайджестов нужно и для тех, кто сейчас не получает уведомлений
+            self.settings_by_user[user_id] = row
+
+            if row.vacation_mode:
+                if row.vacation_mode_until and now > row.vacation_mode_until:
+                    expired_vacations.append(row.id)
+                else:
+                    continue
+            if row.is_muted_at(now):
+                continue
+
+            self.users[user_id] = row.user
+            min_level = SEVERITY_LEVELS.index(row.min_severity)
+            for severity in SEVERITY_LEVELS[min_level:]:
+                self.severity_users[severity].add(user_id)
+
+            type_ids = types_by_settings.get(row.id)
+            if type_ids:
+                for type_id in type_ids:
+                    self.type_subscribers[type_id].add(user_id)
+            else:
+                self.any_type.add(user_id)
+
+            project_ids = projects_by_settings.get(row.id)
+            if project_ids:
+                for project_id in project_ids:
+                    self.project_subscribers[project_id].add(user_id)
+            else:
+                self.any_project.add(user_id)
+
+        if expired_vacations:
+            # Отпуск закончился - выключаем одним UPDATE
+            AlertSettings.objects.filter(id__in=expired_vacations).update(vacation_mode=False)
+
+    @staticmethod
+    def _subscriptions(through, target_field):
+        """{alertsettings_id: set(id)} по таблице подписок"""
+        subscriptions = defaultdict(set)
+        pairs = through.objects.filter(alertsettings__email_enabled=True).values_list('alertsettings_id', target_field)
+        for settings_id, target_id in pairs:
+            subscriptions[settings_id].add(target_id)
+        return subscriptions
+
+    def is_fresh(self, now=None, ttl=None):
+        ttl = ttl if ttl is not None else get_config()['ROUTER_TTL']
+        age = ((now or timezone.now()) - self.built_at).total_seconds()
+        return age < ttl and self.version == current_router_version()
+
+    def recipients(self, alert):
+        """Пользователи, которым нужно уведомление об алерте"""
+        recipients = {}
+
+        # Администраторы всегда получают критические алерты
+        if alert.severity == 'CRITICAL':
+            for admin in self.admins:
+                recipients[admin.id] = admin
+
+        user_ids = (
+            self.severity_users.get(alert.severity, set())
+            & (self.any_type | self.type_subscribers.get(alert.alert_type_id, set()))
+            & (self.any_project | self.project_subscribers.get(alert.project_id, set()))
+        )
+        for user_id in sorted(user_ids):
+            recipients[user_id] = self.users[user_id]
+        return list(recipients.values())
+
+
+_router = None
+
+
+def get_router(now=None):
+    """Индекс получателей текущего процесса (перестраивается при изменении настроек)"""
+    global _router
+    if _router is None or not _router.is_fresh(now):
+        _router = NotificationRouter(now)
+    return _router
+
+
+def render_alert_email(alert):
+    """Тема и текст письма об алерте"""
+    subject = f"[{alert.get_severity_display()}] {alert.title}"
+    site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000')
+
+    body = f"""
+            {alert.get_severity_icon()} HEDGE FUND TRACKER ALERT
+
+            Project: {alert.project.name}
+            Type: {alert.alert_type.name}
+            Severity: {alert.get_severity_display()}
+
+            {alert.message}
+
+            {f"Metric Value: {alert.metric_value}" if alert.metric_value else ""}
+            {f"Threshold: {alert.threshold_value}" if alert.threshold_value else ""}
+            {f"Deviation: {alert.deviation:.1f}%" if alert.deviation else ""}
+
+            View details: {site_url}/admin/investments/projectalert/{alert.id}/
+
+            ---
+            This is an automated message from Hedge Fund Tracker
+            """
+    return subject, body
+
+
+DIGEST_FREQUENCIES = ('HOURLY', 'DAILY', 'WEEKLY')
+DEFAULT_DIGEST_TIME = time(9, 0)
+
+
+def next_digest_at(frequency, digest_time=None, now=None):
+    """
+    Ближайшее время отправки дайджеста после now.
+
+    HOURLY - каждый час в минуту digest_time, DAILY - ежедневно в digest_time,
+    WEEKLY - по понедельникам в digest_time (по умолчанию 09:00).
+    """
+    now = timezone.localtime(now or timezone.now())
+    digest_time = digest_time or DEFAULT_DIGEST_TIME
+
+    if frequency == 'HOURLY':
+        candidate = now.replace(minute=digest_time.minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(hours=1)
+        return candidate
+
+    candidate = now.replace(hour=digest_time.hour, minute=digest_time.minute, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    if frequency == 'WEEKLY':
+        candidate += timedelta(days=(7 - candidate.weekday()) % 7)
+    return candidate
+
+
+def build_email_entries(alert, users, settings_by_user=None, now=None):
+    """
+    Несохраненные записи outbox для пользователей (без email - пропускаются).
+
+    settings_by_user: {user_id: AlertSettings} - для расписания дайджестов.
+    """
+    settings_by_user = settings_by_user or {}
+    now = now or timezone.now()
+    subject, body = render_alert_email(alert)
+
+    entries = []
+    for user in users:
+        if not user.email:
+            continue
+        user_settings = settings_by_user.get(user.id)
+        frequency = user_settings.email_frequency if user_settings else 'IMMEDIATE'
+        if frequency in DIGEST_FREQUENCIES:
+            send_at = next_digest_at(frequency, user_settings.email_digest_time, now)
+        else:
+            frequency, send_at = 'IMMEDIATE', now
+        entries.append(NotificationOutbox(
+            alert=alert,
+            user=user,
+            channel='EMAIL',
+            frequency=frequency,
+            recipient=user.email,
+            subject=subject[:300],
+            body=body,
+            next_attempt_at=send_at,
+        ))
+    return entries
+
+
+SEVERITY_ORDER = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3, 'INFO': 4}
+
+
+def render_digest_email(entries):
+    """Тема и текст одного письма-дайджеста по записям outbox одного пользователя"""
+    alerts = [entry.alert for entry in entries]
+    critical = sum(1 for alert in alerts if alert.severity == 'CRITICAL')
+    site_url = getattr(settings, 'SITE_URL', 'http://localhost:8000')
+
+    subject = f"[HFT] Alert digest: {len(alerts)} alerts"
+    if critical:
+        subject += f" ({critical} critical)"
+
+    lines = [
+        f"HEDGE FUND TRACKER - {entries[0].frequency.title()} alert digest",
+        "=" * 50,
+        "",
+    ]
+    for alert in sorted(alerts, key=lambda a: (SEVERITY_ORDER.get(a.severity, 99), a.created_at)):
+        lines.append(f"{alert.get_severity_icon()} [{alert.severity}] {alert.project.name}: {alert.title}")
+        lines.append(f"    {alert.message}")
+        lines.append(f"    {site_url}/admin/investments/projectalert/{alert.id}/")
+    lines += ["", "---", "This is an automated message from Hedge Fund Tracker"]
+    return subject, "\n".join(lines)
+
+
+
+def backoff_delay(attempts, config=None):
+    """Задержка перед следующей попыткой после attempts неудачных"""
+    config = config or get_config()
+    delay = config['BACKOFF_BASE'] * 2 ** max(0, attempts - 1)
+    return timedelta(seconds=min(delay, config['BACKOFF_MAX']))
+
+
+def _claim_batch(batch_size, now, config):
+    """Забрать пакет сообщений (безопасно при нескольких воркерах)"""
+    due = (
+        Q(status='PENDING') | Q(status='SENDING')
+    ) & Q(next_attempt_at__lte=now)
+    ids = list(
+        NotificationOutbox.objects.filter(due)
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    claim = dict(
+        status='SENDING',
+        claim_token=token,
+        next_attempt_at=now + timedelta(seconds=config['CLAIM_TTL']),
+    )
+    NotificationOutbox.objects.filter(due, id__in=ids).update(**claim)
+
+    # Дайджест не должен делиться между пакетами: добираем все готовые
+    # записи дайджестов тех же получателей
+    digest_recipients = set(
+        NotificationOutbox.objects.filter(claim_token=token)
+        .exclude(frequency='IMMEDIATE')
+        .values_list('recipient', flat=True)
+    )
+    if digest_recipients:
+        NotificationOutbox.objects.filter(
+            due, recipient__in=digest_recipients
+        ).exclude(frequency='IMMEDIATE').update(**claim)
+
+    return list(
+        NotificationOutbox.objects.filter(claim_token=token, status='SENDING')
+        .select_related('alert', 'alert__project', 'user')
+        .order_by('id')
+    )
+
+
+def _group_messages(entries):
+    """[(записи, EmailMessage)]: отдельное письмо или один дайджест на получателя"""
+    groups = OrderedDict()
+    for entry in entries:
+        if entry.frequency == 'IMMEDIATE':
+            groups[('IMMEDIATE', entry.id)] = [entry]
+        else:
+            groups.setdefault((entry.frequency, entry.recipient), []).append(entry)
+
+    messages = []
+    for (frequency, _), group in groups.items():
+        if frequency == 'IMMEDIATE':
+            subject, body = group[0].subject, group[0].body
+        else:
+            subject, body = render_digest_email(group)
+        messages.append((group, EmailMessage(
+            subject,
+            body,
+            settings.DEFAULT_FROM_EMAIL,
+            [group[0].recipient],
+        )))
+    return messages
+
+
+def deliver_pending(batch_size=None, connection=None):
+    """
+    Отправить один пакет сообщений из очереди.
+
+    Возвращает счетчики: claimed, sent, retried, dead.
+    """
+    config = get_config()
+    now = timezone.now()
+    entries = _claim_batch(batch_size or config['BATCH_SIZE'], now, config)
+    result = {'claimed': len(entries), 'sent': 0, 'retried': 0, 'dead': 0, 'messages': 0}
+    if not entries:
+        return result
+
+    connection = connection or get_connection(fail_silently=False)
+    sent, failed = [], []
+    try:
+        connection.open()
+    except Exception as e:
+        # Бэкенд недоступен - весь пакет уходит на повтор
+        failed = [(entry, str(e)) for entry in entries]
+    else:
+        try:
+            for group, message in _group_messages(entries):
+                try:
+                    # Отдельный вызов на письмо - свой результат у каждой группы,
+                    # соединение при этом одно на весь пакет
+                    connection.send_messages([message])
+                except Exception as e:
+                    failed.extend((entry, str(e)) for entry in group)
+                else:
+                    sent.extend(group)
+                    result['messages'] += 1
+        finally:
+            connection.close()
+
+    finished_at = timezone.now()
+    token = entries[0].claim_token
+    for entry in sent:
+        entry.status = 'SENT'
+        entry.attempts += 1
+        entry.sent_at = finished_at
+        entry.last_error = ''
+    for entry, error in failed:
+        entry.attempts += 1
+        entry.last_error = error[:2000]
+        if entry.attempts >= config['MAX_ATTEMPTS']:
+            entry.status = 'DEAD'
+            result['dead'] += 1
+            logger.error("notifications.dead_letter", id=entry.id,
+                         recipient=entry.recipient, attempts=entry.attempts, error=error)
+        else:
+            entry.status = 'PENDING'
+            entry.next_attempt_at = finished_at + backoff_delay(entry.attempts, config)
+            result['retried'] += 1
+            logger.warning("notifications.retry", id=entry.id, recipient=entry.recipient,
+                           attempts=entry.attempts, error=error)
+
+    with transaction.atomic():
+        # Claim мог истечь и перейти к другому воркеру - его записи не трогаем
+        owned = set(
+            NotificationOutbox.objects.filter(id__in=[entry.id for entry in entries], claim_token=token)
+            .values_list('id', flat=True)
+        )
+        lost = len(entries) - len(owned)
+        if lost:
+            logger.warning("notifications.claim_lost", entries=lost)
+            entries = [entry for entry in entries if entry.id in owned]
+            sent = [entry for entry in sent if entry.id in owned]
+        NotificationOutbox.objects.filter(claim_token=token).bulk_update(
+            entries, ['status', 'attempts', 'sent_at', 'last_error', 'next_attempt_at']
+        )
+        if sent:
+            ProjectAlert.objects.filter(id__in={entry.alert_id for entry in sent}).update(
+                email_sent=True,
+                email_sent_at=finished_at,
+            )
+            AlertLog.objects.bulk_create([
+                AlertLog(
+                    alert_id=entry.alert_id,
+                    action='EMAIL_SENT',
+                    user=entry.user,
+                    details=f"Email sent to {entry.recipient}",
+                )
+                for entry in sent
+            ])
+
+    result['sent'] = len(sent)
+    logger.info("notifications.batch_delivered", **result)
+    return result
+
+
+def requeue_dead(queryset=None):
+    """Вернуть dead letters в очередь со сброшенным счетчиком попыток"""
+    queryset = queryset if queryset is not None else NotificationOutbox.objects.all()
+    return queryset.filter(status='DEAD').update(
+        status='PENDING',
+        attempts=0,
+        next_attempt_at=timezone.now(),
+        claim_token='',
+    )
@@ -0,0 +1,485 @@
+# investments/rule_engine.py
+"""
+Движок пользовательских условий AlertRule (condition_type = CUSTOM).
+
+Условие разбирается один раз в ограниченное подмножество Python и
+компилируется в дерево замыканий; результат кэшируется по
+(rule.id, rule.updated_at), поэтому проверка правила по сотням проектов
+не перекомпилирует код.
+
+Поддерживается:
+    - одно выражение:             value < threshold and project.status == 'active'
+    - операторы присваивания и if, результат в переменной result:
+          gap = project.irr - project.target_irr
+          if gap < -0.05:
+              result = True
+
+Доступные имена: value, threshold, project (только поля из
+PROJECT_ATTRIBUTES), функции abs/min/max/round, True/False/None.
+Циклы, импорты, вызовы методов, доступ к атрибутам с "_" запрещены.
+Каждое вычисление ограничено бюджетом шагов (settings.ALERT_RULES['STEP_BUDGET']),
+а результаты +, * и ** - размером (MAX_SEQUENCE, MAX_INTEGER_BITS).
+"""
+
+import ast
+import operator
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .instrumentation import record_cache_access
+
+# Поля проекта, доступные в условиях (хранимые значения, без запросов к БД)
+PROJECT_ATTRIBUTES = frozenset({
+    'id', 'name', 'status', 'target_irr', 'start_date', 'end_date',
+    'invested', 'returned', 'irr', 'tvpi', 'dpi', 'gap_to_target',
+    'xnpv', 'nav', 'estimated_return', 'moic',
+})
+
+SAFE_FUNCTIONS = {
+    'abs': abs,
+    'min': min,
+    'max': max,
+    'round': round,
+}
+
+CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+INPUT_NAMES = ('project', 'value', 'threshold')
+
+BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+UNARY_OPS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: operator.not_,
+}
+
+COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+MAX_EXPONENT = 100
+MAX_SEQUENCE = 1000
+MAX_SOURCE_LENGTH = 4000
+MAX_NODES = 400
+
+
+SEQUENCE_TYPES = (str, tuple, list)
+
+# Размер проверяется до вычисления: x = x + x или x = x * x в нескольких
+# строках иначе удваивает память на каждом шаге
+MAX_INTEGER_BITS = 4096
+
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _check_sequence(length):
+    if length > MAX_SEQUENCE:
+        raise ValueError("Sequence too large")
+
+
+def _check_integer(bits):
+    if bits > MAX_INTEGER_BITS:
+        raise ValueError("Number too large")
+
+
+def _bounded_add(a, b):
+    if isinstance(a, SEQUENCE_TYPES) and isinstance(b, SEQUENCE_TYPES):
+        _check_sequence(len(a) + len(b))
+    return a + b
+
+
+def _bounded_mul(a, b):
+    if isinstance(a, SEQUENCE_TYPES) and isinstance(b, int):
+        _check_sequence(len(a) * max(b, 0))
+    elif isinstance(b, SEQUENCE_TYPES) and isinstance(a, int):
+        _check_sequence(len(b) * max(a, 0))
+    elif _is_integer(a) and _is_integer(b):
+        _check_integer(a.bit_length() + b.bit_length())
+    return a * b
+
+
+def _bounded_pow(a, b):
+    if isinstance(b, (int, float)) and abs(b) > MAX_EXPONENT:
+        raise ValueError("Exponent too large")
+    if _is_integer(a) and _is_integer(b) and b > 0:
+        _check_integer(a.bit_length() * b)
+    return a ** b
+
+
+def _bounded_mod(a, b):
+    # '%0999999999d' % 1 - выделение памяти шириной формата
+    if isinstance(a, str):
+        raise ValueError("String formatting is not allowed")
+    return a % b
+
+
+BOUNDED_OPS = {
+    operator.add: _bounded_add,
+    operator.mul: _bounded_mul,
+    operator.pow: _bounded_pow,
+    operator.mod: _bounded_mod,
+}
+
+
+def get_config():
+    config = {
+        'STEP_BUDGET': 1000,
+        'CACHE_SIZE': 512,
+    }
+    config.update(getattr(settings, 'ALERT_RULES', {}))
+    return config
+
+
+class RuleSyntaxError(ValueError):
+    """Условие содержит неподдерживаемую конструкцию"""
+
+
+class RuleBudgetExceeded(RuntimeError):
+    """Вычисление условия превысило бюджет шагов"""
+
+
+class _Frame:
+    """Состояние одного вычисления: переменные и оставшийся бюджет"""
+
+    __slots__ = ('variables', 'steps_left')
+
+    def __init__(self, variables, budget):
+        self.variables = variables
+        self.steps_left = budget
+
+    def step(self):
+        self.steps_left -= 1
+        if self.steps_left < 0:
+            raise RuleBudgetExceeded("Rule evaluation step budget exceeded")
+
+
+class CompiledRule:
+    """Скомпилированное условие: evaluate(project=..., value=..., threshold=...)"""
+
+    def __init__(self, source, program):
+        self.source = source
+        self._program = program
+
+    def evaluate(self, budget=None, **inputs):
+        frame = _Frame(
+            {name: inputs.get(name) for name in INPUT_NAMES},
+            budget if budget is not None else get_config()['STEP_BUDGET'],
+        )
+        return bool(self._program(frame))
+
+
+class _Compiler:
+    """AST -> замыкания; все неразрешенные узлы - RuleSyntaxError"""
+
+    def compile(self, source):
+        source = (source or '').strip()
+        if not source:
+            raise RuleSyntaxError("Empty condition")
+        if len(source) > MAX_SOURCE_LENGTH:
+            raise RuleSyntaxError(f"Condition is longer than {MAX_SOURCE_LENGTH} characters")
+
+        # Сначала как выражение, затем как набор операторов с result
+        try:
+            tree = self._parse(source, 'eval')
+        except SyntaxError:
+            tree = None
+        if tree is not None:
+            expression = self.expr(tree.body)
+            return lambda frame: expression(frame)
+
+        try:
+            tree = self._parse(source, 'exec')
+        except SyntaxError as e:
+            raise RuleSyntaxError(f"Invalid syntax: {e.msg} (line {e.lineno})")
+        body = self.block(tree.body)
+
+        def program(frame):
+            frame.variables.setdefault('result', False)
+            body(frame)
+            return frame.variables.get('result', False)
+
+        return program
+
+    @staticmethod
+    def _parse(source, mode):
+        try:
+            tree = ast.parse(source, mode=mode)
+        except (RecursionError, MemoryError):
+            raise RuleSyntaxError("Condition is nested too deeply")
+        # Ограничение размера дерева заодно ограничивает глубину рекурсии компилятора
+        if sum(1 for _ in ast.walk(tree)) > MAX_NODES:
+            raise RuleSyntaxError(f"Condition has more than {MAX_NODES} syntax nodes")
+        return tree
+
+    # --- Операторы ---
+
+    def block(self, statements):
+        compiled = [self.stmt(statement) for statement in statements]
+
+        def run(frame):
+            for statement in compiled:
+                statement(frame)
+
+        return run
+
+    def stmt(self, node):
+        if isinstance(node, ast.Assign):
+            if len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+                raise RuleSyntaxError("Only simple assignments are allowed")
+            name = self._assignable(node.targets[0].id)
+            value = self.expr(node.value)
+
+            def assign(frame):
+                frame.step()
+                frame.variables[name] = value(frame)
+
+            return assign
+
+        if isinstance(node, ast.AugAssign):
+            if not isinstance(node.target, ast.Name) or type(node.op) not in BIN_OPS:
+                raise RuleSyntaxError("Unsupported augmented assignment")
+            name = self._assignable(node.target.id)
+            op = self._binary(node.op)
+            value = self.expr(node.value)
+
+            def aug_assign(frame):
+                frame.step()
+                if name not in frame.variables:
+                    raise NameError(name)
+                frame.variables[name] = op(frame.variables[name], value(frame))
+
+            return aug_assign
+
+        if isinstance(node, ast.If):
+            test = self.expr(node.test)
+            body = self.block(node.body)
+            orelse = self.block(node.orelse)
+
+            def if_(frame):
+                frame.step()
+                if test(frame):
+                    body(frame)
+                else:
+                    orelse(frame)
+
+            return if_
+
+        if isinstance(node, ast.Pass):
+            return lambda frame: None
+
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            # Строка-комментарий
+            return lambda frame: None
+
+        raise RuleSyntaxError(f"Statement not allowed: {type(node).__name__}")
+
+    @staticmethod
+    def _assignable(name):
+        if name in INPUT_NAMES or name in SAFE_FUNCTIONS or name in CONSTANTS or name.startswith('_'):
+            raise RuleSyntaxError(f"Cannot assign to '{name}'")
+        return name
+
+    # --- Выражения ---
+
+    def expr(self, node):
+        method = getattr(self, f'expr_{type(node).__name__}', None)
+        if method is None:
+            raise RuleSyntaxError(f"Expression not allowed: {type(node).__name__}")
+        return method(node)
+
+    def expr_Constant(self, node):
+        if not isinstance(node.value, (int, float, str, bool, type(None))):
+            raise RuleSyntaxError(f"Constant not allowed: {node.value!r}")
+        value = node.value
+
+        def constant(frame):
+            frame.step()
+            return value
+
+        return constant
+
+    def expr_Name(self, node):
+        name = node.id
+        if name in CONSTANTS:
+            value = CONSTANTS[name]
+            return lambda frame: value
+        if name.startswith('_') or name in SAFE_FUNCTIONS:
+            raise RuleSyntaxError(f"Name not allowed here: '{name}'")
+
+        def load(frame):
+            frame.step()
+            try:
+                return frame.variables[name]
+            except KeyError:
+                raise NameError(f"name '{name}' is not defined")
+
+        return load
+
+    def expr_Attribute(self, node):
+        if not (isinstance(node.value, ast.Name) and node.value.id == 'project'):
+            raise RuleSyntaxError("Attribute access is only allowed on 'project'")
+        attribute = node.attr
+        if attribute not in PROJECT_ATTRIBUTES:
+            raise RuleSyntaxError(f"Project attribute not allowed: '{attribute}'")
+
+        def load_attribute(frame):
+            frame.step()
+            return getattr(frame.variables['project'], attribute)
+
+        return load_attribute
+
+    def expr_BoolOp(self, node):
+        values = [self.expr(value) for value in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def bool_op(frame):
+            frame.step()
+            result = None
+            for value in values:
+                result = value(frame)
+                if bool(result) != is_and:
+                    return result
+            return result
+
+        return bool_op
+
+    def expr_BinOp(self, node):
+        op = self._binary(node.op)
+        left = self.expr(node.left)
+        right = self.expr(node.right)
+
+        def bin_op(frame):
+            frame.step()
+            return op(left(frame), right(frame))
+
+        return bin_op
+
+    @staticmethod
+    def _binary(op_node):
+        op = BIN_OPS.get(type(op_node))
+        if op is None:
+            raise RuleSyntaxError(f"Operator not allowed: {type(op_node).__name__}")
+        return BOUNDED_OPS.get(op, op)
+
+    def expr_UnaryOp(self, node):
+        op = UNARY_OPS.get(type(node.op))
+        if op is None:
+            raise RuleSyntaxError(f"Operator not allowed: {type(node.op).__name__}")
+        operand = self.expr(node.operand)
+
+        def unary_op(frame):
+            frame.step()
+            return op(operand(frame))
+
+        return unary_op
+
+    def expr_Compare(self, node):
+        ops = []
+        for op_node in node.ops:
+            op = COMPARE_OPS.get(type(op_node))
+            if op is None:
+                raise RuleSyntaxError(f"Comparison not allowed: {type(op_node).__name__}")
+            ops.append(op)
+        left = self.expr(node.left)
+        comparators = [self.expr(comparator) for comparator in node.comparators]
+
+        def compare(frame):
+            frame.step()
+            current = left(frame)
+            for op, comparator in zip(ops, comparators):
+                following = comparator(frame)
+                if not op(current, following):
+                    return False
+                current = following
+            return True
+
+        return compare
+
+    def expr_IfExp(self, node):
+        test = self.expr(node.test)
+        body = self.expr(node.body)
+        orelse = self.expr(node.orelse)
+
+        def if_exp(frame):
+            frame.step()
+            return body(frame) if test(frame) else orelse(frame)
+
+        return if_exp
+
+    def expr_Tuple(self, node):
+        items = [self.expr(item) for item in node.elts]
+
+        def tuple_(frame):
+            frame.step()
+            return tuple(item(frame) for item in items)
+
+        return tuple_
+
+    expr_List = expr_Tuple
+
+    def expr_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in SAFE_FUNCTIONS:
+            raise RuleSyntaxError("Only abs, min, max and round can be called")
+        if node.keywords:
+            raise RuleSyntaxError("Keyword arguments are not allowed")
+        function = SAFE_FUNCTIONS[node.func.id]
+        args = [self.expr(arg) for arg in node.args]
+
+        def call(frame):
+            frame.step()
+            return function(*[arg(frame) for arg in args])
+
+        return call
+
+
+def compile_condition(source):
+    """Скомпилировать условие (RuleSyntaxError при запрещенных конструкциях)"""
+    return CompiledRule(source, _Compiler().compile(source))
+
+
+_cache = OrderedDict()
+
+
+def get_compiled_rule(rule):
+    """Скомпилированное условие правила из кэша (ключ: id и updated_at)"""
+    if rule.pk is None:
+        return compile_condition(rule.custom_condition)
+
+    key = (rule.pk, rule.updated_at)
+    compiled = _cache.get(key)
+    hit = compiled is not None and compiled.source == rule.custom_condition
+    record_cache_access(hit)
+    if hit:
+        _cache.move_to_end(key)
+        return compiled
+
+    compiled = compile_condition(rule.custom_condition)
+    _cache[key] = compiled
+    while len(_cache) > get_config()['CACHE_SIZE']:
+        _cache.popitem(last=False)
+    return compiled
+
+
+def clear_cache():
+    _cache.clear()
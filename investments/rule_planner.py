@@ -0,0 +1,213 @@
+# investments/rule_planner.py
+"""
+Планировщик выполнения AlertRule.
+
+Правило THRESHOLD с оператором GT/GTE/LT/LTE/EQ/NEQ по хранимой колонке
+Project (irr, tvpi, dpi, nav, xnpv, ...) переводится в один запрос:
+
+    Project.objects.filter(status='active', irr__lt=0.05)
+
+Правила CHANGE/TREND, операторы CHANGE_GT/CHANGE_LT и пороговые правила
+с min_occurrences > 1 считаются по истории метрик (ProjectMetricSnapshot)
+за lookback_days - тоже одним запросом на правило:
+
+    CHANGE, CHANGE_*     - относительное изменение: (текущее - на начало окна) / |на начало окна|
+    TREND                - наклон МНК (единиц метрики в день) за окно
+    min_occurrences      - для CHANGE/TREND: минимум точек истории в окне;
+                           для порога: минимум точек окна (с текущим значением),
+                           где условие выполнялось
+
+Остальные правила (CUSTOM, вычисляемые метрики) проверяются в Python
+по каждому проекту, как раньше.
+"""
+
+from datetime import date, timedelta
+from typing import NamedTuple
+
+from django.utils import timezone
+
+from .metric_history import MetricWindow, SNAPSHOT_METRICS, window_history
+from .models import Project
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# Хранимые колонки Project, по которым можно фильтровать в БД
+STORED_METRICS = frozenset({
+    'irr', 'tvpi', 'dpi', 'nav', 'xnpv', 'gap_to_target',
+    'invested', 'returned', 'estimated_return', 'moic',
+})
+
+OPERATOR_LOOKUPS = {
+    'GT': 'gt',
+    'GTE': 'gte',
+    'LT': 'lt',
+    'LTE': 'lte',
+    'EQ': 'exact',
+    'NEQ': 'exact',  # через exclude()
+}
+
+HISTORY_CONDITIONS = ('CHANGE', 'TREND')
+HISTORY_OPERATORS = ('CHANGE_GT', 'CHANGE_LT')
+
+
+class RuleMatch(NamedTuple):
+    project: Project
+    value: object
+
+
+def rule_scope(rule):
+    """Активные проекты, к которым применяется правило"""
+    if rule.applies_to_all_projects:
+        return Project.objects.filter(status='active')
+    return rule.specific_projects.filter(status='active')
+
+
+def is_set_based(rule):
+    """Можно ли проверить правило одним запросом"""
+    return (
+        rule.condition_type == 'THRESHOLD'
+        and rule.min_occurrences <= 1
+        and rule.operator in OPERATOR_LOOKUPS
+        and rule.metric_field in STORED_METRICS
+        and rule.threshold_value is not None
+    )
+
+
+def is_history_based(rule):
+    """Нужна ли правилу история метрики"""
+    return (
+        rule.condition_type in HISTORY_CONDITIONS
+        or rule.operator in HISTORY_OPERATORS
+        or (rule.condition_type == 'THRESHOLD' and rule.min_occurrences > 1)
+    )
+
+
+def threshold_queryset(rule):
+    """Запрос проектов, нарушающих порог (только для is_set_based)"""
+    field = rule.metric_field
+    # NULL в Python-проверке пропускается - исключаем его и здесь
+    queryset = rule_scope(rule).filter(**{f'{field}__isnull': False})
+    condition = {f'{field}__{OPERATOR_LOOKUPS[rule.operator]}': rule.threshold_value}
+    if rule.operator == 'NEQ':
+        return queryset.exclude(**condition)
+    return queryset.filter(**condition)
+
+
+def _metric_value(project, metric_field):
+    value = getattr(project, metric_field, None)
+    if callable(value):
+        value = value()
+    return value
+
+
+def _history_value(rule, window, current, today):
+    """Значение для сравнения с порогом или None, если данных недостаточно"""
+    if rule.condition_type == 'TREND':
+        if len(window.points) < rule.min_occurrences:
+            return None
+        return window.slope(today)
+    if rule.condition_type == 'CHANGE' or rule.operator in HISTORY_OPERATORS:
+        if len(window.points) < rule.min_occurrences:
+            return None
+        return window.change(current)
+    return current
+
+
+def _occurrences(rule, window, current):
+    """Сколько точек окна (включая текущее значение) удовлетворяют порогу"""
+    values = [value for _, value in window.points]
+    if not values or values[-1] != current:
+        values.append(current)
+    return sum(1 for value in values if rule.compare(value))
+
+
+def evaluate_history_rule(rule, today=None):
+    """Правило по истории метрики: проекты + одна выборка истории"""
+    field = rule.metric_field
+    if field not in SNAPSHOT_METRICS:
+        logger.warning("alert_rule.history_metric_unsupported", rule=rule.name, metric=field)
+        return []
+
+    today = today or date.today()
+    since = today - timedelta(days=max(rule.lookback_days, 1))
+    projects = list(rule_scope(rule))
+    windows = window_history(field, since, [project.id for project in projects])
+
+    matches = []
+    for project in projects:
+        current = getattr(project, field)
+        if current is None:
+            continue
+        window = windows.get(project.id) or MetricWindow(since, None, [])
+        value = _history_value(rule, window, current, today)
+        if not rule.compare(value):
+            continue
+        if (rule.condition_type not in HISTORY_CONDITIONS and rule.operator not in HISTORY_OPERATORS
+                and _occurrences(rule, window, current) < rule.min_occurrences):
+            continue
+        matches.append(RuleMatch(project, value))
+    return matches
+
+
+def evaluate_rule(rule):
+    """
+    Проекты, для которых правило сработало.
+
+    Возвращает (matches, plan), где plan - 'query', 'history' или 'python'.
+    """
+    if is_history_based(rule):
+        return evaluate_history_rule(rule), 'history'
+
+    if is_set_based(rule):
+        matches = [
+            RuleMatch(project, getattr(project, rule.metric_field))
+            for project in threshold_queryset(rule)
+        ]
+        return matches, 'query'
+
+    matches = []
+    for project in rule_scope(rule):
+        try:
+            value = _metric_value(project, rule.metric_field)
+        except Exception:
+            continue
+        if value is None:
+            continue
+        if rule.check_condition(project, value):
+            matches.append(RuleMatch(project, value))
+    return matches, 'python'
+
+
+def apply_rule(rule, writer, now=None):
+    """
+    Проверить правило и передать срабатывания в AlertWriter.
+
+    Обновляет счетчики и last_checked правила; возвращает (созданные алерты, plan).
+    """
+    now = now or timezone.now()
+    matches, plan = evaluate_rule(rule)
+
+    created = []
+    severity = rule.severity_override or rule.alert_type.default_severity
+    for project, current_value in matches:
+        alert = writer.add(
+            project=project,
+            alert_type_code=rule.alert_type.code,
+            title=f"{rule.name} triggered",
+            message=f"{rule.metric_field} = {current_value} (rule: {rule.operator} {rule.threshold_value})",
+            severity=severity,
+            metric_value=current_value,
+            threshold_value=rule.threshold_value,
+            details={'rule_id': rule.id, 'rule_name': rule.name}
+        )
+        # None - повторение подавлено StormGuard: правило не сработало заново
+        if alert is not None:
+            created.append(alert)
+            rule.last_triggered = now
+            rule.trigger_count += 1
+
+    rule.last_checked = now
+    # Без updated_at: ключ кэша скомпилированного условия не меняется
+    rule.save(update_fields=['last_checked', 'last_triggered', 'trigger_count'])
+    return created, plan
@@ -0,0 +1,67 @@
+# investments/signals.py
+"""
+Сигналы приложения investments (подключаются в InvestmentsConfig.ready)
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .alerts_events import enqueue_transaction_checks
+from .alerts_models import AlertSettings, AlertStatistics, ProjectAlert, bump_alerts_version
+from .models import Transaction
+from .notifications import invalidate_router
+
+
+@receiver([post_save, post_delete], sender=AlertSettings)
+def alert_settings_changed(sender, **kwargs):
+    """Изменились настройки уведомлений - сбросить индекс получателей"""
+    invalidate_router()
+
+
+@receiver(m2m_changed, sender=AlertSettings.subscribed_types.through)
+@receiver(m2m_changed, sender=AlertSettings.subscribed_projects.through)
+def alert_subscriptions_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_router()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, update_fields=None, **kwargs):
+    """Email, is_staff, is_active влияют на получателей; вход в систему - нет"""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_router()
+
+
+@receiver([post_save, post_delete], sender=ProjectAlert)
+def project_alert_changed(sender, **kwargs):
+    """Сбросить кэш статистики дашборда"""
+    bump_alerts_version()
+
+
+@receiver(post_save, sender=ProjectAlert)
+def project_alert_saved(sender, instance, created=False, raw=False, **kwargs):
+    """Инкрементально обновить дневную статистику (AlertStatistics)"""
+    if raw:
+        return
+    if created:
+        AlertStatistics.record_created([instance])
+    elif hasattr(instance, '_loaded_state'):
+        AlertStatistics.record_transition(instance, *instance._loaded_state)
+    instance._loaded_state = (instance.status, instance.severity)
+
+
+@receiver(post_delete, sender=ProjectAlert)
+def project_alert_deleted(sender, instance, **kwargs):
+    AlertStatistics.record_deleted(instance, *getattr(instance, '_loaded_state', (instance.status, instance.severity)))
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def transaction_changed(sender, instance, raw=False, **kwargs):
+    """Проверить проект транзакции в фоне после коммита (без полного прохода)"""
+    if raw:
+        return  # loaddata
+    project_id, transaction_type = instance.project_id, instance.transaction_type
+    transaction.on_commit(lambda: enqueue_transaction_checks(project_id, transaction_type))
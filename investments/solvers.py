@@ -0,0 +1,127 @@
+# investments/solvers.py
+"""
+Поиск корней для XIRR без внешних зависимостей.
+
+По умолчанию используется встроенная реализация метода Брента (тот же
+алгоритм, что scipy.optimize.brentq). SciPy импортируется лениво и только
+если в settings указано XIRR_SOLVER = 'scipy'.
+"""
+
+import math
+from typing import Callable, NamedTuple, Optional
+
+# Допуски как у scipy.optimize.brentq
+XTOL = 2e-12
+RTOL = 4 * 2.220446049250313e-16
+MAXITER = 100
+
+
+class RootResult(NamedTuple):
+    root: Optional[float]
+    converged: bool
+    iterations: int
+
+
+def _value(func, x):
+    fx = func(x)
+    if fx is None or (isinstance(fx, float) and math.isnan(fx)):
+        raise ValueError(f"function value is undefined at {x}")
+    return fx
+
+
+def brentq(func: Callable[[float], float], a: float, b: float,
+           xtol: float = XTOL, rtol: float = RTOL, maxiter: int = MAXITER) -> RootResult:
+    """Метод Брента на отрезке [a, b]; на концах функция должна иметь разные знаки"""
+    fa = _value(func, a)
+    fb = _value(func, b)
+    if fa * fb > 0:
+        raise ValueError("f(a) and f(b) must have different signs")
+    if fa == 0:
+        return RootResult(a, True, 0)
+    if fb == 0:
+        return RootResult(b, True, 0)
+
+    pre, cur = a, b
+    fpre, fcur = fa, fb
+    blk, fblk, spre, scur = 0.0, 0.0, 0.0, 0.0
+
+    for iteration in range(1, maxiter + 1):
+        if fpre * fcur < 0:
+            blk, fblk = pre, fpre
+            spre = scur = cur - pre
+        if abs(fblk) < abs(fcur):
+            pre, cur, blk = cur, blk, cur
+            fpre, fcur, fblk = fcur, fblk, fcur
+
+        delta = (xtol + rtol * abs(cur)) / 2
+        sbis = (blk - cur) / 2
+        if fcur == 0 or abs(sbis) < delta:
+            return RootResult(cur, True, iteration)
+
+        if abs(spre) > delta and abs(fcur) < abs(fpre):
+            if pre == blk:
+                # интерполяция секущей
+                stry = -fcur * (cur - pre) / (fcur - fpre)
+            else:
+                # обратная квадратичная интерполяция
+                dpre = (fpre - fcur) / (pre - cur)
+                dblk = (fblk - fcur) / (blk - cur)
+                stry = -fcur * (fblk * dblk - fpre * dpre) / (dblk * dpre * (fblk - fpre))
+            if 2 * abs(stry) < min(abs(spre), 3 * abs(sbis) - delta):
+                spre, scur = scur, stry
+            else:
+                spre, scur = sbis, sbis
+        else:
+            spre, scur = sbis, sbis
+
+        pre, fpre = cur, fcur
+        if abs(scur) > delta:
+            cur += scur
+        else:
+            cur += delta if sbis > 0 else -delta
+        fcur = _value(func, cur)
+
+    return RootResult(cur, False, maxiter)
+
+
+def secant(func: Callable[[float], float], x0: float,
+           tol: float = 1.48e-8, maxiter: int = 50) -> RootResult:
+    """Метод секущих от начального приближения (как scipy.optimize.newton без fprime)"""
+    p0 = x0
+    p1 = x0 * (1 + 1e-4) + (1e-4 if x0 >= 0 else -1e-4)
+    q0 = _value(func, p0)
+    q1 = _value(func, p1)
+    if abs(q1) < abs(q0):
+        p0, p1, q0, q1 = p1, p0, q1, q0
+
+    for iteration in range(1, maxiter + 1):
+        if q1 == q0:
+            return RootResult((p1 + p0) / 2, p1 == p0, iteration)
+        p = p1 - q1 * (p1 - p0) / (q1 - q0)
+        if math.isclose(p, p1, rel_tol=0, abs_tol=tol):
+            return RootResult(p, True, iteration)
+        p0, q0 = p1, q1
+        p1 = p
+        q1 = _value(func, p1)
+
+    return RootResult(p1, False, maxiter)
+
+
+def find_root(func: Callable[[float], float], bracket, method: Optional[str] = None) -> RootResult:
+    """
+    Найти корень на отрезке bracket.
+
+    method: 'builtin' (по умолчанию) или 'scipy'; если не указан,
+    берется из settings.XIRR_SOLVER.
+    """
+    if method is None:
+        from django.conf import settings
+        method = getattr(settings, 'XIRR_SOLVER', 'builtin')
+
+    if method == 'scipy':
+        from scipy.optimize import root_scalar
+
+        result = root_scalar(func, bracket=list(bracket), method="brentq")
+        return RootResult(result.root, result.converged, result.iterations)
+
+    return brentq(func, bracket[0], bracket[1])
@@ -0,0 +1,164 @@
+# investments/structured_logging.py
+"""
+Структурированное логирование для приложения investments.
+
+    logger = get_logger(__name__)
+    logger.debug("xirr.solved", sampled=True, project=project.name, irr=irr)
+
+Каждое событие - имя (event) и набор полей. Уровни задаются по модулям
+через settings.LOGGING, частые события горячих путей можно сэмплировать
+(settings.INVESTMENTS_LOGGING['SAMPLING']).
+
+capture_debug() включает кольцевой буфер, который получает ВСЕ события
+(любого уровня, без сэмплирования) в пределах одного запроса или запуска
+команды. Для запроса: ?_debug_capture=1 (только staff), для команд:
+--debug-capture.
+"""
+
+import contextvars
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_active_capture = contextvars.ContextVar('investments_debug_capture', default=None)
+
+# Последние завершенные захваты запросов (показываются в админке)
+recent_captures = deque(maxlen=20)
+_recent_lock = threading.Lock()
+
+
+def get_config():
+    config = {
+        'DEFAULT_SAMPLE_RATE': 1.0,
+        'SAMPLING': {},
+        'CAPTURE_SIZE': 1000,
+    }
+    config.update(getattr(settings, 'INVESTMENTS_LOGGING', {}))
+    return config
+
+
+class DebugCapture:
+    """Кольцевой буфер событий одного запроса или запуска команды"""
+
+    def __init__(self, label='', size=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = time.time()
+        self.records = deque(maxlen=size or get_config()['CAPTURE_SIZE'])
+        self.dropped = 0
+
+    def append(self, level, logger_name, event, fields):
+        if len(self.records) == self.records.maxlen:
+            self.dropped += 1
+        self.records.append({
+            'ts': time.time(),
+            'level': logging.getLevelName(level),
+            'logger': logger_name,
+            'event': event,
+            'fields': fields,
+        })
+
+    def format_lines(self):
+        for record in self.records:
+            offset = (record['ts'] - self.started_at) * 1000
+            yield (
+                f"+{offset:8.1f}ms {record['level']:<7} {record['logger']} "
+                f"{record['event']} {format_fields(record['fields'])}"
+            ).rstrip()
+
+
+@contextmanager
+def capture_debug(label='', size=None):
+    """Включить захват событий в кольцевой буфер на время блока"""
+    capture = DebugCapture(label, size)
+    token = _active_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        _active_capture.reset(token)
+
+
+def remember_capture(capture):
+    with _recent_lock:
+        recent_captures.append(capture)
+
+
+def format_fields(fields):
+    return " ".join(
+        f"{key}={value!r}" if isinstance(value, str) else f"{key}={value}"
+        for key, value in fields.items()
+    )
+
+
+class StructuredLogger:
+    """Обертка над logging.Logger с событиями, полями и сэмплированием"""
+
+    def __init__(self, name):
+        self.name = name
+        self._logger = logging.getLogger(name)
+
+    def event(self, level, event, sampled=False, exc_info=False, **fields):
+        capture = _active_capture.get()
+        if capture is not None:
+            capture.append(level, self.name, event, fields)
+
+        if not self._logger.isEnabledFor(level):
+            return
+        if sampled:
+            config = get_config()
+            rate = config['SAMPLING'].get(event, config['DEFAULT_SAMPLE_RATE'])
+            if rate < 1.0 and random.random() >= rate:
+                return
+            if rate < 1.0:
+                fields = dict(fields, sample_rate=rate)
+
+        self._logger.log(
+            level, "%s %s", event, format_fields(fields),
+            exc_info=exc_info,
+            extra={'event': event, 'fields': fields},
+        )
+
+    def debug(self, event, **fields):
+        self.event(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.event(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.event(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.event(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        self.event(logging.ERROR, event, exc_info=True, **fields)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
+
+
+class DebugCaptureMiddleware:
+    """Захват событий для одного запроса staff-пользователя: ?_debug_capture=1"""
+
+    PARAM = '_debug_capture'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        if self.PARAM not in request.GET or not (user and user.is_staff):
+            return self.get_response(request)
+
+        with capture_debug(label=f"{request.method} {request.get_full_path()}") as capture:
+            response = self.get_response(request)
+        remember_capture(capture)
+        response['X-Debug-Capture'] = f"{capture.id}; events={len(capture.records)}"
+        return response
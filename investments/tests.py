@@ -1,3 +1,622 @@
-from django.test import TestCase
+from datetime import datetime, time as clock, timedelta, timezone as dt_timezone
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .alerts import AlertManager, AlertWriter
+from .alerts_models import (
+    AlertArchive, AlertLog, AlertSettings, AlertStatistics, AlertThrottle, NotificationOutbox, ProjectAlert, SweepLock,
+)
+from . import alerts_events
+from .alerts_storm import open_group_roots
+from .cron import CronError, parse_cron
+from .csv_import import ProjectCache, import_transactions
+from .notifications import _claim_batch, deliver_pending, get_config as get_notification_config, requeue_dead
+from .management.commands.check_alerts import Command as CheckAlertsCommand
+from .models import Project, ProjectMetricSnapshot, Transaction
+from .rule_engine import (
+    MAX_NODES, MAX_SEQUENCE, MAX_SOURCE_LENGTH,
+    RuleBudgetExceeded, RuleSyntaxError, compile_condition,
+)
+
+
+def evaluate(source, budget=None, **inputs):
+    inputs.setdefault('project', SimpleNamespace(irr=0.1, target_irr=0.12, status='active', name='P'))
+    return compile_condition(source).evaluate(budget=budget, **inputs)
+
+
+class RuleEngineTests(SimpleTestCase):
+    """Песочница пользовательских условий AlertRule (rule_engine)"""
+
+    def test_evaluates_expressions_and_statements(self):
+        self.assertTrue(evaluate("value < threshold", value=1, threshold=2))
+        self.assertTrue(evaluate(
+            "gap = project.irr - project.target_irr\n"
+            "if gap < -0.01:\n"
+            "    result = True"
+        ))
+        self.assertFalse(evaluate("project.status == 'closed'"))
+
+    def test_rejects_escape_attempts(self):
+        sources = [
+            "project.__class__",
+            "project._state",
+            "project.save",
+            "(1).__class__.__bases__",
+            "__import__('os')",
+            "import os",
+            "open('/etc/passwd')",
+            "getattr(project, 'irr')",
+            "'x'.upper()",
+            "(lambda: 1)()",
+            "[x for x in (1, 2)]",
+            "project.name.__len__()",
+            "for x in (1, 2):\n    pass",
+            "while True:\n    pass",
+            "def f():\n    pass",
+            "project.irr = 1",
+            "project = 1",
+            "value[0]",
+            "b'bytes'",
+        ]
+        for source in sources:
+            with self.subTest(source=source):
+                with self.assertRaises(RuleSyntaxError):
+                    compile_condition(source)
+
+    def test_limits_source_size(self):
+        with self.assertRaises(RuleSyntaxError):
+            compile_condition("1 + " * (MAX_SOURCE_LENGTH // 4) + "1")
+        with self.assertRaises(RuleSyntaxError):
+            compile_condition(" + ".join(["1"] * MAX_NODES))
+
+    def test_step_budget(self):
+        source = "\n".join(f"x{i} = {i}" for i in range(50))
+        with self.assertRaises(RuleBudgetExceeded):
+            evaluate(source, budget=20)
+
+    def test_sequence_multiplication_is_bounded(self):
+        for source in ["(0,) * 5000000", "[0] * 5000000", "5000000 * 'x'", "'x' * 5000000"]:
+            with self.subTest(source=source):
+                with self.assertRaisesMessage(ValueError, "Sequence too large"):
+                    evaluate(source)
+        self.assertTrue(evaluate(f"len_ok = (0,) * {MAX_SEQUENCE}\nresult = True"))
+
+    def test_sequence_concatenation_is_bounded(self):
+        source = "x = 'a' * 1000\n" + "x = x + x\n" * 20 + "result = True"
+        with self.assertRaisesMessage(ValueError, "Sequence too large"):
+            evaluate(source)
+        source = "x = (0,) * 600\nx += x"
+        with self.assertRaisesMessage(ValueError, "Sequence too large"):
+            evaluate(source)
+
+    def test_number_growth_is_bounded(self):
+        source = "x = 10 ** 100\n" + "x = x * x\n" * 30 + "result = True"
+        with self.assertRaisesMessage(ValueError, "Number too large"):
+            evaluate(source)
+        with self.assertRaisesMessage(ValueError, "Exponent too large"):
+            evaluate("2 ** 1000")
+        with self.assertRaisesMessage(ValueError, "Number too large"):
+            evaluate("x = 10 ** 100\nx = x ** 100")
+
+    def test_string_formatting_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, "String formatting is not allowed"):
+            evaluate("'%01000000000d' % 1")
+        self.assertTrue(evaluate("7 % 3 == 1"))
+
+
+class SweepLockTests(TestCase):
+    """Lease и чекпоинты проходов check_alerts (SweepLock)"""
+
+    def test_second_acquire_fails_while_lease_is_live(self):
+        lock = SweepLock.acquire('sweep', 'host:1', ttl_seconds=60)
+        self.assertIsNotNone(lock)
+        self.assertIsNone(SweepLock.acquire('sweep', 'host:2', ttl_seconds=60))
+        # Владелец может захватить повторно
+        self.assertIsNotNone(SweepLock.acquire('sweep', 'host:1', ttl_seconds=60))
+
+    def test_acquire_after_expiry(self):
+        SweepLock.acquire('sweep', 'host:1', ttl_seconds=60)
+        SweepLock.objects.filter(name='sweep').update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        lock = SweepLock.acquire('sweep', 'host:2', ttl_seconds=60)
+        self.assertIsNotNone(lock)
+        self.assertEqual(lock.owner, 'host:2')
+
+    def test_renew_after_takeover_raises(self):
+        from .alerts_models import LeaseLost
+
+        lock = SweepLock.acquire('sweep', 'host:1', ttl_seconds=60)
+        SweepLock.objects.filter(name='sweep').update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        SweepLock.acquire('sweep', 'host:2', ttl_seconds=60)
+        with self.assertRaises(LeaseLost):
+            lock.renew()
+
+    def test_release_keeps_checkpoint_of_interrupted_sweep(self):
+        lock = SweepLock.acquire('sweep', 'host:1')
+        lock.start()
+        lock.checkpoint(7, count=3)
+        lock.release(completed=False)
+
+        lock = SweepLock.acquire('sweep', 'host:2')
+        lock.start()
+        self.assertEqual(lock.resume_after, 7)
+        self.assertEqual(lock.projects_done, 3)
+        lock.start(restart=True)
+        self.assertIsNone(lock.resume_after)
+
+
+class CheckAlertsResumeTests(TestCase):
+    """Продолжение прерванного прохода check_alerts с чекпоинта"""
+
+    def setUp(self):
+        self.projects = [Project.objects.create(name=f'P{i}', status='active') for i in range(3)]
+
+    def interrupt_after(self, project):
+        SweepLock.objects.create(
+            name='check_alerts:all', status='RUNNING', last_project_id=project.id, projects_done=1,
+        )
+
+    def run_sweep(self, *args):
+        evaluated = []
+        evaluate_project = AlertManager.evaluate_project
+
+        def spy(manager, ctx, check_types=None):
+            evaluated.append(ctx.project_id)
+            return evaluate_project(manager, ctx, check_types)
+
+        with mock.patch.object(AlertManager, 'evaluate_project', spy), \
+                mock.patch.object(CheckAlertsCommand, '_check_portfolio') as portfolio, \
+                mock.patch.object(CheckAlertsCommand, '_check_alert_rules') as rules:
+            call_command('check_alerts', '--force', *args, stdout=StringIO())
+        return evaluated, portfolio, rules
+
+    def test_resume_skips_checkpointed_projects(self):
+        self.interrupt_after(self.projects[0])
+        evaluated, portfolio, rules = self.run_sweep()
+        self.assertEqual(evaluated, [self.projects[1].id, self.projects[2].id])
+        portfolio.assert_called_once()
+        rules.assert_called_once()
+        lock = SweepLock.objects.get(name='check_alerts:all')
+        self.assertEqual(lock.status, 'IDLE')
+
+    def test_resume_with_no_projects_left_runs_portfolio_and_rules(self):
+        self.interrupt_after(self.projects[-1])
+        evaluated, portfolio, rules = self.run_sweep()
+        self.assertEqual(evaluated, [])
+        portfolio.assert_called_once()
+        rules.assert_called_once()
+        self.assertEqual(SweepLock.objects.get(name='check_alerts:all').status, 'IDLE')
+
+    def test_restart_ignores_checkpoint(self):
+        self.interrupt_after(self.projects[-1])
+        evaluated, _, _ = self.run_sweep('--restart')
+        self.assertEqual(evaluated, [project.id for project in self.projects])
+
+    def test_live_lease_skips_sweep(self):
+        SweepLock.acquire('check_alerts:all', 'other:1', ttl_seconds=600)
+        evaluated, portfolio, _ = self.run_sweep()
+        self.assertEqual(evaluated, [])
+        portfolio.assert_not_called()
+
+
+def write_alert(project, title='NAV упал', severity='HIGH', alert_type_code='NAV_DROP'):
+    """Один алерт через отдельный AlertWriter (как отдельный проход)"""
+    writer = AlertWriter(auto_notify=False, project_ids=[project.id])
+    alert = writer.add(project=project, alert_type_code=alert_type_code, title=title,
+                       message='test', severity=severity)
+    writer.flush()
+    return alert
+
+
+class AlertWriterTests(TestCase):
+    """Пакетная запись алертов и учет повторений (AlertWriter)"""
+
+    def setUp(self):
+        self.project = Project.objects.create(name='P', status='active')
+
+    def test_repeat_bumps_recurrence_count(self):
+        root = write_alert(self.project)
+        write_alert(self.project)
+        write_alert(self.project)
+        root.refresh_from_db()
+        self.assertEqual(root.recurrence_count, 2)
+        self.assertTrue(root.is_recurring)
+        self.assertIsNotNone(root.last_occurrence)
+
+    def test_repeat_within_one_writer_groups_under_pending_root(self):
+        writer = AlertWriter(auto_notify=False, project_ids=[self.project.id])
+        root = writer.add(project=self.project, alert_type_code='NAV_DROP', title='a', message='m', severity='HIGH')
+        child = writer.add(project=self.project, alert_type_code='NAV_DROP', title='b', message='m', severity='HIGH')
+        created = writer.flush()
+        self.assertEqual(created, [root, child])
+        self.assertEqual(child.parent_alert_id, root.pk)
+        self.assertEqual(AlertLog.objects.filter(action='CREATED').count(), 2)
+
+    def test_flush_uses_bulk_writes(self):
+        projects = [self.project] + [Project.objects.create(name=f'P{i}', status='active') for i in range(5)]
+        write_alert(self.project, alert_type_code='IRR_GAP')
+
+        def flush_queries(count):
+            writer = AlertWriter(auto_notify=False)
+            for project in projects[:count]:
+                writer.add(project=project, alert_type_code='NAV_DROP', title='t', message='m', severity='HIGH')
+                writer.add(project=project, alert_type_code='IRR_GAP', title='t', message='m', severity='HIGH')
+            with CaptureQueriesContext(connection) as queries:
+                writer.flush()
+            return [query['sql'] for query in queries.captured_queries]
+
+        small = flush_queries(1)
+        ProjectAlert.objects.all().delete()
+        write_alert(self.project, alert_type_code='IRR_GAP')
+        large = flush_queries(len(projects))
+        # Число запросов не зависит от числа алертов
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(ProjectAlert.objects.filter(parent_alert__isnull=True).count(), 2 * len(projects))
+
+
+@override_settings(ALERT_STORMS={'BUCKET_CAPACITY': 2, 'REFILL_PER_HOUR': 0})
+class StormGuardTests(TestCase):
+    """Группировка по отпечатку и token buckets (alerts_storm)"""
+
+    def setUp(self):
+        self.project = Project.objects.create(name='P', status='active')
+
+    def test_child_is_grouped_while_tokens_remain(self):
+        root = write_alert(self.project)
+        child = write_alert(self.project)
+        self.assertEqual(child.parent_alert_id, root.pk)
+        self.assertEqual(child.status, 'GROUPED')
+        self.assertFalse(child.is_open)
+        self.assertEqual(list(open_group_roots([self.project.id]).values()), [root])
+
+    def test_suppressed_once_tokens_run_out(self):
+        root = write_alert(self.project)
+        write_alert(self.project)
+        write_alert(self.project)
+        self.assertIsNone(write_alert(self.project))
+
+        self.assertEqual(ProjectAlert.objects.filter(parent_alert=root).count(), 2)
+        throttle = AlertThrottle.objects.get(project=self.project)
+        self.assertEqual(throttle.suppressed_count, 1)
+        self.assertIsNotNone(throttle.last_suppressed_at)
+        root.refresh_from_db()
+        self.assertEqual(root.recurrence_count, 3)
+
+    def test_groups_by_type_and_severity_band_not_title(self):
+        root = write_alert(self.project, title='NAV упал на 7.3%', severity='HIGH')
+        child = write_alert(self.project, title='NAV упал на 12.1%', severity='CRITICAL')
+        self.assertEqual(child.parent_alert_id, root.pk)
+
+        other_band = write_alert(self.project, title='NAV упал на 3.1%', severity='MEDIUM')
+        other_type = write_alert(self.project, title='NAV упал на 7.3%', alert_type_code='DRAWDOWN')
+        self.assertIsNone(other_band.parent_alert_id)
+        self.assertIsNone(other_type.parent_alert_id)
+
+    def test_closed_root_starts_new_group(self):
+        root = write_alert(self.project)
+        root.resolve()
+        self.assertIsNone(write_alert(self.project).parent_alert_id)
+
+
+class AlertStatisticsTests(TestCase):
+    """Топ проектов и типов считается при чтении (AlertStatistics.top)"""
+
+    def test_top_reflects_new_alerts_without_rebuild(self):
+        today = timezone.localdate()
+        AlertStatistics.rebuild(today, today)
+        first = Project.objects.create(name='A', status='active')
+        second = Project.objects.create(name='B', status='active')
+        write_alert(first)
+        write_alert(second, alert_type_code='IRR_GAP')
+        write_alert(second, alert_type_code='DRAWDOWN')
+
+        top = AlertStatistics.top(today, today)
+        self.assertEqual(top['top_projects'], [
+            {'project__name': 'B', 'count': 2}, {'project__name': 'A', 'count': 1},
+        ])
+        self.assertEqual(sum(row['count'] for row in top['top_types']), 3)
+
+    def test_top_includes_archived_days_in_window(self):
+        today = timezone.localdate()
+        AlertArchive.objects.create(
+            month=today.replace(day=1), span_start=today, span_end=today,
+            first_alert_id=1, last_alert_id=1, data=b'',
+            daily_counts={today.isoformat(): {
+                'created_count': 4, 'top_projects': {'Old': 4}, 'top_types': {'NAV drop': 4},
+            }},
+        )
+        top = AlertStatistics.top(today, today)
+        self.assertEqual(top['top_projects'], [{'project__name': 'Old', 'count': 4}])
+        self.assertEqual(AlertStatistics.top(today + timedelta(days=1), today + timedelta(days=1))['top_projects'], [])
+
+
+class FailingBackend(LocmemBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP unavailable')
+
+
+@override_settings(NOTIFICATIONS={'MAX_ATTEMPTS': 2, 'BACKOFF_BASE': 60})
+class NotificationOutboxTests(TestCase):
+    """Доставка очереди уведомлений: повторы, dead letters, claim"""
+
+    def setUp(self):
+        self.project = Project.objects.create(name='P', status='active')
+        self.user = User.objects.create_user('analyst', email='analyst@example.com')
+        AlertSettings.objects.create(user=self.user, email_frequency='IMMEDIATE', min_severity='LOW')
+        self.alert = write_alert(self.project)
+        AlertManager().queue_notifications([self.alert])
+        self.entry = NotificationOutbox.objects.get()
+
+    def make_due(self):
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def test_failing_send_retries_then_goes_dead(self):
+        result = deliver_pending(connection=FailingBackend())
+        self.assertEqual(result['retried'], 1)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('PENDING', 1))
+        self.assertGreater(self.entry.next_attempt_at, timezone.now())
+        self.assertIn('SMTP unavailable', self.entry.last_error)
+
+        # До истечения задержки повтора не будет
+        self.assertEqual(deliver_pending(connection=FailingBackend())['claimed'], 0)
+
+        self.make_due()
+        self.assertEqual(deliver_pending(connection=FailingBackend())['dead'], 1)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts), ('DEAD', 2))
+
+        self.assertEqual(requeue_dead(), 1)
+        self.assertEqual(deliver_pending()['sent'], 1)
+        self.entry.refresh_from_db()
+        self.assertEqual(self.entry.status, 'SENT')
+        self.assertEqual(len(mail.outbox), 1)
+        self.alert.refresh_from_db()
+        self.assertTrue(self.alert.email_sent)
+
+    def test_concurrent_claim_does_not_deliver_twice(self):
+        config = get_notification_config()
+        claimed = _claim_batch(10, timezone.now(), config)
+        self.assertEqual([entry.id for entry in claimed], [self.entry.id])
+        self.assertEqual(deliver_pending()['claimed'], 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_expired_claim_does_not_overwrite_new_claim(self):
+        stale = _claim_batch(10, timezone.now(), get_notification_config())
+        # Claim воркера истек, сообщение забрал и отправил другой воркер
+        self.make_due()
+        self.assertEqual(deliver_pending()['sent'], 1)
+
+        with mock.patch('investments.notifications._claim_batch', return_value=stale):
+            result = deliver_pending(connection=FailingBackend())
+        self.assertEqual(result['sent'], 0)
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.status, self.entry.attempts, self.entry.last_error), ('SENT', 1, ''))
+        self.assertEqual(AlertLog.objects.filter(action='EMAIL_SENT').count(), 1)
+
+
+class NotificationDigestTests(TestCase):
+    """Дайджесты по AlertSettings.email_frequency и email_digest_time"""
+
+    def setUp(self):
+        self.project = Project.objects.create(name='P', status='active')
+        self.user = User.objects.create_user('daily', email='daily@example.com')
+        AlertSettings.objects.create(
+            user=self.user, email_frequency='DAILY', email_digest_time=clock(18, 30), min_severity='LOW',
+        )
+
+    def test_daily_digest_is_one_mail_at_digest_time(self):
+        alerts = [write_alert(self.project, alert_type_code=code) for code in ('NAV_DROP', 'IRR_GAP', 'DRAWDOWN')]
+        AlertManager().queue_notifications(alerts)
+
+        entries = NotificationOutbox.objects.all()
+        self.assertEqual(len(entries), 3)
+        for entry in entries:
+            send_at = timezone.localtime(entry.next_attempt_at)
+            self.assertEqual((entry.frequency, send_at.hour, send_at.minute), ('DAILY', 18, 30))
+            self.assertGreater(send_at, timezone.now())
+        self.assertEqual(deliver_pending()['claimed'], 0)
+
+        # Наступило время дайджеста; пакет меньше группы - дайджест добирается целиком
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        result = deliver_pending(batch_size=1)
+        self.assertEqual((result['claimed'], result['sent'], result['messages']), (3, 3, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['daily@example.com'])
+        self.assertIn('Alert digest: 3 alerts', mail.outbox[0].subject)
+
+
+class CronTests(SimpleTestCase):
+    """Разбор cron-выражений и ближайшее срабатывание (cron)"""
+
+    def next_after(self, expression, *moment):
+        return parse_cron(expression).next_after(datetime(*moment))
+
+    def test_steps_and_ranges(self):
+        # 2026-10-19 - понедельник
+        self.assertEqual(self.next_after('*/15 9-17 * * 1-5', 2026, 10, 19, 10, 7), datetime(2026, 10, 19, 10, 15))
+        self.assertEqual(self.next_after('*/15 9-17 * * 1-5', 2026, 10, 19, 17, 50), datetime(2026, 10, 20, 9, 0))
+        self.assertEqual(self.next_after('*/15 9-17 * * 1-5', 2026, 10, 23, 18, 0), datetime(2026, 10, 26, 9, 0))
+        self.assertEqual(self.next_after('10-40/10 * * * *', 2026, 10, 19, 10, 40), datetime(2026, 10, 19, 11, 10))
+        self.assertEqual(self.next_after('0 8 * jan-mar mon,fri', 2026, 10, 19, 0, 0), datetime(2027, 1, 1, 8, 0))
+
+    def test_day_of_month_or_day_of_week(self):
+        # 2026-11-01 - воскресенье; 5-е или пятница
+        expression = '0 0 5 * fri'
+        self.assertEqual(self.next_after(expression, 2026, 11, 1, 12, 0), datetime(2026, 11, 5))
+        self.assertEqual(self.next_after(expression, 2026, 11, 5, 0, 0), datetime(2026, 11, 6))
+        # Ограничен только день недели - день месяца не учитывается
+        self.assertEqual(self.next_after('0 0 * * 0', 2026, 11, 2, 0, 0), datetime(2026, 11, 8))
+        self.assertEqual(self.next_after('0 0 * * 7', 2026, 11, 2, 0, 0), datetime(2026, 11, 8))
+
+    def test_month_rollover(self):
+        self.assertEqual(self.next_after('0 0 31 * *', 2026, 11, 15, 0, 0), datetime(2026, 12, 31))
+        self.assertEqual(self.next_after('0 12 1 * *', 2026, 12, 20, 0, 0), datetime(2027, 1, 1, 12, 0))
+        self.assertEqual(self.next_after('@yearly', 2026, 12, 31, 23, 59), datetime(2027, 1, 1))
+        self.assertEqual(self.next_after('0 0 29 2 *', 2026, 3, 1, 0, 0), datetime(2028, 2, 29))
+
+    def test_invalid_expressions(self):
+        for expression in ['', 'bad', '* * * *', '60 * * * *', '* 24 * * *', '*/0 * * * *',
+                           '5-1 * * * *', '* * * foo *', '* * * * * *']:
+            with self.subTest(expression=expression):
+                with self.assertRaises(CronError):
+                    parse_cron(expression)
+        with self.assertRaises(CronError):
+            parse_cron('0 0 30 2 *').next_after(datetime(2026, 1, 1))
+
+    def test_dst_boundaries_in_local_time(self):
+        berlin = ZoneInfo('Europe/Berlin')
+        utc = dt_timezone.utc
+
+        def next_fire(expression, *moment_utc):
+            with timezone.override(berlin):
+                moment = timezone.localtime(datetime(*moment_utc, tzinfo=utc))
+                fire_at = parse_cron(expression).next_after(moment)
+            self.assertGreater(fire_at.timestamp(), moment.timestamp())
+            return fire_at.astimezone(utc)
+
+        # 2026-03-29: 02:00 -> 03:00; несуществующее 02:30 срабатывает после перевода
+        self.assertEqual(next_fire('30 2 * * *', 2026, 3, 28, 12, 0), datetime(2026, 3, 29, 1, 30, tzinfo=utc))
+        self.assertEqual(next_fire('0 * * * *', 2026, 3, 29, 0, 30), datetime(2026, 3, 29, 1, 0, tzinfo=utc))
+
+        # 2026-10-25: 03:00 -> 02:00; 02:45 первого прохода (UTC 00:45) и второго (UTC 01:45)
+        self.assertEqual(next_fire('* * * * *', 2026, 10, 25, 0, 45), datetime(2026, 10, 25, 0, 46, tzinfo=utc))
+        self.assertEqual(next_fire('* * * * *', 2026, 10, 25, 1, 45), datetime(2026, 10, 25, 1, 46, tzinfo=utc))
+        # Ежедневное 02:30 не повторяется во втором проходе часа
+        self.assertEqual(next_fire('30 2 * * *', 2026, 10, 25, 0, 30), datetime(2026, 10, 26, 1, 30, tzinfo=utc))
+
+
+def csv_file(*rows):
+    return StringIO("project,date,type,investment,return,nav\n" + "".join(f"{row}\n" for row in rows))
+
+
+class CsvImportTests(TestCase):
+    """Потоковый импорт транзакций (csv_import)"""
+
+    def equities(self, name):
+        return list(
+            Transaction.objects.filter(project__name=name).order_by('date', 'id').values_list('equity', flat=True)
+        )
+
+    def test_equity_at_insert_matches_recalculation(self):
+        project = Project.objects.create(name='Fund')
+        Transaction.objects.create(project=project, date='2024-01-01', transaction_type='Investment', investment=100)
+
+        result = import_transactions(csv_file(
+            'Fund,2024-02-01,Investment,50,,',
+            'Fund,2024-03-01,NAV,,,170',
+            'Fund,2024-03-01,Return,,30,',
+            'Fund,2024-04-01,Investment,10,,',
+        ), chunk_size=2)
+
+        self.assertEqual(result.imported, 4)
+        self.assertEqual(result.equity_updated, 0)
+        self.assertEqual(self.equities('Fund'), [100, 150, 0, 120, 130])
+        self.assertEqual(project.recalculate_equity(), 0)
+
+    def test_out_of_order_rows_fall_back_to_recalculation(self):
+        result = import_transactions(csv_file(
+            'Fund,2024-02-01,Investment,100,,',
+            'Fund,2024-01-01,Investment,50,,',
+            'Fund,2024-03-01,Return,,20,',
+        ))
+        self.assertGreater(result.equity_updated, 0)
+        self.assertEqual(self.equities('Fund'), [50, 150, 130])
+        self.assertEqual(Project.objects.get(name='Fund').recalculate_equity(), 0)
+
+    def test_unknown_projects_created_once_across_chunks(self):
+        Project.objects.create(name='Known')
+        result = import_transactions(csv_file(
+            'New,2024-01-01,Investment,10,,',
+            'Known,2024-01-01,Investment,10,,',
+            'Other,2024-01-02,Investment,10,,',
+            'New,2024-01-03,Investment,10,,',
+            'New,2024-01-04,Investment,10,,',
+        ), chunk_size=2)
+        self.assertEqual(result.projects_created, ['New', 'Other'])
+        self.assertEqual(Project.objects.filter(name='New').count(), 1)
+        self.assertEqual(Transaction.objects.filter(project__name='New').count(), 3)
+
+    def test_dry_run_writes_nothing(self):
+        Project.objects.create(name='Known')
+        result = import_transactions(csv_file(
+            'New,2024-01-01,Investment,10,,',
+            'Known,2024-01-01,Investment,10,,',
+            'New,2024-01-02,Investment,10,,',
+            'Bad,not-a-date,Investment,10,,',
+        ), chunk_size=1, dry_run=True)
+        self.assertEqual((result.rows, result.imported, len(result.errors)), (4, 3, 1))
+        self.assertEqual(result.projects_created, ['New'])
+        self.assertEqual(Project.objects.count(), 1)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_dry_run_names_do_not_leak_into_ids(self):
+        cache = ProjectCache()
+        self.assertEqual(cache.resolve(['New'], create=False), ['New'])
+        self.assertNotIn('New', cache.ids)
+        self.assertEqual(cache.resolve(['New']), ['New'])
+        self.assertIsNotNone(cache.ids['New'])
+
+
+class MetricHistoryTests(TestCase):
+    """Запись истории метрик при Project.save (metric_history)"""
+
+    def history_queries(self, project):
+        with CaptureQueriesContext(connection) as queries:
+            project.save()
+        return [query for query in queries.captured_queries if 'projectmetricsnapshot' in query['sql']]
+
+    def test_snapshot_only_when_metrics_change(self):
+        project = Project.objects.create(name='Fund', status='active')
+        Transaction.objects.create(project=project, date='2024-01-01', transaction_type='Investment', investment=100)
+        Transaction.objects.create(project=project, date='2024-06-01', transaction_type='NAV', nav=120)
+        project.save()
+        self.assertEqual(ProjectMetricSnapshot.objects.get(project=project, metric='nav').value, 120)
+
+        # Пересчет без новых данных не трогает историю
+        self.assertEqual(self.history_queries(project), [])
+        self.assertEqual(self.history_queries(Project.objects.get(pk=project.pk)), [])
+
+        Transaction.objects.create(project=project, date='2024-07-01', transaction_type='NAV', nav=150)
+        project = Project.objects.get(pk=project.pk)
+        self.assertNotEqual(self.history_queries(project), [])
+        self.assertEqual(ProjectMetricSnapshot.objects.get(project=project, metric='nav').value, 150)
+
+
+class AlertEventsTests(TestCase):
+    """Очередь проверок по записям транзакций (alerts_events)"""
+
+    def setUp(self):
+        self.project = Project.objects.create(name='Fund', status='active')
+
+    def write_transaction(self):
+        with mock.patch.object(alerts_events.AlertEventWorker, 'enqueue') as enqueue, \
+                self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(project=self.project, date='2024-01-01', transaction_type='NAV', nav=100)
+        return enqueue
+
+    @override_settings(ALERT_EVENTS={'ENABLED': True})
+    def test_not_started_outside_web_process(self):
+        with mock.patch.object(alerts_events, '_process_enabled', False):
+            self.write_transaction().assert_not_called()
+
+    @override_settings(ALERT_EVENTS={'ENABLED': True})
+    def test_enqueues_checks_in_enabled_process(self):
+        with mock.patch.object(alerts_events, '_process_enabled', True):
+            enqueue = self.write_transaction()
+        enqueue.assert_called_once_with(self.project.id, ('NAV_DROP', 'DRAWDOWN', 'DATA_QUALITY'))
+
+    @override_settings(ALERT_EVENTS={'ENABLED': False})
+    def test_disabled_by_setting(self):
+        with mock.patch.object(alerts_events, '_process_enabled', True):
+            self.write_transaction().assert_not_called()
@@ -3,7 +3,12 @@
 
 from datetime import datetime, date
 from typing import List, Tuple, Optional
-from scipy.optimize import newton
+
+from .instrumentation import track_solver
+from .solvers import find_root, secant
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 # --- XIRR и XNPV ---
 
@@ -13,9 +18,10 @@ def xnpv(rate: float, cashflows: List[Tuple[datetime, float]]) -> float:
     return sum(cf / (1 + rate) ** ((t - t0).days / 365.0) for t, cf in cashflows)
 
 def xirr(cashflows: List[Tuple[datetime, float]], guess: float = 0.1) -> Optional[float]:
-    """Расчет XIRR используя метод Ньютона"""
+    """Расчет XIRR методом секущих (без производной, как scipy.optimize.newton)"""
     try:
-        return newton(lambda r: xnpv(r, cashflows), guess)
+        result = secant(lambda r: xnpv(r, cashflows), guess)
+        return result.root if result.converged else None
     except Exception:
         return None
 
@@ -51,18 +57,19 @@ def calculate_xnpv(amounts, dates, rate):
             2
         )
     except Exception as e:
-        print(f"[XNPV ERROR] {e}")
+        logger.warning("xnpv.error", error=str(e))
         return None
 
 # --- Метрики проекта ---
 
 def calculate_xirr(project):
     """Расчет XIRR для проекта с учетом его статуса"""
-    from scipy.optimize import root_scalar
-
     # Получаем cash flows с учетом статуса проекта
     cashflows = project.get_cash_flows(include_nav=True)
-    
+    return solve_xirr(cashflows, project.name, project.status)
+
+def solve_xirr(cashflows, label=None, status=None):
+    """Расчет XIRR по готовому списку кэшфлоу [(date, amount), ...]"""
     if not cashflows or len(cashflows) < 2:
         return None
 
@@ -71,7 +78,8 @@ def calculate_xirr(project):
     has_negative = any(cf < 0 for _, cf in cashflows)
     
     if not (has_positive and has_negative):
-        print(f"[XIRR WARNING] {project.name}: Missing positive or negative cash flows")
+        logger.debug("xirr.skipped", sampled=True, project=label,
+                     reason="missing positive or negative cash flows")
         return None
 
     def xnpv_func(rate):
@@ -87,24 +95,25 @@ def calculate_xirr(project):
     try:
         # Для закрытых убыточных проектов XIRR может быть сильно отрицательным
         # Расширяем диапазон поиска
-        result = root_scalar(
-            xnpv_func,
-            bracket=[-0.99, 10],  # от -99% до 1000%
-            method="brentq"
-        )
+        with track_solver("xirr"):
+            result = find_root(
+                xnpv_func,
+                bracket=(-0.99, 10),  # от -99% до 1000%
+            )
         
         if result.converged:
             irr_value = round(result.root, 6)
-            print(f"[XIRR SUCCESS] {project.name} ({project.status}): {irr_value:.2%}")
+            logger.debug("xirr.solved", sampled=True, project=label,
+                         status=status, irr=irr_value)
             return irr_value
         else:
-            print(f"[XIRR ERROR] {project.name}: Did not converge")
+            logger.warning("xirr.not_converged", project=label)
             return None
             
     except Exception as e:
-        print(f"[XIRR ERROR] {project.name}: {e}")
-        # Для отладки выводим cash flows
-        print(f"  Cash flows: {cashflows}")
+        logger.warning("xirr.error", project=label, error=str(e))
+        # Для отладки сохраняем cash flows
+        logger.debug("xirr.error_cash_flows", project=label, cash_flows=cashflows)
         return None
 
 # ✅ ИСПРАВЛЕНО: Заменено project.get_start_date() на project.start_date
@@ -154,7 +163,7 @@ def calculate_tvpi(project):
         result = round(total_value / invested, 2)
         return result
     except Exception as e:
-        print(f"[TVPI ERROR] {e}")
+        logger.warning("tvpi.error", error=str(e))
         return 0.0
 
 def calculate_estimated_return(project):
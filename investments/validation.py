@@ -0,0 +1,275 @@
+# investments/validation.py
+"""
+Движок валидации данных проектов и транзакций.
+
+Все транзакции читаются одним упорядоченным запросом (project_id, date, id)
+и проверяются за один проход. Используется командой validate_data и
+кнопкой "Validate Project" в админке.
+"""
+
+import csv
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .models import Project, Transaction
+
+
+# Допуск при сравнении project.nav с последним NAV из транзакций
+NAV_DRIFT_TOLERANCE = 0.01
+
+# Размер порции при потоковом чтении транзакций
+STREAM_CHUNK_SIZE = 2000
+
+
+class ValidationIssue(NamedTuple):
+    """Одна строка отчета о проблемах в данных"""
+    project_id: int
+    project: str
+    date: object
+    transaction_id: Optional[int]
+    transaction_type: str
+    check: str
+    severity: str
+    message: str
+
+
+class ValidationReport:
+    """Структурированный отчет по результатам валидации"""
+
+    HEADER = ["Project", "Date", "Type", "Check", "Severity", "Issue"]
+
+    def __init__(self, checks):
+        self.checks = list(checks)
+        self.issues: List[ValidationIssue] = []
+        self.projects_checked = 0
+        self.transactions_checked = 0
+        self.elapsed = 0.0
+
+    def add(self, project, check, message, severity='ERROR', tx=None):
+        self.issues.append(ValidationIssue(
+            project_id=project['id'],
+            project=project['name'],
+            date=tx['date'] if tx else '-',
+            transaction_id=tx['id'] if tx else None,
+            transaction_type=tx['transaction_type'] if tx else '-',
+            check=check,
+            severity=severity,
+            message=message,
+        ))
+
+    def __bool__(self):
+        return bool(self.issues)
+
+    def __len__(self):
+        return len(self.issues)
+
+    def counts(self) -> Dict[str, int]:
+        """Количество проблем по каждой проверке"""
+        result = {check: 0 for check in self.checks}
+        for issue in self.issues:
+            result[issue.check] = result.get(issue.check, 0) + 1
+        return result
+
+    def for_project(self, project_id) -> List[ValidationIssue]:
+        return [issue for issue in self.issues if issue.project_id == project_id]
+
+    def to_rows(self) -> List[list]:
+        return [
+            [i.project, i.date, i.transaction_type, i.check, i.severity, i.message]
+            for i in self.issues
+        ]
+
+    def write_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(self.HEADER)
+            writer.writerows(self.to_rows())
+
+
+class _ProjectState:
+    """Состояние одного проекта во время прохода по транзакциям"""
+
+    __slots__ = ('project', 'last_date', 'latest_nav', 'nav_recorded')
+
+    def __init__(self, project):
+        self.project = project
+        self.last_date = None
+        self.latest_nav = None  # (date, nav, nav_usd)
+        self.nav_recorded = False
+
+
+# --- Правила ---
+# Каждое правило на уровне транзакции получает (report, state, tx),
+# правило на уровне проекта - (report, state) после последней транзакции.
+
+def _check_duplicate_date(report, state, tx):
+    if tx['date'] == state.last_date:
+        report.add(
+            state.project, 'duplicate_date',
+            f"Duplicate transaction date {tx['date']} (transaction ID {tx['id']})",
+            tx=tx,
+        )
+
+
+def _check_type_amount(report, state, tx):
+    tx_type = tx['transaction_type']
+    if tx_type == 'Investment':
+        if not tx['investment']:
+            message = f"Transaction ID {tx['id']} is Investment type but has no investment amount"
+        else:
+            return
+    elif tx_type == 'Return':
+        if not tx['return_amount']:
+            message = f"Transaction ID {tx['id']} is Return type but has no return amount"
+        else:
+            return
+    elif tx_type == 'NAV':
+        if not tx['nav']:
+            message = f"Transaction ID {tx['id']} is NAV type but has no NAV value"
+        else:
+            return
+    elif not tx['investment'] and not tx['return_amount']:
+        message = f"Transaction ID {tx['id']} has neither investment nor return filled"
+    else:
+        return
+    report.add(state.project, 'type_amount', message, tx=tx)
+
+
+def _check_missing_equity(report, state, tx):
+    if tx['transaction_type'] in ('Investment', 'Return') and tx['equity'] is None:
+        report.add(state.project, 'missing_equity', "Missing Equity", tx=tx)
+
+
+def _check_conflicting_nav(report, state, tx):
+    latest = state.latest_nav
+    if tx['nav'] is not None and latest and tx['date'] == latest[0] and tx['nav'] != latest[1]:
+        report.add(
+            state.project, 'conflicting_nav',
+            f"Conflicting NAV on same date: {latest[1]} vs {tx['nav']}",
+            tx=tx,
+        )
+
+
+def _check_missing_nav(report, state):
+    if not state.nav_recorded:
+        report.add(
+            state.project, 'missing_nav',
+            "Project NAV not set (no NAV found in transactions)",
+            severity='WARNING',
+        )
+
+
+def _check_nav_drift(report, state):
+    project = state.project
+    latest = state.latest_nav
+    # Для закрытых проектов project.nav всегда 0 - сравнивать не с чем
+    if latest is None or project['status'] != 'active':
+        return
+    expected = round(latest[2], 2)
+    if abs((project['nav'] or 0) - expected) > NAV_DRIFT_TOLERANCE:
+        report.add(
+            project, 'nav_drift',
+            f"Mismatch between project.nav and latest NAV: {project['nav']} vs {expected}",
+            tx={'id': None, 'date': latest[0], 'transaction_type': '-'},
+        )
+
+
+TRANSACTION_CHECKS = {
+    'duplicate_date': _check_duplicate_date,
+    'type_amount': _check_type_amount,
+    'missing_equity': _check_missing_equity,
+    'conflicting_nav': _check_conflicting_nav,
+}
+
+PROJECT_CHECKS = {
+    'missing_nav': _check_missing_nav,
+    'nav_drift': _check_nav_drift,
+}
+
+ALL_CHECKS = list(TRANSACTION_CHECKS) + list(PROJECT_CHECKS)
+
+
+def resolve_checks(checks: Optional[Iterable[str]] = None) -> List[str]:
+    """Проверить список имен правил; None означает все правила"""
+    if not checks:
+        return list(ALL_CHECKS)
+    checks = [c.strip() for c in checks if c and c.strip()]
+    unknown = [c for c in checks if c not in ALL_CHECKS]
+    if unknown:
+        raise ValueError(
+            f"Unknown validation checks: {', '.join(unknown)}. "
+            f"Available: {', '.join(ALL_CHECKS)}"
+        )
+    return checks
+
+
+def validate_transactions(project_ids=None, checks=None) -> ValidationReport:
+    """
+    Проверить транзакции выбранных проектов (или всей базы) за один проход.
+
+    Args:
+        project_ids: список ID проектов или None для всех проектов
+        checks: имена правил из ALL_CHECKS или None для всех
+
+    Returns:
+        ValidationReport с найденными проблемами
+    """
+    started = time.perf_counter()
+    checks = resolve_checks(checks)
+    report = ValidationReport(checks)
+
+    tx_rules = [TRANSACTION_CHECKS[c] for c in checks if c in TRANSACTION_CHECKS]
+    project_rules = [PROJECT_CHECKS[c] for c in checks if c in PROJECT_CHECKS]
+
+    projects_qs = Project.objects.all()
+    transactions_qs = Transaction.objects.all()
+    if project_ids is not None:
+        projects_qs = projects_qs.filter(id__in=project_ids)
+        transactions_qs = transactions_qs.filter(project_id__in=project_ids)
+
+    projects = {
+        row['id']: row
+        for row in projects_qs.order_by('id').values('id', 'name', 'status', 'nav')
+    }
+
+    rows = transactions_qs.order_by('project_id', 'date', 'id').values(
+        'id', 'project_id', 'date', 'transaction_type',
+        'investment', 'return_amount', 'equity', 'nav', 'x_rate',
+    ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+    seen_projects = set()
+    state = None
+
+    def finish(state):
+        for rule in project_rules:
+            rule(report, state)
+
+    for tx in rows:
+        if state is None or state.project['id'] != tx['project_id']:
+            if state is not None:
+                finish(state)
+            state = _ProjectState(projects[tx['project_id']])
+            seen_projects.add(tx['project_id'])
+
+        for rule in tx_rules:
+            rule(report, state, tx)
+
+        nav = tx['nav']
+        if nav is not None:
+            state.nav_recorded = True
+            if state.latest_nav is None or tx['date'] > state.latest_nav[0]:
+                state.latest_nav = (tx['date'], nav, nav * (tx['x_rate'] or 1))
+        state.last_date = tx['date']
+        report.transactions_checked += 1
+
+    if state is not None:
+        finish(state)
+
+    # Проекты без единой транзакции
+    for project_id, project in projects.items():
+        if project_id not in seen_projects:
+            finish(_ProjectState(project))
+
+    report.projects_checked = len(projects)
+    report.elapsed = time.perf_counter() - started
+    return report
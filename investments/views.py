@@ -2,6 +2,9 @@ from django.shortcuts import render, redirect
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth.decorators import login_required
 from django_user_agents.utils import get_user_agent
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
 
 def home_redirect(request):
     """Redirect to unified dashboard"""
@@ -14,7 +17,7 @@ def unified_dashboard(request):
     
     # Логируем для отладки
     device_type = "mobile" if user_agent.is_mobile else "tablet" if user_agent.is_tablet else "desktop"
-    print(f"Device detected: {device_type}")
+    logger.debug("dashboard.device", device_type=device_type)
     
     # Пока используем один шаблон для всех устройств
     # В будущем можно будет добавить разные шаблоны
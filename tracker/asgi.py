@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tracker.settings')
 
 application = get_asgi_application()
+
+# Фоновые проверки алертов по записям транзакций - только в процессе веб-сервера
+from investments.alerts_events import enable_for_process  # noqa: E402
+
+enable_for_process()
@@ -56,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'investments.instrumentation.QueryTimingMiddleware',  # SQL/солверы, Server-Timing
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', 
@@ -63,11 +64,69 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'investments.structured_logging.DebugCaptureMiddleware',  # ?_debug_capture=1 для staff
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_user_agents.middleware.UserAgentMiddleware',  # 👈 ДОБАВИТЬ ЭТО
 ]
 
+# Инструментирование запросов (investments/instrumentation.py)
+INSTRUMENTATION = {
+    'ENABLED': config('INSTRUMENTATION_ENABLED', default=True, cast=bool),
+    'WINDOW': 500,
+    'RECENT_REQUESTS': 200,
+    'DEFAULT_QUERY_BUDGET': config('DEFAULT_QUERY_BUDGET', default=None, cast=lambda v: int(v) if v else None),
+    'QUERY_BUDGETS': {
+        'admin:investments_project_changelist': 500,
+        'api:portfolio-summary': 200,
+        'api:analytics': 200,
+        'admin:alerts_api_stats': 20,
+    },
+}
+
+# Солвер XIRR: 'builtin' (без scipy) или 'scipy' (ленивый импорт scipy.optimize)
+XIRR_SOLVER = config('XIRR_SOLVER', default='builtin')
+
+# Логирование: уровни по модулям investments
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
+    },
+    'loggers': {
+        'investments': {
+            'handlers': ['console'],
+            'level': config('INVESTMENTS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        # Горячие пути расчета метрик - только предупреждения и ошибки
+        'investments.utils': {'level': config('METRICS_LOG_LEVEL', default='WARNING')},
+        'investments.metrics': {'level': config('METRICS_LOG_LEVEL', default='WARNING')},
+        'investments.models': {'level': config('METRICS_LOG_LEVEL', default='WARNING')},
+    },
+}
+
+# Сэмплирование частых событий и размер буфера захвата (investments/structured_logging.py)
+INVESTMENTS_LOGGING = {
+    'DEFAULT_SAMPLE_RATE': 1.0,
+    'SAMPLING': {
+        'xirr.solved': 0.01,
+        'xirr.skipped': 0.01,
+        'cash_flows.nav_added': 0.01,
+        'mirr.calculated': 0.05,
+    },
+    'CAPTURE_SIZE': 1000,
+}
+
 ROOT_URLCONF = 'urls'
 
 TEMPLATES = [
@@ -96,6 +155,15 @@ DATABASES = {
     }
 }
 
+# Cache: файловый бэкенд, общий для всех процессов (cron-запуски check_alerts и т.п.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / 'cache')),
+        'TIMEOUT': 3600,
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -162,4 +230,80 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:8000",
     "http://localhost:8001",
     "http://127.0.0.1:8001",
-]
\ No newline at end of file
+]
+# Email: для локальной проверки уведомлений подходят
+# django.core.mail.backends.filebased.EmailBackend и locmem.EmailBackend
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='alerts@localhost')
+SITE_URL = config('SITE_URL', default='http://localhost:8000')
+
+# Очередь уведомлений (investments.notifications)
+NOTIFICATIONS = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 60,
+    'BACKOFF_MAX': 3600,
+    'CLAIM_TTL': 300,
+}
+
+# Пользовательские условия AlertRule (investments.rule_engine)
+ALERT_RULES = {
+    'STEP_BUDGET': 1000,
+    'CACHE_SIZE': 512,
+}
+
+# История метрик проектов (investments.metric_history)
+METRIC_HISTORY = {
+    'WEEKLY_AFTER_DAYS': 90,
+    'MONTHLY_AFTER_DAYS': 365,
+}
+
+# Проверка алертов при записи транзакций (investments.alerts_events);
+# работает только в процессе веб-сервера (tracker/wsgi.py, tracker/asgi.py)
+ALERT_EVENTS = {
+    'ENABLED': True,
+    'DEBOUNCE_SECONDS': 2.0,
+}
+
+# Подавление штормов алертов (investments.alerts_storm)
+ALERT_STORMS = {
+    'BUCKET_CAPACITY': 3,
+    'REFILL_PER_HOUR': 1.0,
+    'GROUP_WINDOW_HOURS': 24,
+}
+
+# Архивация старых алертов (investments.alerts_retention)
+ALERT_RETENTION = {
+    'DAYS': 180,
+    'CHUNK_SIZE': 500,
+}
+
+# Портфельные проверки алертов (investments.alerts_portfolio)
+ALERT_PORTFOLIO = {
+    'NO_UPDATE_DAYS': {'MEDIUM': 90, 'HIGH': 180},
+    'MAX_HHI': 0.25,
+    'MAX_POSITION_SHARE': 0.4,
+    'MIN_POSITIONS': 3,
+    'SHARPE_WINDOW': 4,
+    'SHARPE_MIN_DROP': 0.5,
+    'TARGET_HORIZON_YEARS': 7,
+    'TARGET_MISS_MARGIN': {'MEDIUM': 0.03, 'HIGH': 0.10},
+}
+
+# Эскалация алертов по SLA (investments.alerts_escalation)
+ALERT_SLA = {
+    'SLA_MINUTES': {
+        'CRITICAL': 60,
+        'HIGH': 4 * 60,
+        'MEDIUM': 24 * 60,
+        'LOW': 3 * 24 * 60,
+        'INFO': None,
+    },
+    'INTERVAL_MINUTES': 5,
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tracker.settings')
 
 application = get_wsgi_application()
+
+# Фоновые проверки алертов по записям транзакций - только в процессе веб-сервера
+from investments.alerts_events import enable_for_process  # noqa: E402
+
+enable_for_process()